@@ -0,0 +1,221 @@
+"""Cold-start benchmark: how long a fresh worker takes to serve its first /gmail/emails.
+
+Every run starts a new interpreter that reports, separately:
+
+- import_ms: `import main`
+- startup_ms: schema bootstrap and warm-up (what the lifespan does before /ready succeeds),
+  against the in-memory database
+- first_emails_ms: the first successful GET /gmail/emails (client build, token, listing)
+- process_ms: wall time from spawning the interpreter to that first success, less the
+  harness's own setup (seeding the database)
+
+The fake Gmail and OAuth server runs in this (parent) process so its own imports are not
+counted. A run also fails if `import main` loaded one of HEAVY_MODULES, which the service
+imports lazily. With a baseline file present the run fails (exit status 1) if a median
+regresses by more than `--tolerance`.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --importtime 15    # also list the slowest imports of main
+    python -m benchmarks.cold_start --save-baseline    # record benchmarks/cold_start_baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks import env
+
+HOST = "127.0.0.1"
+GMAIL_PORT = 8094
+DEFAULT_BASELINE = Path(__file__).with_name("cold_start_baseline.json")
+ROOT = Path(__file__).resolve().parent.parent
+METRICS = ("import_ms", "startup_ms", "first_emails_ms", "process_ms")
+# deferred to first use (or warm-up); importing any of them from `main` is a cold-start regression
+HEAVY_MODULES = ("googleapiclient.discovery", "google_auth_oauthlib.flow", "google.oauth2.credentials",
+                 "motor", "pymongo", "httpx")
+
+
+async def _child_run(args, imported_at: float, import_ms: float, heavy: List[str]) -> Dict[str, Any]:
+    import main as service
+    from benchmarks.fake_mongo import FakeDatabase
+    from benchmarks.fake_oauth import FakeOAuth
+    from benchmarks.load import _seed
+    from db.migrations import bootstrap_schema
+    from dependencies.db import get_db
+    from tools.warmup import warm_up
+
+    import httpx
+
+    db = FakeDatabase()
+    await _seed(db, 1, FakeOAuth(scope=os.environ["GMAIL_SCOPES"]), args.gmail_root + "token")
+
+    async def _fake_db():
+        yield db
+
+    service.app.dependency_overrides[get_db] = _fake_db
+
+    started = time.perf_counter()
+    await bootstrap_schema(db)
+    service.app.state.warmup = await warm_up(db)
+    service.app.state.ready = True
+    startup_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60.0) as client:
+        for _ in range(args.attempts):
+            response = await client.get("/gmail/emails?user_id=bench-0&max_results=10")
+            if response.status_code == 200:
+                break
+        else:
+            raise RuntimeError(f"/gmail/emails failed: {response.status_code} {response.text[:200]}")
+    first_emails_ms = (time.perf_counter() - started) * 1000
+
+    return {"import_ms": import_ms, "startup_ms": startup_ms, "first_emails_ms": first_emails_ms,
+            "heavy_modules": heavy, "warmup": service.app.state.warmup,
+            "ready_at": imported_at + (startup_ms + first_emails_ms) / 1000}
+
+
+def child(args) -> None:
+    """Runs in the fresh interpreter: time `import main`, then start up and serve one request."""
+    started = time.perf_counter()
+    import main  # noqa: F401
+
+    import_ms = (time.perf_counter() - started) * 1000
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    result = asyncio.run(_child_run(args, time.time(), import_ms, heavy))
+    print(json.dumps(result))
+
+
+def _spawn(args, importtime: bool = False) -> Dict[str, Any]:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-m", "benchmarks.cold_start", "--child", "--gmail-root", args.gmail_root]
+    spawned = time.time()
+    proc = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        raise RuntimeError(f"cold start run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (result.pop("ready_at") - spawned) * 1000
+    result["stderr"] = proc.stderr
+    return result
+
+
+def slowest_imports(importtime_log: str, top: int) -> List[str]:
+    """The `top` modules with the largest cumulative import time within `import main`."""
+    rows: List[Any] = []
+    pending: List[Any] = []
+    # -X importtime lists a module after everything it imported; top-level imports are unindented
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        pending.append((int(cumulative), name.rstrip()))
+        if not name.startswith("  "):
+            if name.strip() == "main":
+                rows = pending
+            pending = []
+    lines = []
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        lines.append(f"{cumulative / 1000:>9.1f} ms  {name}")
+    return lines
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Return a description of every median regression of `results` against `baseline`."""
+    return [f"{name}: {results[name]:.1f} ms vs baseline {baseline[name]:.1f} ms"
+            for name in METRICS if name in baseline and results[name] > baseline[name] * (1 + tolerance)]
+
+
+def main(args) -> int:
+    args.gmail_root = f"http://{HOST}:{args.gmail_port}/"
+    workdir = tempfile.mkdtemp(prefix="gmail-cold-start-")
+    env.configure(
+        args.gmail_root,
+        CLIENT_SECRETS_FILE=os.path.join(workdir, "client_secrets.json"),
+        GOOGLE_OAUTH2_CERTS_URL=args.gmail_root + "oauth2/v1/certs",
+        GMAIL_ATTACHMENT_CACHE_DIR=os.path.join(workdir, "attachments"),
+        GMAIL_BACKEND=args.backend,
+        GMAIL_SCHEDULER_ENABLED="false",
+        OAUTHLIB_INSECURE_TRANSPORT="1",
+    )
+
+    from benchmarks.fake_gmail import FakeGmailConfig, create_app
+    from benchmarks.fake_oauth import FakeOAuth
+    from benchmarks.load import ServerThread
+
+    oauth = FakeOAuth(scope=os.environ["GMAIL_SCOPES"])
+    oauth.write_client_secrets(os.environ["CLIENT_SECRETS_FILE"], args.gmail_root, os.environ["GMAIL_REDIRECT_URI"])
+    gmail_server = ServerThread(create_app(FakeGmailConfig(messages=200, latency_ms=args.gmail_latency_ms),
+                                           oauth=oauth), args.gmail_port)
+    gmail_server.start()
+    try:
+        runs = [_spawn(args) for _ in range(args.runs)]
+        profile = _spawn(args, importtime=True) if args.importtime else None
+    finally:
+        gmail_server.stop()
+
+    medians = {name: statistics.median(run[name] for run in runs) for name in METRICS}
+    print(f"{'metric':<18}{'median':>10}{'min':>10}{'max':>10}")
+    for name in METRICS:
+        values = [run[name] for run in runs]
+        print(f"{name:<18}{medians[name]:>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    print(f"warm-up steps (ms, last run): {runs[-1]['warmup']}")
+    if profile is not None:
+        print(f"slowest imports (cumulative, {args.backend} backend):")
+        print("\n".join(slowest_imports(profile["stderr"], args.importtime)))
+
+    failed = False
+    heavy = sorted({name for run in runs for name in run["heavy_modules"]})
+    if heavy:
+        print(f"REGRESSION `import main` loaded deferred modules: {', '.join(heavy)}")
+        failed = True
+    if args.output:
+        Path(args.output).write_text(json.dumps(medians, indent=2))
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(medians, indent=2))
+        print(f"baseline written to {baseline_path}")
+        return int(failed)
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; skipping regression check")
+        return int(failed)
+    regressions = compare(medians, json.loads(baseline_path.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions or failed else 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Measure cold start of main:app against local fake backends")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=("googleapiclient", "httpx"), default="googleapiclient")
+    parser.add_argument("--gmail-latency-ms", type=float, default=0.0)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="profile one more run with -X importtime and list its N slowest imports")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--output", help="also write the medians as JSON to this path")
+    parser.add_argument("--gmail-port", type=int, default=GMAIL_PORT)
+    # internal: run as the measured child process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--gmail-root", help=argparse.SUPPRESS)
+    parser.add_argument("--attempts", type=int, default=3, help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    parsed = _parser().parse_args()
+    if parsed.child:
+        child(parsed)
+    else:
+        raise SystemExit(main(parsed))
@@ -0,0 +1,107 @@
+"""Compare the googleapiclient (threaded) and httpx (asyncio) Gmail backends.
+
+Boots the fake Gmail server in-process and runs the `/gmail/emails` call pattern
+(messages.list followed by the metadata fetch) with increasing concurrency against both
+backends, reporting throughput, latency percentiles and failed calls. Any failure makes the
+run exit with status 1, since timings of error responses are not comparable.
+
+    python -m benchmarks.compare_backends --concurrency 1 8 32 --max-results 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks import env
+
+PORT = 8091
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def _run(client, concurrency: int, requests: int, max_results: int) -> Dict[str, float]:
+    from routes.gmail.errors import GmailApiError
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def _worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                listing = await client.list_messages(maxResults=max_results)
+                ids = [m['id'] for m in listing.get('messages', [])]
+                # failed sub-requests come back as GmailApiError items, not exceptions
+                items = await client.get_messages(ids, format='metadata', metadataHeaders=['From', 'Subject', 'Date'])
+                errors += any(isinstance(item, GmailApiError) for item in items)
+            except GmailApiError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": len(latencies) / elapsed,
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+async def main(args) -> int:
+    env.configure(f"http://127.0.0.1:{args.port}/")
+
+    import uvicorn
+    from google.oauth2.credentials import Credentials
+    from benchmarks.fake_gmail import FakeGmailConfig, create_app
+    from routes.gmail.async_client import AsyncGmailClient, close_http_client
+    from routes.gmail.threaded_client import ThreadedGmailClient
+    from tools.google_api import build_gmail_service
+
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(FakeGmailConfig(latency_ms=args.latency_ms)), host="127.0.0.1", port=args.port, log_level="warning"
+    ))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    creds = Credentials(token="fake-token")
+    backends = {
+        "googleapiclient": ThreadedGmailClient(build_gmail_service(creds)),
+        "httpx": AsyncGmailClient(creds),
+    }
+    failed = 0
+    try:
+        print(f"{'backend':<16}{'conc':>6}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for concurrency in args.concurrency:
+            for name, client in backends.items():
+                result = await _run(client, concurrency, args.requests, args.max_results)
+                failed += result['errors']
+                print(f"{name:<16}{concurrency:>6}{result['rps']:>10.1f}{result['errors']:>8}"
+                      f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    finally:
+        await close_http_client()
+        server.should_exit = True
+        await server_task
+    if failed:
+        print(f"{failed} calls failed; the timings above include error responses", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Gmail client backends against the fake Gmail server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--max-results", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=PORT)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
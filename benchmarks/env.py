@@ -0,0 +1,22 @@
+"""Environment defaults for running the service against local fakes.
+
+Must be applied before `config.settings` is imported, since settings are read at import time.
+"""
+import os
+from typing import Optional
+
+
+def configure(gmail_api_root: Optional[str] = None, **overrides: str) -> None:
+    defaults = {
+        "CLIENT_SECRETS_FILE": "client_secrets.json",
+        "GMAIL_REDIRECT_URI": "http://localhost:8000/gmail/callback",
+        "GMAIL_SCOPES": "https://www.googleapis.com/auth/gmail.readonly",
+        "GOOGLE_REDIRECT_URI": "http://localhost:8000/google/callback",
+        "GOOGLE_SCOPES": "openid email profile",
+        "FRONT_URL": "localhost",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    if gmail_api_root:
+        os.environ["GMAIL_API_ROOT"] = gmail_api_root
+    os.environ.update(overrides)
@@ -0,0 +1,328 @@
+"""Local fake Gmail API server for benchmarks.
+
+Serves the subset of the Gmail v1 REST API used by the service (messages list/get,
+attachments, history, batchModify, batchDelete, profile, watch/stop and the `/batch` or
+`/batch/gmail/v1` multipart endpoint) from a deterministic in-memory mailbox, with optional
+latency and error injection.
+
+Run standalone with `python -m benchmarks.fake_gmail --port 8081`, then point the service at
+it with `GMAIL_API_ROOT=http://127.0.0.1:8081/`.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+# googleapiclient posts to the discovery document's batchPath ("batch"); older clients use the
+# per-API endpoint
+BATCH_PATHS = ("/batch", "/batch/gmail/v1")
+
+
+@dataclass
+class FakeGmailConfig:
+    messages: int = 1000
+    latency_ms: float = 20.0  # added to every HTTP call (a batch call counts once)
+    error_rate: float = 0.0  # fraction of calls answered with a retryable error
+    error_status: int = 429
+    attachment_every: int = 5  # every Nth message carries a PDF attachment
+    attachment_size: int = 256 * 1024
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+@dataclass
+class FakeMailbox:
+    config: FakeGmailConfig
+    labels: Dict[str, List[str]] = field(default_factory=dict)
+    history_id: int = 1000
+    history: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __post_init__(self):
+        for index in range(self.config.messages):
+            self.labels[self.message_id(index)] = ['INBOX'] + (['UNREAD'] if index % 3 == 0 else [])
+
+    @staticmethod
+    def message_id(index: int) -> str:
+        return f"{index:016x}"
+
+    def ids(self) -> List[str]:
+        # newest first, like Gmail
+        return sorted(self.labels, reverse=True)
+
+    def list(self, max_results: int = 100, page_token: Optional[str] = None, q: str = "",
+             label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        ids = self.ids()
+        if label_ids:
+            ids = [i for i in ids if set(label_ids) <= set(self.labels[i])]
+        if q:
+            ids = [i for i in ids if q.lower() in self._subject(i).lower() or q.lower() in self._sender(i).lower()]
+        start = int(page_token or 0)
+        page = ids[start:start + max_results]
+        result: Dict[str, Any] = {
+            "messages": [{"id": i, "threadId": i} for i in page],
+            "resultSizeEstimate": len(ids),
+        }
+        if start + max_results < len(ids):
+            result["nextPageToken"] = str(start + max_results)
+        return result
+
+    def _index(self, message_id: str) -> int:
+        return int(message_id, 16)
+
+    def _sender(self, message_id: str) -> str:
+        return f"Sender {self._index(message_id) % 50} <sender{self._index(message_id) % 50}@example.com>"
+
+    def _subject(self, message_id: str) -> str:
+        return f"Report {self._index(message_id)} for project {self._index(message_id) % 17}"
+
+    def _headers(self, message_id: str) -> List[Dict[str, str]]:
+        return [
+            {"name": "From", "value": self._sender(message_id)},
+            {"name": "To", "value": "me@example.com"},
+            {"name": "Subject", "value": self._subject(message_id)},
+            {"name": "Date", "value": "Mon, 6 Oct 2025 09:00:00 +0000"},
+        ]
+
+    def _has_attachment(self, message_id: str) -> bool:
+        return self._index(message_id) % self.config.attachment_every == 0
+
+    def attachment_bytes(self, message_id: str) -> bytes:
+        seed = message_id.encode()
+        return (b"%PDF-1.4\n" + seed * (self.config.attachment_size // len(seed)))[:self.config.attachment_size]
+
+    def get(self, message_id: str, fmt: str = "full", metadata_headers: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        if message_id not in self.labels:
+            return None
+        text = f"Hello,\n\nThis is message {self._index(message_id)}.\n"
+        html = f"<html><body><p>Hello,</p><p>This is message <b>{self._index(message_id)}</b>.</p></body></html>"
+        message: Dict[str, Any] = {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": list(self.labels[message_id]),
+            "snippet": text.strip()[:100],
+            "historyId": str(self.history_id),
+            "internalDate": str(1759741200000 + self._index(message_id) * 1000),
+            "sizeEstimate": len(text) + len(html),
+        }
+        headers = self._headers(message_id)
+        if fmt == "minimal":
+            return message
+        if fmt == "metadata":
+            wanted = set(metadata_headers or [])
+            message["payload"] = {"headers": [h for h in headers if not wanted or h["name"] in wanted]}
+            return message
+        if fmt == "raw":
+            raw = "\r\n".join(f"{h['name']}: {h['value']}" for h in headers)
+            raw += "\r\nMIME-Version: 1.0\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n" + text
+            message["raw"] = _b64(raw.encode())
+            return message
+
+        parts = [{
+            "partId": "0", "mimeType": "multipart/alternative", "filename": "", "headers": [],
+            "body": {"size": 0},
+            "parts": [
+                {"partId": "0.0", "mimeType": "text/plain", "filename": "",
+                 "headers": [{"name": "Content-Type", "value": "text/plain; charset=utf-8"}],
+                 "body": {"size": len(text), "data": _b64(text.encode())}},
+                {"partId": "0.1", "mimeType": "text/html", "filename": "",
+                 "headers": [{"name": "Content-Type", "value": "text/html; charset=utf-8"}],
+                 "body": {"size": len(html), "data": _b64(html.encode())}},
+            ],
+        }]
+        if self._has_attachment(message_id):
+            parts.append({
+                "partId": "1", "mimeType": "application/pdf", "filename": f"report-{self._index(message_id)}.pdf",
+                "headers": [{"name": "Content-Disposition", "value": "attachment"}],
+                "body": {"size": self.config.attachment_size, "attachmentId": f"att-{message_id}"},
+            })
+        message["payload"] = {"partId": "", "mimeType": "multipart/mixed", "filename": "", "headers": headers,
+                              "body": {"size": 0}, "parts": parts}
+        return message
+
+    def attachment(self, message_id: str, attachment_id: str) -> Optional[Dict[str, Any]]:
+        if message_id not in self.labels or attachment_id != f"att-{message_id}":
+            return None
+        data = self.attachment_bytes(message_id)
+        return {"size": len(data), "data": _b64(data)}
+
+    def modify(self, ids: List[str], add: List[str], remove: List[str]) -> None:
+        for message_id in ids:
+            if message_id not in self.labels:
+                continue
+            labels = [label for label in self.labels[message_id] if label not in remove]
+            labels += [label for label in add if label not in labels]
+            self.labels[message_id] = labels
+            self.history_id += 1
+            record: Dict[str, Any] = {"id": str(self.history_id)}
+            message = {"id": message_id, "threadId": message_id, "labelIds": labels}
+            if add:
+                record["labelsAdded"] = [{"message": message, "labelIds": add}]
+            if remove:
+                record["labelsRemoved"] = [{"message": message, "labelIds": remove}]
+            self.history.append(record)
+
+    def delete(self, ids: List[str]) -> None:
+        for message_id in ids:
+            if self.labels.pop(message_id, None) is None:
+                continue
+            self.history_id += 1
+            self.history.append({"id": str(self.history_id), "messagesDeleted": [
+                {"message": {"id": message_id, "threadId": message_id}}
+            ]})
+
+    def deliver(self) -> str:
+        """Add a new message to the mailbox and record it in the history."""
+        message_id = self.message_id(len(self.labels) + 1)
+        self.labels[message_id] = ['INBOX', 'UNREAD']
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), "messagesAdded": [
+            {"message": {"id": message_id, "threadId": message_id, "labelIds": ['INBOX', 'UNREAD']}}
+        ]})
+        return message_id
+
+    def list_history(self, start_history_id: int, max_results: int = 100) -> Optional[Dict[str, Any]]:
+        if self.history and start_history_id < int(self.history[0]["id"]) - 1:
+            return None
+        records = [h for h in self.history if int(h["id"]) > start_history_id][:max_results]
+        return {"history": records, "historyId": str(self.history_id)}
+
+    def profile(self) -> Dict[str, Any]:
+        return {"emailAddress": "me@example.com", "messagesTotal": len(self.labels),
+                "threadsTotal": len(self.labels), "historyId": str(self.history_id)}
+
+
+def _error(status: int, reason: str, message: str) -> Tuple[int, Dict[str, Any]]:
+    return status, {"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}}
+
+
+def create_app(config: Optional[FakeGmailConfig] = None, oauth=None) -> FastAPI:
+    """Build the fake server; pass a `benchmarks.fake_oauth.FakeOAuth` to also serve the token
+    endpoint and id_token certificates."""
+    config = config or FakeGmailConfig()
+    mailbox = FakeMailbox(config)
+    app = FastAPI(title="fake-gmail")
+    if oauth is not None:
+        oauth.install(app)
+    app.state.mailbox = mailbox
+    app.state.stats = {"calls": 0, "sub_requests": 0}
+
+    def dispatch(method: str, path: str, query: Dict[str, List[str]], body: Optional[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+        app.state.stats["sub_requests"] += 1
+        if config.error_rate and random.random() < config.error_rate:
+            return _error(config.error_status, "rateLimitExceeded", "Injected error")
+
+        prefix = "/gmail/v1/users/me/"
+        if not path.startswith(prefix):
+            return _error(404, "notFound", "Unknown path")
+        parts = path[len(prefix):].strip('/').split('/')
+        first = lambda key, default=None: (query.get(key) or [default])[0]
+
+        if parts == ["messages"] and method == "GET":
+            return 200, mailbox.list(int(first("maxResults", 100)), first("pageToken"), first("q", ""),
+                                     query.get("labelIds"))
+        if parts == ["messages", "batchModify"] and method == "POST":
+            mailbox.modify(body.get("ids", []), body.get("addLabelIds", []), body.get("removeLabelIds", []))
+            return 204, {}
+        if parts == ["messages", "batchDelete"] and method == "POST":
+            mailbox.delete(body.get("ids", []))
+            return 204, {}
+        if len(parts) == 2 and parts[0] == "messages" and method == "GET":
+            message = mailbox.get(parts[1], first("format", "full"), query.get("metadataHeaders"))
+            return (200, message) if message else _error(404, "notFound", "Requested entity was not found.")
+        if len(parts) == 4 and parts[0] == "messages" and parts[2] == "attachments":
+            attachment = mailbox.attachment(parts[1], parts[3])
+            return (200, attachment) if attachment else _error(404, "notFound", "Requested entity was not found.")
+        if parts == ["history"]:
+            history = mailbox.list_history(int(first("startHistoryId", 0)), int(first("maxResults", 100)))
+            return (200, history) if history is not None else _error(404, "notFound", "Requested entity was not found.")
+        if parts == ["profile"]:
+            return 200, mailbox.profile()
+        if parts == ["watch"] and method == "POST":
+            expiration = int((time.time() + 7 * 24 * 3600) * 1000)
+            return 200, {"historyId": str(mailbox.history_id), "expiration": str(expiration)}
+        if parts == ["stop"] and method == "POST":
+            return 204, {}
+        return _error(404, "notFound", "Unknown path")
+
+    async def _delay():
+        app.state.stats["calls"] += 1
+        if config.latency_ms:
+            await asyncio.sleep(config.latency_ms / 1000.0)
+
+    @app.api_route("/gmail/v1/users/me/{rest:path}", methods=["GET", "POST"])
+    async def gmail(rest: str, request: Request):
+        await _delay()
+        raw = await request.body()
+        body = json.loads(raw) if raw else {}
+        query = parse_qs(request.url.query)
+        status, payload = dispatch(request.method, request.url.path, query, body)
+        if status == 204:
+            return Response(status_code=204)
+        return JSONResponse(payload, status_code=status)
+
+    async def batch(request: Request):
+        await _delay()
+        content_type = request.headers["content-type"]
+        raw = await request.body()
+        envelope = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + raw)
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for part in envelope.get_payload():
+            content_id = part["Content-ID"].strip("<>")
+            http_request = part.get_payload()
+            head, _, sub_body = http_request.partition("\r\n\r\n") if "\r\n\r\n" in http_request else http_request.partition("\n\n")
+            method, url = head.splitlines()[0].split(" ")[:2]
+            split = urlsplit(url)
+            status, payload = dispatch(method, split.path, parse_qs(split.query),
+                                       json.loads(sub_body) if sub_body.strip() else None)
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return Response("".join(chunks), media_type=f"multipart/mixed; boundary={boundary}")
+
+    for path in BATCH_PATHS:
+        app.add_api_route(path, batch, methods=["POST"])
+
+    @app.post("/_fake/deliver")
+    async def deliver():
+        return {"id": mailbox.deliver(), "historyId": str(mailbox.history_id)}
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--messages", type=int, default=FakeGmailConfig.messages)
+    parser.add_argument("--latency-ms", type=float, default=FakeGmailConfig.latency_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeGmailConfig.error_rate)
+    args = parser.parse_args()
+    config = FakeGmailConfig(messages=args.messages, latency_ms=args.latency_ms, error_rate=args.error_rate)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""In-memory stand-in for the Motor database used by GmailRepo.
+
+Implements only the collection operations the repositories use, with Mongo's matching
+semantics for the operators involved, and optional per-operation latency. Install it by
+overriding `dependencies.db.get_db`.
+"""
+import asyncio
+import copy
+import itertools
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+_MISSING = object()
+
+
+@dataclass
+class _Result:
+    matched_count: int = 0
+    modified_count: int = 0
+    deleted_count: int = 0
+    upserted_id: Any = None
+
+
+def _get(doc: Dict[str, Any], key: str) -> Any:
+    value: Any = doc
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _values(value: Any) -> List[Any]:
+    # array fields match if any element matches
+    return value if isinstance(value, list) else [value]
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == "$in":
+                if value is _MISSING or not any(v in arg for v in _values(value)):
+                    return False
+            elif op == "$nin":
+                if value is not _MISSING and any(v in arg for v in _values(value)):
+                    return False
+            elif op == "$all":
+                if value is _MISSING or not all(a in _values(value) for a in arg):
+                    return False
+            elif op == "$ne":
+                if value is not _MISSING and arg in _values(value):
+                    return False
+            elif op == "$regex":
+                pattern = re.compile(arg)
+                if value is _MISSING or not any(isinstance(v, str) and pattern.search(v) for v in _values(value)):
+                    return False
+            elif op in ("$lt", "$lte", "$gt", "$gte"):
+                compare = {"$lt": lambda a: a < arg, "$lte": lambda a: a <= arg,
+                           "$gt": lambda a: a > arg, "$gte": lambda a: a >= arg}[op]
+                if value is _MISSING or value is None or not any(compare(v) for v in _values(value)):
+                    return False
+            else:
+                raise NotImplementedError(f"fake_mongo does not support {op}")
+        return True
+    if value is _MISSING:
+        return condition is None
+    return value == condition or (isinstance(value, list) and condition in value)
+
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif not _match_condition(_get(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result = {k: doc[k] for k in fields if k in doc}
+    else:
+        result = {k: v for k, v in doc.items() if fields.get(k, 1)}
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    else:
+        result.pop("_id", None)
+    return result
+
+
+def _evaluate(doc: Dict[str, Any], expression: Any) -> Any:
+    # the aggregation expressions the repositories use
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict) and len(expression) == 1:
+        (op, args), = expression.items()
+        if op == "$size":
+            return len(_evaluate(doc, args))
+        if op == "$setIntersection":
+            first, *rest = [_evaluate(doc, arg) or [] for arg in args]
+            return [v for v in dict.fromkeys(first) if all(v in other for other in rest)]
+        if op == "$ifNull":
+            for arg in args:
+                value = _evaluate(doc, arg)
+                if value is not None:
+                    return value
+            return None
+        raise NotImplementedError(f"fake_mongo does not support {op}")
+    return expression
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict[str, Any]], projection: Optional[Dict[str, Any]], latency: float):
+        self._docs = docs
+        self._projection = projection
+        self._latency = latency
+        self._limit = 0
+
+    def sort(self, key: str, direction: int = 1) -> "FakeCursor":
+        # missing and null sort lowest, as in Mongo
+        def _key(doc):
+            value = _get(doc, key)
+            return (0, 0) if value is _MISSING or value is None else (1, value)
+
+        self._docs.sort(key=_key, reverse=direction < 0)
+        return self
+
+    def limit(self, limit: int) -> "FakeCursor":
+        self._limit = limit
+        return self
+
+    def batch_size(self, _: int) -> "FakeCursor":
+        return self
+
+    async def __aiter__(self):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        for doc in docs:
+            yield project(doc, self._projection)
+
+
+class FakeCollection:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self._latency = latency
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._by_user: Dict[Any, set] = {}
+        self._ids = itertools.count(1)
+
+    async def _delay(self) -> None:
+        if self._latency:
+            await asyncio.sleep(self._latency)
+
+    def _candidates(self, query: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        user_id = query.get("user_id")
+        if isinstance(user_id, str):
+            ids = self._by_user.get(user_id, ())
+            return [self._docs[i] for i in ids]
+        return list(self._docs.values())
+
+    def _find(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [d for d in self._candidates(query) if matches(d, query)]
+
+    def _insert(self, doc: Dict[str, Any]) -> int:
+        doc_id = next(self._ids)
+        doc["_id"] = doc_id
+        self._docs[doc_id] = doc
+        self._by_user.setdefault(doc.get("user_id"), set()).add(doc_id)
+        return doc_id
+
+    def _remove(self, doc: Dict[str, Any]) -> None:
+        del self._docs[doc["_id"]]
+        self._by_user.get(doc.get("user_id"), set()).discard(doc["_id"])
+
+    @staticmethod
+    def _apply(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> bool:
+        before = copy.deepcopy(doc)
+        for key, value in update.get("$set", {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        if inserting:
+            for key, value in update.get("$setOnInsert", {}).items():
+                doc[key] = copy.deepcopy(value)
+        return doc != before
+
+    def _update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool) -> _Result:
+        found = self._find(query)
+        if found:
+            return _Result(matched_count=1, modified_count=int(self._apply(found[0], update, False)))
+        if not upsert:
+            return _Result()
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        self._apply(doc, update, True)
+        return _Result(upserted_id=self._insert(doc))
+
+    async def create_index(self, keys, **options) -> str:
+        return "_".join(f"{k}_{d}" for k, d in (keys if isinstance(keys, list) else [(keys, 1)]))
+
+    async def estimated_document_count(self) -> int:
+        return len(self._docs)
+
+    async def count_documents(self, query: Dict[str, Any]) -> int:
+        await self._delay()
+        return len(self._find(query))
+
+    async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None):
+        await self._delay()
+        found = self._find(query)
+        return project(found[0], projection) if found else None
+
+    def find(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> FakeCursor:
+        return FakeCursor(self._find(query), projection, self._latency)
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> _Result:
+        await self._delay()
+        return self._update_one(query, update, upsert)
+
+    async def delete_one(self, query: Dict[str, Any]) -> _Result:
+        await self._delay()
+        found = self._find(query)
+        if found:
+            self._remove(found[0])
+        return _Result(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query: Dict[str, Any]) -> _Result:
+        await self._delay()
+        found = self._find(query)
+        for doc in found:
+            self._remove(doc)
+        return _Result(deleted_count=len(found))
+
+    async def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any],
+                                  projection: Optional[Dict[str, Any]] = None, sort=None, upsert: bool = False,
+                                  return_document: bool = False):
+        # return_document follows pymongo's ReturnDocument (False = BEFORE, True = AFTER)
+        await self._delay()
+        cursor = FakeCursor(self._find(query), None, 0.0)
+        for key, direction in reversed(sort or []):
+            cursor.sort(key, direction)
+        found = cursor._docs
+        if not found:
+            if not upsert:
+                return None
+            self._update_one(query, update, True)
+            return project(self._find(query)[0], projection) if return_document else None
+        before = copy.deepcopy(found[0])
+        self._apply(found[0], update, False)
+        return project(found[0] if return_document else before, projection)
+
+    async def find_one_and_delete(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None):
+        await self._delay()
+        found = self._find(query)
+        if not found:
+            return None
+        self._remove(found[0])
+        return project(found[0], projection)
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> FakeCursor:
+        docs: Optional[List[Dict[str, Any]]] = None
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = self._find(arg) if docs is None else [d for d in docs if matches(d, arg)]
+                docs = [copy.deepcopy(d) for d in docs]
+                continue
+            if docs is None:
+                docs = [copy.deepcopy(d) for d in self._docs.values()]
+            if op == "$addFields":
+                for doc in docs:
+                    doc.update({key: _evaluate(doc, expression) for key, expression in arg.items()})
+            elif op == "$sort":
+                cursor = FakeCursor(docs, None, 0.0)
+                for key, direction in reversed(list(arg.items())):
+                    cursor.sort(key, direction)
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$project":
+                docs = [project(doc, arg) for doc in docs]
+            else:
+                raise NotImplementedError(f"fake_mongo does not support {op}")
+        return FakeCursor(docs or [], None, self._latency)
+
+    async def bulk_write(self, requests, ordered: bool = True) -> _Result:
+        # accepts pymongo UpdateOne operations
+        await self._delay()
+        result = _Result()
+        for op in requests:
+            r = self._update_one(op._filter, op._doc, op._upsert)
+            result.matched_count += r.matched_count
+            result.modified_count += r.modified_count
+        return result
+
+
+class FakeDatabase:
+    def __init__(self, latency_ms: float = 0.0):
+        self._latency = latency_ms / 1000.0
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def get_collection(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self._latency)
+        return self._collections[name]
+
+    __getitem__ = get_collection
+
+    async def command(self, name: str, *args, **kwargs) -> Dict[str, Any]:
+        return {"ok": 1.0}
@@ -0,0 +1,99 @@
+"""Local stand-in for Google's OAuth token endpoint and id_token signing certificates.
+
+Issues RS256-signed id_tokens from a throwaway key so the real `/gmail/callback` path (code
+exchange, certificate fetch, id_token verification) runs unmodified against the fakes. Every
+authorization code maps to its own user, `fake-<code>`.
+"""
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+from urllib.parse import parse_qs
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from google.auth import crypt, jwt
+
+TOKEN_PATH = "/token"
+CERTS_PATH = "/oauth2/v1/certs"
+
+
+class FakeOAuth:
+    def __init__(self, client_id: str = "fake-client.apps.googleusercontent.com",
+                 client_secret: str = "fake-secret", scope: str = "", certs_max_age: int = 3600):
+        self.client_id = client_id
+        self.scope = scope
+        self.client_secret = client_secret
+        self.certs_max_age = certs_max_age
+        self.key_id = uuid.uuid4().hex
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-google-oauth")])
+        now = datetime.now(timezone.utc)
+        cert = (x509.CertificateBuilder()
+                .subject_name(name).issuer_name(name).public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=30))
+                .sign(key, hashes.SHA256()))
+        self.certificate = cert.public_bytes(serialization.Encoding.PEM).decode()
+        private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                        serialization.NoEncryption())
+        self._signer = crypt.RSASigner.from_string(private_pem, key_id=self.key_id)
+        self.stats = {"token_requests": 0, "certs_requests": 0}
+
+    def client_secrets(self, base_url: str, redirect_uri: str) -> Dict[str, Any]:
+        """A client secrets document whose token endpoint is this fake."""
+        return {"web": {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "auth_uri": base_url.rstrip("/") + "/o/oauth2/auth",
+            "token_uri": base_url.rstrip("/") + TOKEN_PATH,
+            "redirect_uris": [redirect_uri],
+        }}
+
+    def id_token(self, code: str) -> str:
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": self.client_id,
+            "sub": f"fake-{code}",
+            "email": f"{code}@example.com",
+            "email_verified": True,
+            "iat": now,
+            "exp": now + 3600,
+        }
+        return jwt.encode(self._signer, payload).decode()
+
+    def token_response(self, form: Dict[str, str]) -> Dict[str, Any]:
+        code = form.get("code") or uuid.uuid4().hex
+        return {
+            "access_token": f"access-{code}",
+            "refresh_token": f"refresh-{code}",
+            "expires_in": 3600,
+            "token_type": "Bearer",
+            "scope": form.get("scope") or self.scope,
+            "id_token": self.id_token(code),
+        }
+
+    def install(self, app: FastAPI) -> None:
+        """Add the token and certificate endpoints to `app`."""
+
+        @app.post(TOKEN_PATH)
+        async def token(request: Request):
+            self.stats["token_requests"] += 1
+            form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+            return JSONResponse(self.token_response(form))
+
+        @app.get(CERTS_PATH)
+        async def certs():
+            self.stats["certs_requests"] += 1
+            return JSONResponse({self.key_id: self.certificate},
+                                headers={"Cache-Control": f"public, max-age={self.certs_max_age}"})
+
+    def write_client_secrets(self, path: str, base_url: str, redirect_uri: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.client_secrets(base_url, redirect_uri), f)
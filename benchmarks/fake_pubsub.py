@@ -0,0 +1,55 @@
+"""Local stand-in for Cloud Pub/Sub push delivery.
+
+Posts Gmail-style push notifications to the service's `/gmail/push` webhook, optionally
+delivering new mail to the fake Gmail server first, so push handling, coalescing and the
+`/gmail/events` stream can be exercised without Google Cloud.
+
+    python -m benchmarks.fake_pubsub --email me@example.com --burst 20 \\
+        --deliver-url http://127.0.0.1:8081/_fake/deliver
+"""
+import argparse
+import asyncio
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+
+def push_payload(email: str, history_id: str, subscription: str = "projects/local/subscriptions/gmail") -> dict:
+    data = json.dumps({"emailAddress": email, "historyId": history_id}).encode()
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode(),
+            "messageId": uuid.uuid4().hex,
+            "publishTime": datetime.now(timezone.utc).isoformat(),
+        },
+        "subscription": subscription,
+    }
+
+
+async def main(args) -> None:
+    async with httpx.AsyncClient(timeout=10) as client:
+        history_id = args.history_id
+        for _ in range(args.burst):
+            if args.deliver_url:
+                delivered = (await client.post(args.deliver_url)).json()
+                history_id = delivered["historyId"]
+            params = {"token": args.token} if args.token else None
+            response = await client.post(args.url, json=push_payload(args.email, history_id), params=params)
+            print(f"historyId={history_id} -> {response.status_code}")
+            if args.interval:
+                await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send fake Pub/Sub push notifications to /gmail/push")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/gmail/push")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--history-id", default="1")
+    parser.add_argument("--burst", type=int, default=1, help="number of notifications to send")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between notifications")
+    parser.add_argument("--deliver-url", help="fake Gmail /_fake/deliver URL to add a message before each push")
+    parser.add_argument("--token", help="GMAIL_PUSH_VERIFICATION_TOKEN, if configured")
+    asyncio.run(main(parser.parse_args()))
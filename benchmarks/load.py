@@ -0,0 +1,243 @@
+"""Load test for `main:app` against the fake Gmail, OAuth and Mongo backends.
+
+Boots the fake Gmail server (which also serves the OAuth token endpoint and id_token
+certificates) and the real application, each in its own thread, with `get_db` overridden
+to an in-memory database seeded with `--users` authorized users. Each scenario is driven by
+`--concurrency` closed-loop clients and reports throughput, error rate and p50/p95/p99
+latency. With a baseline file present the run fails (exit status 1) if any scenario's p95
+latency or throughput regresses by more than `--tolerance`.
+
+    python -m benchmarks.load --users 50 --concurrency 16 --requests 500 \\
+        --gmail-latency-ms 20 --gmail-error-rate 0.01 --mongo-latency-ms 1
+    python -m benchmarks.load --save-baseline   # record benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from benchmarks import env
+
+HOST = "127.0.0.1"
+GMAIL_PORT = 8092
+APP_PORT = 8093
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+SCENARIOS = ("emails", "emails_mirror", "email", "search", "callback")
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class ServerThread:
+    """Runs a uvicorn server on its own event loop in a daemon thread."""
+
+    def __init__(self, app, port: int, **config: Any):
+        import uvicorn
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=port, log_level="warning", **config))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("server failed to start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def _scenario_urls(args, message_ids: List[str]) -> Dict[str, Callable[[int], str]]:
+    def user(n: int) -> str:
+        return f"bench-{n % args.users}"
+
+    return {
+        "emails": lambda n: f"/gmail/emails?user_id={user(n)}&max_results={args.max_results}",
+        "emails_mirror": lambda n: (f"/gmail/emails?user_id={user(n)}&max_results={args.max_results}"
+                                    f"&source=mirror&max_age=3600"),
+        "email": lambda n: f"/gmail/email/{random.choice(message_ids)}?user_id={user(n)}",
+        "search": lambda n: f"/gmail/search?user_id={user(n)}&q={random.choice(['report', 'project', 'sender'])}",
+        # every code is a new user, so each request runs the full exchange and a first write
+        "callback": lambda n: f"/gmail/callback?code=cb{n}-{random.getrandbits(32):x}&state=bench",
+    }
+
+
+async def _run_scenario(client: httpx.AsyncClient, url_for: Callable[[int], str], requests: int,
+                        concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def _worker():
+        nonlocal errors
+        for n in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url_for(n))
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "error_rate": errors / max(1, len(latencies)),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Return a description of every regression of `results` against `baseline`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms vs baseline {base['p95_ms']:.1f} ms")
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']:.1f} req/s vs baseline {base['rps']:.1f} req/s")
+        if result["error_rate"] > base.get("error_rate", 0.0) + tolerance / 10:
+            regressions.append(f"{name}: error rate {result['error_rate']:.2%} vs baseline {base['error_rate']:.2%}")
+    return regressions
+
+
+async def _seed(db, users: int, oauth, token_uri: str) -> None:
+    from models.user_credentials import UserCredentials
+    from routes.gmail.repo import GmailRepo
+    from tools.time_utils import utcnow
+
+    expiry = utcnow() + timedelta(days=1)
+    await GmailRepo(db=db).bulk_save_credentials({
+        f"bench-{i}": UserCredentials(token=f"access-bench-{i}", refresh_token=f"refresh-bench-{i}",
+                                      token_uri=token_uri, client_id=oauth.client_id,
+                                      scopes=os.environ["GMAIL_SCOPES"].split(), expiry=expiry)
+        for i in range(users)
+    })
+
+
+async def main(args) -> int:
+    gmail_root = f"http://{HOST}:{args.gmail_port}/"
+    workdir = tempfile.mkdtemp(prefix="gmail-bench-")
+    env.configure(
+        gmail_root,
+        CLIENT_SECRETS_FILE=os.path.join(workdir, "client_secrets.json"),
+        GOOGLE_OAUTH2_CERTS_URL=gmail_root + "oauth2/v1/certs",
+        GMAIL_ATTACHMENT_CACHE_DIR=os.path.join(workdir, "attachments"),
+        GMAIL_BACKEND=args.backend,
+        GMAIL_SCHEDULER_ENABLED="false",
+        # the fake token endpoint is plain HTTP
+        OAUTHLIB_INSECURE_TRANSPORT="1",
+        OAUTHLIB_RELAX_TOKEN_SCOPE="1",
+    )
+
+    from benchmarks.fake_gmail import FakeGmailConfig, create_app
+    from benchmarks.fake_mongo import FakeDatabase
+    from benchmarks.fake_oauth import FakeOAuth
+
+    oauth = FakeOAuth(scope=os.environ["GMAIL_SCOPES"])
+    oauth.write_client_secrets(os.environ["CLIENT_SECRETS_FILE"], gmail_root, os.environ["GMAIL_REDIRECT_URI"])
+    gmail_config = FakeGmailConfig(messages=args.messages, latency_ms=args.gmail_latency_ms,
+                                   error_rate=args.gmail_error_rate)
+    fake_gmail = create_app(gmail_config, oauth=oauth)
+
+    import main as service
+    from db.migrations import bootstrap_schema
+    from dependencies.db import get_db
+
+    db = FakeDatabase(latency_ms=args.mongo_latency_ms)
+    await bootstrap_schema(db)
+    await _seed(db, args.users, oauth, gmail_root + "token")
+
+    async def _fake_db():
+        yield db
+
+    # the lifespan would connect to the real Mongo; the harness does its setup instead
+    service.app.dependency_overrides[get_db] = _fake_db
+    gmail_server = ServerThread(fake_gmail, args.gmail_port)
+    app_server = ServerThread(service.app, args.port, lifespan="off")
+    gmail_server.start()
+    app_server.start()
+
+    message_ids = fake_gmail.state.mailbox.ids()[:args.max_results]
+    urls = _scenario_urls(args, message_ids)
+    results: Dict[str, Dict[str, float]] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{HOST}:{args.port}", limits=limits, timeout=60.0) as client:
+            for name in args.scenarios:
+                if args.warmup:
+                    await _run_scenario(client, urls[name], args.warmup, min(args.concurrency, args.warmup))
+                results[name] = await _run_scenario(client, urls[name], args.requests, args.concurrency)
+    finally:
+        app_server.stop()
+        gmail_server.stop()
+
+    print(f"{'scenario':<16}{'req/s':>10}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['rps']:>10.1f}{r['error_rate']:>9.1%}{r['p50_ms']:>10.1f}"
+              f"{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    print(f"fake gmail: {fake_gmail.state.stats}, oauth: {oauth.stats}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"baseline written to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; skipping regression check")
+        return 0
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test main:app against local fake backends")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--max-results", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=40)
+    parser.add_argument("--backend", choices=("googleapiclient", "httpx"), default="googleapiclient")
+    parser.add_argument("--gmail-latency-ms", type=float, default=20.0)
+    parser.add_argument("--gmail-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--output", help="also write the results as JSON to this path")
+    parser.add_argument("--gmail-port", type=int, default=GMAIL_PORT)
+    parser.add_argument("--port", type=int, default=APP_PORT)
+    return parser
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(_parser().parse_args())))
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from typing import List, Union
 from pydantic_settings import BaseSettings
 
@@ -13,9 +14,98 @@ class Settings(BaseSettings):
     GOOGLE_SCOPES: Union[str|List[str]] = [s for s in os.getenv("GOOGLE_SCOPES")]
     CORS_HOSTS: List[str] = ["http://localhost:8080", "http://localhost:8000"]
     FRONT_URL: str = os.getenv("FRONT_URL")
+    GOOGLE_OAUTH2_CERTS_URL: str = os.getenv("GOOGLE_OAUTH2_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+    GOOGLE_HTTP_POOL_SIZE: int = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", 10))
     # MongoDB settings for storing credentials and user info
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     MONGO_DB: str = os.getenv("MONGO_DB", "mail_automation")
+    # Motor pool per worker process; total connections = workers x MONGO_MAX_POOL_SIZE
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", 10))  # kept open (and warmed) per worker
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 0))  # 0 = no timeout
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0))  # 0 = wait indefinitely
+    # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard / python-snappy packages
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")
+    MONGO_APP_NAME: str = os.getenv("MONGO_APP_NAME", "mail-automation")
+    # "split" (gmail_credentials + gmail_user_info) or "combined" (one gmail_users document per user)
+    GMAIL_USER_LAYOUT: str = os.getenv("GMAIL_USER_LAYOUT", "split")
+    # Gmail API tuning
+    GMAIL_BACKEND: str = os.getenv("GMAIL_BACKEND", "googleapiclient")  # "googleapiclient" (threads) or "httpx" (asyncio)
+    GMAIL_API_ROOT: str = os.getenv("GMAIL_API_ROOT", "https://gmail.googleapis.com/")
+    GMAIL_HTTP_MAX_CONNECTIONS: int = int(os.getenv("GMAIL_HTTP_MAX_CONNECTIONS", 100))
+    GMAIL_HTTP_MAX_KEEPALIVE: int = int(os.getenv("GMAIL_HTTP_MAX_KEEPALIVE", 20))
+    GMAIL_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("GMAIL_HTTP_KEEPALIVE_EXPIRY", 30))
+    GMAIL_HTTP_TIMEOUT: float = float(os.getenv("GMAIL_HTTP_TIMEOUT", 30))
+    GMAIL_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("GMAIL_HTTP_CONNECT_TIMEOUT", 5))
+    GMAIL_HTTP2: bool = os.getenv("GMAIL_HTTP2", "false").lower() == "true"  # requires the h2 package
+    GMAIL_MIRROR_FULL_SYNC_LIMIT: int = int(os.getenv("GMAIL_MIRROR_FULL_SYNC_LIMIT", 10000))  # 0 = whole mailbox
+    GMAIL_MIRROR_MAX_AGE: int = int(os.getenv("GMAIL_MIRROR_MAX_AGE", 60))  # seconds before a mirror read syncs first
+    GMAIL_ATTACHMENT_CACHE_DIR: str = os.getenv(
+        "GMAIL_ATTACHMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mail_automation", "attachments"))
+    GMAIL_ATTACHMENT_CACHE_MAX_BYTES: int = int(os.getenv("GMAIL_ATTACHMENT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+    GMAIL_MESSAGE_CACHE_MAX_BYTES: int = int(os.getenv("GMAIL_MESSAGE_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+    GMAIL_MESSAGE_CACHE_PERSIST_MAX_BYTES: int = int(os.getenv("GMAIL_MESSAGE_CACHE_PERSIST_MAX_BYTES", 8 * 1024 ** 2))
+    GMAIL_MESSAGE_CACHE_CONTROL: str = os.getenv("GMAIL_MESSAGE_CACHE_CONTROL", "private, no-cache")
+    # seconds before cached labels of a message outside the mirror are re-read from Gmail
+    GMAIL_MESSAGE_LABELS_TTL: int = int(os.getenv("GMAIL_MESSAGE_LABELS_TTL", 60))
+    # Gmail push notifications (users.watch -> Pub/Sub push -> /gmail/push)
+    GMAIL_PUSH_TOPIC: str = os.getenv("GMAIL_PUSH_TOPIC", "")  # projects/<project>/topics/<topic>
+    GMAIL_PUSH_LABEL_IDS: str = os.getenv("GMAIL_PUSH_LABEL_IDS", "INBOX")  # comma-separated
+    GMAIL_PUSH_VERIFICATION_TOKEN: str = os.getenv("GMAIL_PUSH_VERIFICATION_TOKEN", "")
+    GMAIL_PUSH_COALESCE_DELAY: float = float(os.getenv("GMAIL_PUSH_COALESCE_DELAY", 1.0))  # seconds
+    GMAIL_WATCH_RENEW_BEFORE: int = int(os.getenv("GMAIL_WATCH_RENEW_BEFORE", 6 * 24 * 3600))  # renew daily (7-day watches)
+    # Gmail quota limiter, retries and circuit breaker
+    GMAIL_PROJECT_QUOTA_PER_SECOND: float = float(os.getenv("GMAIL_PROJECT_QUOTA_PER_SECOND", 20000))  # units/s
+    # processes sharing the project quota, each taking an equal slice; serve.py sets it to its worker count
+    GMAIL_PROJECT_QUOTA_SHARES: int = int(os.getenv("GMAIL_PROJECT_QUOTA_SHARES", 1))
+    GMAIL_USER_QUOTA_PER_SECOND: float = float(os.getenv("GMAIL_USER_QUOTA_PER_SECOND", 250))  # units/s per user
+    GMAIL_RATE_LIMITER_MAX_USERS: int = int(os.getenv("GMAIL_RATE_LIMITER_MAX_USERS", 10000))
+    GMAIL_RETRY_MAX_ATTEMPTS: int = int(os.getenv("GMAIL_RETRY_MAX_ATTEMPTS", 5))
+    GMAIL_RETRY_BASE_DELAY: float = float(os.getenv("GMAIL_RETRY_BASE_DELAY", 0.5))  # seconds
+    GMAIL_RETRY_MAX_DELAY: float = float(os.getenv("GMAIL_RETRY_MAX_DELAY", 32))  # seconds
+    GMAIL_BREAKER_THRESHOLD: int = int(os.getenv("GMAIL_BREAKER_THRESHOLD", 5))  # consecutive failed calls
+    GMAIL_BREAKER_COOLDOWN: float = float(os.getenv("GMAIL_BREAKER_COOLDOWN", 60))  # seconds
+    # Background per-user sync scheduler
+    GMAIL_SCHEDULER_ENABLED: bool = os.getenv("GMAIL_SCHEDULER_ENABLED", "false").lower() == "true"
+    GMAIL_SCHEDULER_CONCURRENCY: int = int(os.getenv("GMAIL_SCHEDULER_CONCURRENCY", 8))  # global worker count
+    GMAIL_SCHEDULER_INTERVAL: float = float(os.getenv("GMAIL_SCHEDULER_INTERVAL", 300))  # seconds between runs per user
+    GMAIL_SCHEDULER_JITTER: float = float(os.getenv("GMAIL_SCHEDULER_JITTER", 0.2))  # +/- fraction of the interval
+    GMAIL_SCHEDULER_SCAN_INTERVAL: float = float(os.getenv("GMAIL_SCHEDULER_SCAN_INTERVAL", 10))  # idle worker poll
+    GMAIL_SCHEDULER_LEASE: float = float(os.getenv("GMAIL_SCHEDULER_LEASE", 600))  # seconds, renewed while running
+    GMAIL_FETCH_CONCURRENCY: int = int(os.getenv("GMAIL_FETCH_CONCURRENCY", 10))  # per-listing fan-out (httpx backend)
+    GMAIL_BATCH_SIZE: int = int(os.getenv("GMAIL_BATCH_SIZE", 50))  # sub-requests per batch call (Gmail caps at 100)
+    GMAIL_CLIENT_CACHE_SIZE: int = int(os.getenv("GMAIL_CLIENT_CACHE_SIZE", 1024))
+    GMAIL_CLIENT_CACHE_TTL: int = int(os.getenv("GMAIL_CLIENT_CACHE_TTL", 3000))  # seconds
+    GMAIL_CREDENTIAL_CACHE_SIZE: int = int(os.getenv("GMAIL_CREDENTIAL_CACHE_SIZE", 4096))
+    GMAIL_CREDENTIAL_CACHE_TTL: int = int(os.getenv("GMAIL_CREDENTIAL_CACHE_TTL", 300))  # seconds
+    GMAIL_TOKEN_REFRESH_MARGIN: int = int(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", 300))  # refresh this long before expiry
+    # Dedicated thread pools for blocking Google calls (tools.executor)
+    GOOGLE_EXECUTOR_INTERACTIVE_WORKERS: int = int(os.getenv("GOOGLE_EXECUTOR_INTERACTIVE_WORKERS", 32))
+    GOOGLE_EXECUTOR_BACKGROUND_WORKERS: int = int(os.getenv("GOOGLE_EXECUTOR_BACKGROUND_WORKERS", 8))
+    GOOGLE_EXECUTOR_QUEUE_SIZE: int = int(os.getenv("GOOGLE_EXECUTOR_QUEUE_SIZE", 64))  # waiting calls per lane
+    GOOGLE_EXECUTOR_PER_USER: int = int(os.getenv("GOOGLE_EXECUTOR_PER_USER", 4))  # in-flight calls per user, 0 = off
+    GOOGLE_EXECUTOR_RETRY_AFTER: float = float(os.getenv("GOOGLE_EXECUTOR_RETRY_AFTER", 1))  # seconds, on 503
+    # Mail rules engine
+    GMAIL_RULES_CACHE_SIZE: int = int(os.getenv("GMAIL_RULES_CACHE_SIZE", 1024))  # users with a compiled matcher
+    # new mail only; skipped for users whose grant cannot modify messages
+    GMAIL_RULES_APPLY_ON_SYNC: bool = os.getenv("GMAIL_RULES_APPLY_ON_SYNC", "false").lower() == "true"
+    # Bulk modify / trash / delete jobs
+    GMAIL_BULK_LEASE: int = int(os.getenv("GMAIL_BULK_LEASE", 120))  # seconds a running job is owned without progress
+    GMAIL_BULK_MAX_MESSAGES: int = int(os.getenv("GMAIL_BULK_MAX_MESSAGES", 1000000))  # per job
+    # Production server (serve.py)
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", 8000))
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
+    SERVER_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))  # seconds to drain on SIGTERM
+    SERVER_KEEPALIVE_TIMEOUT: int = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", 5))
+    SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", 2048))
+    SERVER_LIMIT_CONCURRENCY: int = int(os.getenv("SERVER_LIMIT_CONCURRENCY", 0))  # per worker, 0 = unlimited
+    # Instrumentation (/metrics); off by default so the hot paths stay unwrapped
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_TRACING: bool = os.getenv("METRICS_TRACING", "false").lower() == "true"  # needs opentelemetry-api
 
 
 settings = Settings()
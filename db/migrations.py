@@ -0,0 +1,96 @@
+import logging
+from typing import TYPE_CHECKING
+from config.settings import settings
+from db.mongo_connector import ASCENDING, DESCENDING
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# collection -> list of (keys, options)
+INDEXES = {
+    "gmail_credentials": [([("user_id", ASCENDING)], {"unique": True})],
+    "gmail_user_info": [([("user_id", ASCENDING)], {"unique": True})],
+    "gmail_users": [([("user_id", ASCENDING)], {"unique": True})],
+    "gmail_messages": [
+        ([("user_id", ASCENDING), ("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("internalDate", DESCENDING)], {}),
+    ],
+    "gmail_sync_state": [([("user_id", ASCENDING)], {"unique": True})],
+    "gmail_search_index": [
+        ([("user_id", ASCENDING), ("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("tokens", ASCENDING)], {}),
+    ],
+    "gmail_watches": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+        ([("email", ASCENDING)], {}),
+    ],
+    "gmail_jobs": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+    ],
+    "gmail_job_ids": [
+        ([("job_id", ASCENDING), ("seq", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING)], {}),
+    ],
+    "gmail_schedule": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+        ([("next_run", ASCENDING)], {}),
+        ([("lag_since", ASCENDING)], {}),
+    ],
+    "gmail_rules": [([("user_id", ASCENDING), ("id", ASCENDING)], {"unique": True})],
+    "gmail_message_cache": [
+        ([("user_id", ASCENDING), ("message_id", ASCENDING), ("format", ASCENDING)], {"unique": True}),
+    ],
+}
+
+
+async def ensure_indexes(db: "AsyncIOMotorDatabase") -> None:
+    """Create the indexes the repositories rely on. Safe to run on every startup."""
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            await db[collection].create_index(keys, **options)
+
+
+async def migrate_to_combined_layout(db: "AsyncIOMotorDatabase", batch_size: int = 1000) -> int:
+    """Copy split `gmail_credentials`/`gmail_user_info` documents into `gmail_users`.
+
+    Existing `gmail_users` sub-documents are never overwritten. Returns the number of users copied.
+    """
+    from pymongo import UpdateOne
+
+    copied = 0
+    batch = []
+
+    async def _flush():
+        infos = db["gmail_user_info"].find({"user_id": {"$in": [c['user_id'] for c in batch]}},
+                                           {'_id': 0, 'user_id': 1, 'info': 1})
+        info_by_user = {d['user_id']: d.get('info') async for d in infos}
+        ops = []
+        for creds in batch:
+            user_id = creds.pop('user_id')
+            doc = {"credentials": creds}
+            if info_by_user.get(user_id):
+                doc["info"] = info_by_user[user_id]
+            ops.append(UpdateOne({"user_id": user_id}, {"$setOnInsert": doc}, upsert=True))
+        await db["gmail_users"].bulk_write(ops, ordered=False)
+        return len(ops)
+
+    async for creds in db["gmail_credentials"].find({}, {'_id': 0}).batch_size(batch_size):
+        batch.append(creds)
+        if len(batch) >= batch_size:
+            copied += await _flush()
+            batch = []
+    if batch:
+        copied += await _flush()
+    return copied
+
+
+async def bootstrap_schema(db: "AsyncIOMotorDatabase") -> None:
+    """Startup schema step: indexes, plus a one-time layout migration when switching to "combined"."""
+    await ensure_indexes(db)
+    if settings.GMAIL_USER_LAYOUT == "combined" and await db["gmail_users"].estimated_document_count() == 0:
+        copied = await migrate_to_combined_layout(db)
+        if copied:
+            logger.info("Migrated %d users to the combined gmail_users layout", copied)
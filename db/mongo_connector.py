@@ -1,24 +1,41 @@
-from typing import Optional
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
 from config.settings import settings
 
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+# pymongo.ASCENDING / DESCENDING, so index and sort specs do not import the driver
+ASCENDING = 1
+DESCENDING = -1
+
 
 class SingletonMeta(type):
-    """A thread-safe implementation of Singleton using a metaclass."""
+    """A thread-safe implementation of Singleton using a metaclass.
+
+    The lock is re-entrant because constructors may create other singletons (GmailService
+    builds a GmailRepo, which uses MongoConnector).
+    """
 
     _instances = {}
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
-        return cls._instances[cls]
+        instance = cls._instances.get(cls)
+        if instance is None:
+            with SingletonMeta._lock:
+                instance = cls._instances.get(cls)
+                if instance is None:
+                    instance = super().__call__(*args, **kwargs)
+                    cls._instances[cls] = instance
+        return instance
 
 
 class MongoConnector(metaclass=SingletonMeta):
     """Connector for Motor AsyncIOMotorClient implemented as a singleton.
 
-    Use MongoConnector().get_db() to obtain the AsyncIOMotorDatabase instance.
+    Use MongoConnector().get_db() to obtain the AsyncIOMotorDatabase instance. Motor (and
+    pymongo) are imported when the first client is created, not when this module is.
     """
 
     def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None):
@@ -26,14 +43,39 @@ class MongoConnector(metaclass=SingletonMeta):
         if not self._uri:
             raise ValueError("MONGO_URI not configured in settings")
         self._db_name = db_name or settings.MONGO_DB
-        self._client: Optional[AsyncIOMotorClient] = None
+        self._client: Optional["AsyncIOMotorClient"] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def client_options() -> Dict[str, Any]:
+        """Pool, timeout and compression options for the Motor client, from settings."""
+        options: Dict[str, Any] = {
+            "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+            "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "appname": settings.MONGO_APP_NAME,
+        }
+        # 0 keeps the driver default (no timeout)
+        if settings.MONGO_SOCKET_TIMEOUT_MS:
+            options["socketTimeoutMS"] = settings.MONGO_SOCKET_TIMEOUT_MS
+        if settings.MONGO_WAIT_QUEUE_TIMEOUT_MS:
+            options["waitQueueTimeoutMS"] = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+        if settings.MONGO_COMPRESSORS:
+            options["compressors"] = settings.MONGO_COMPRESSORS
+        return options
 
-    def get_client(self) -> AsyncIOMotorClient:
+    def get_client(self) -> "AsyncIOMotorClient":
         if self._client is None:
-            self._client = AsyncIOMotorClient(self._uri)
+            with self._lock:
+                if self._client is None:
+                    from motor.motor_asyncio import AsyncIOMotorClient
+
+                    self._client = AsyncIOMotorClient(self._uri, **self.client_options())
         return self._client
 
-    def get_db(self, db_name: Optional[str] = None) -> AsyncIOMotorDatabase:
+    def get_db(self, db_name: Optional[str] = None) -> "AsyncIOMotorDatabase":
         client = self.get_client()
         return client[db_name or self._db_name]
 
@@ -46,5 +88,5 @@ class MongoConnector(metaclass=SingletonMeta):
                 pass
 
     @property
-    def client(self) -> Optional[AsyncIOMotorClient]:
+    def client(self) -> Optional["AsyncIOMotorClient"]:
         return self._client
@@ -20,7 +20,7 @@ async def get_db():
 def get_gmail_repo(db=Depends(get_db)) -> GmailRepo:
     """Return a GmailRepo instance bound to the provided db.
 
-    GmailRepo currently uses the connector internally; this factory keeps the DI
-    surface in place for tests or future constructor-based injection.
+    Overriding `get_db` (app.dependency_overrides) is enough to point the repo at another
+    database, e.g. the in-memory stand-in used by the benchmarks.
     """
-    return GmailRepo()
+    return GmailRepo(db=db)
@@ -1,24 +1,53 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 from starlette.middleware.cors import CORSMiddleware
 from config.settings import settings
 from routes.gmail.router import router as gmail_router
 from routes.google.router import router as google_router
-app = FastAPI()
-
+from routes.gmail.repo import GmailRepo
+from routes.gmail.service import GmailService
+from routes.gmail.scheduler import SyncScheduler
 from db.mongo_connector import MongoConnector
+from db.migrations import bootstrap_schema
+from routes.gmail.async_client import close_http_client
+from tools import metrics
+from tools.executor import shutdown_executor
+from tools.warmup import warm_up
 
 
-@app.on_event("startup")
-async def startup_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     # Initialize the MongoConnector singleton so the client is created once
-    MongoConnector()
+    connector = MongoConnector()
+    # Create indexes (and migrate the user layout if configured) before serving requests
+    await bootstrap_schema(connector.get_db())
+    # Open Mongo connections and load Google data before reporting ready
+    app.state.warmup = await warm_up(connector.get_db())
+
+    scheduler = None
+    if settings.GMAIL_SCHEDULER_ENABLED:
+        repo = GmailRepo()
+        scheduler = SyncScheduler(job=GmailService(repo=repo).scheduled_work, repo=repo)
+        scheduler.start()
+    app.state.scheduler = scheduler
+    app.state.ready = True
 
+    yield
 
-@app.on_event("shutdown")
-async def shutdown_event():
+    # Fail readiness first so load balancers stop routing here while requests drain
+    app.state.ready = False
+    if scheduler is not None:
+        await scheduler.stop()
     # Close motor client if it was created
-    MongoConnector().close()
+    connector.close()
+    await close_http_client()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,5 +60,27 @@ app.add_middleware(
 app.include_router(gmail_router)
 app.include_router(google_router)
 
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: the worker process is serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: startup (schema bootstrap and warm-up) finished and the worker is not shutting down."""
+    if not app.state.ready:
+        return JSONResponse({"status": "not ready"}, status_code=503)
+    return {"status": "ready", "warmup_ms": app.state.warmup}
+
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
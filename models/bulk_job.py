@@ -0,0 +1,13 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class BulkJobRequest(BaseModel):
+    # select messages with a Gmail search query (e.g. "in:inbox older_than:1y") or explicit ids
+    q: Optional[str] = None
+    ids: Optional[List[str]] = None
+    label_ids: List[str] = Field(default_factory=list)  # restrict a query to these labels
+    # modify: add/remove labels; trash: move to Trash; delete: permanent (needs the mail.google.com scope)
+    action: Literal["modify", "trash", "delete"] = "modify"
+    add_labels: List[str] = Field(default_factory=list)
+    remove_labels: List[str] = Field(default_factory=list)
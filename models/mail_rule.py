@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class RuleCondition(BaseModel):
+    # fields of a listing summary (routes.gmail.metadata.email_summary)
+    field: Literal["from", "subject", "snippet"]
+    # contains / equals are case-insensitive; regex uses Python syntax with re.IGNORECASE
+    op: Literal["contains", "equals", "regex"] = "contains"
+    value: str = Field(min_length=1)
+
+
+class RuleActions(BaseModel):
+    # Gmail label IDs (system labels such as STARRED, or Label_... IDs of user labels)
+    add_labels: List[str] = Field(default_factory=list)
+    remove_labels: List[str] = Field(default_factory=list)
+    archive: bool = False  # remove INBOX
+    mark_read: bool = False  # remove UNREAD
+
+
+class MailRule(BaseModel):
+    name: str
+    enabled: bool = True
+    # all conditions must match
+    conditions: List[RuleCondition] = Field(min_length=1)
+    actions: RuleActions
+
+
+class StoredMailRule(MailRule):
+    id: str
+    updated_at: Optional[datetime] = None
@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -8,3 +9,5 @@ class UserCredentials(BaseModel):
     token_uri: str
     client_id: str
     scopes: List[str]
+    # naive UTC datetime, as used by google-auth
+    expiry: Optional[datetime] = None
@@ -0,0 +1,127 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+from config.settings import settings
+from routes.gmail.credential_cache import refresh_token
+from routes.gmail.errors import GmailApiError, error_from_payload, parse_retry_after
+from routes.gmail.instrumentation import GMAIL_API_SECONDS
+from tools.metrics import instrument
+
+if TYPE_CHECKING:
+    import httpx
+    from google.oauth2.credentials import Credentials
+
+_http_client: Optional["httpx.AsyncClient"] = None
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Return the process-wide pooled, keep-alive HTTP client used for Gmail calls."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+
+        _http_client = httpx.AsyncClient(
+            base_url=settings.GMAIL_API_ROOT.rstrip('/') + '/gmail/v1/users/me/',
+            http2=settings.GMAIL_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.GMAIL_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GMAIL_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.GMAIL_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.GMAIL_HTTP_TIMEOUT, connect=settings.GMAIL_HTTP_CONNECT_TIMEOUT),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@instrument(GMAIL_API_SECONDS, backend="httpx")
+class AsyncGmailClient:
+    """Native asyncio Gmail client on top of the shared pooled httpx client.
+
+    Calls run on the event loop instead of holding executor threads. Only the operations the
+    service uses are implemented.
+    """
+
+    def __init__(self, credentials: "Credentials", http: Optional["httpx.AsyncClient"] = None):
+        self._credentials = credentials
+        self._http = http or get_http_client()
+
+    async def _request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                       json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        import httpx
+
+        for attempt in range(2):
+            try:
+                response = await self._http.request(
+                    method, path, params=params, json=json_body,
+                    headers={"Authorization": f"Bearer {self._credentials.token}"},
+                )
+            except httpx.HTTPError as exc:
+                # transport failures (connect errors, timeouts) are retryable like the other backend's
+                raise GmailApiError(0, type(exc).__name__, str(exc)) from exc
+            if response.status_code == 401 and attempt == 0 and self._credentials.refresh_token:
+                # token revoked or expired early; refresh once and retry
+                await refresh_token(self._credentials)
+                continue
+            break
+
+        if response.status_code >= 400:
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            raise error_from_payload(response.status_code, payload, parse_retry_after(response.headers.get('retry-after')))
+        return response.json() if response.content else {}
+
+    async def list_messages(self, **params) -> Dict[str, Any]:
+        return await self._request('GET', 'messages', params=params)
+
+    async def get_message(self, message_id: str, **params) -> Dict[str, Any]:
+        return await self._request('GET', f'messages/{message_id}', params=params)
+
+    async def get_messages(self, message_ids: List[str], **params) -> List[Union[Dict[str, Any], GmailApiError]]:
+        """Fetch several messages concurrently, at most `settings.GMAIL_FETCH_CONCURRENCY` at a time.
+
+        Results keep the order of `message_ids`; a failed fetch yields a GmailApiError in its slot.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.GMAIL_FETCH_CONCURRENCY))
+
+        async def _fetch(message_id: str):
+            async with semaphore:
+                try:
+                    return await self.get_message(message_id, **params)
+                except GmailApiError as exc:
+                    return exc
+
+        return list(await asyncio.gather(*(_fetch(message_id) for message_id in message_ids)))
+
+    async def get_attachment(self, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        return await self._request('GET', f'messages/{message_id}/attachments/{attachment_id}')
+
+    async def list_history(self, **params) -> Dict[str, Any]:
+        return await self._request('GET', 'history', params=params)
+
+    async def get_profile(self) -> Dict[str, Any]:
+        return await self._request('GET', 'profile')
+
+    async def watch(self, topic_name: str, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        body = {"topicName": topic_name, "labelIds": label_ids or [], "labelFilterBehavior": "include"}
+        return await self._request('POST', 'watch', json_body=body)
+
+    async def stop(self) -> None:
+        await self._request('POST', 'stop')
+
+    async def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                           remove_label_ids: Optional[List[str]] = None) -> None:
+        body = {"ids": message_ids, "addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []}
+        await self._request('POST', 'messages/batchModify', json_body=body)
+
+    async def batch_delete(self, message_ids: List[str]) -> None:
+        """Permanently delete messages (up to 1000 ids); needs the https://mail.google.com/ scope."""
+        await self._request('POST', 'messages/batchDelete', json_body={"ids": message_ids})
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from models.bulk_job import BulkJobRequest
+from routes.gmail.repo import GmailRepo
+from routes.gmail.rules import MODIFY_CHUNK
+from tools import executor
+from tools.time_utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+LIST_PAGE = 500  # messages.list maximum page size
+RESUMABLE_STATUSES = ["queued", "running", "failed"]
+# a failed job keeps its cursor until it is resumed or cancelled
+CANCELLABLE_STATUSES = RESUMABLE_STATUSES
+FULL_MAIL_SCOPE = "https://mail.google.com/"  # messages.batchDelete needs it
+PUBLIC_FIELDS = ("id", "status", "phase", "request", "total", "processed", "calls", "truncated", "error",
+                 "created_at", "updated_at", "finished_at")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {key: job.get(key) for key in PUBLIC_FIELDS}
+    # the total is only final once collection is done
+    if job.get('phase') == "apply" and job.get('total'):
+        view['progress'] = round(job.get('processed', 0) / job['total'], 4)
+    return view
+
+
+class BulkJobs:
+    """Bulk modify / trash / delete jobs over a Gmail query or an id list.
+
+    A job first collects the matching ids (500 per messages.list page) into `gmail_job_ids`
+    chunks, then applies the action with messages.batchModify / batchDelete on up to 1000 ids
+    per call. Collecting first keeps paging stable while the action changes which messages
+    match the query. Both phases store their cursor after every call, so an interrupted or
+    failed job resumes where it stopped; a lease keeps two processes from running one job, and
+    every progress write doubles as the cancellation check.
+    """
+
+    def __init__(self, repo: GmailRepo, get_client: Callable[[str], Awaitable[Any]]):
+        self._repo = repo
+        self._get_client = get_client
+        self._tasks: Dict[str, Tuple[str, asyncio.Task]] = {}  # job id -> (user id, task)
+
+    @staticmethod
+    def validate(request: BulkJobRequest, scopes: List[str]) -> None:
+        """Raise ValueError for an invalid request, PermissionError if the user's grant cannot run it."""
+        if request.ids:
+            if request.q is not None or request.label_ids:
+                raise ValueError("Provide either ids or a query (q and/or label_ids), not both")
+        elif not ((request.q or "").strip() or request.label_ids):
+            # an empty query matches the whole mailbox
+            raise ValueError("Provide ids, a non-empty q or label_ids")
+        if request.ids and len(request.ids) > settings.GMAIL_BULK_MAX_MESSAGES:
+            raise ValueError(f"At most {settings.GMAIL_BULK_MAX_MESSAGES} ids per job")
+        if request.action == "modify" and not (request.add_labels or request.remove_labels):
+            raise ValueError("A modify job needs add_labels or remove_labels")
+        if request.action == "delete" and FULL_MAIL_SCOPE not in scopes:
+            raise PermissionError(f"Permanent deletion needs the {FULL_MAIL_SCOPE} scope; authorize it first")
+
+    async def submit(self, user_id: str, request: BulkJobRequest, scopes: List[str]) -> Dict[str, Any]:
+        self.validate(request, scopes)
+        job_id = uuid.uuid4().hex
+        now = utcnow()
+        job: Dict[str, Any] = {
+            "id": job_id, "user_id": user_id, "status": "queued", "phase": "collect",
+            "request": request.dict(exclude={"ids"}), "total": 0, "processed": 0, "calls": 0,
+            "page_token": None, "collect_seq": 0, "apply_seq": 0, "truncated": False,
+            "error": None, "lease_until": None, "created_at": now, "updated_at": now, "finished_at": None,
+        }
+        if request.ids:
+            # explicit ids skip collection; store them as chunks rather than in the job document
+            ids = list(dict.fromkeys(request.ids))
+            for seq, start in enumerate(range(0, len(ids), MODIFY_CHUNK)):
+                await self._repo.save_job_ids(user_id, job_id, seq, ids[start:start + MODIFY_CHUNK])
+            job.update({"phase": "apply", "total": len(ids), "request": {**job['request'], "ids": len(ids)}})
+        await self._repo.save_job(job)
+        await self.resume(user_id, job_id)
+        return job_view(await self._repo.get_job(user_id, job_id))
+
+    async def get(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self._repo.get_job(user_id, job_id)
+        return job_view(job) if job else None
+
+    async def resume(self, user_id: str, job_id: str) -> bool:
+        """Start (or restart) a queued, interrupted or failed job in this process."""
+        if job_id in self._tasks:
+            return True
+        now = utcnow()
+        if not await self._repo.claim_job(job_id, now, now + timedelta(seconds=settings.GMAIL_BULK_LEASE),
+                                          RESUMABLE_STATUSES):
+            return False
+        task = asyncio.create_task(self._run(user_id, job_id))
+        self._tasks[job_id] = (user_id, task)
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return True
+
+    async def cancel(self, user_id: str, job_id: str) -> bool:
+        job = await self._repo.get_job(user_id, job_id)
+        if job is None:
+            return False
+        now = utcnow()
+        cancelled = await self._repo.update_job(job_id, {"status": "cancelled", "updated_at": now,
+                                                         "finished_at": now, "lease_until": None},
+                                                statuses=CANCELLABLE_STATUSES)
+        if cancelled and job['status'] == "failed":
+            # no task is left to clean up after a failed job
+            await self._repo.delete_job_ids(job_id)
+        return cancelled
+
+    def stop(self, user_id: str) -> None:
+        """Stop this process's running tasks for a user (their job documents are left as they are)."""
+        for owner, task in list(self._tasks.values()):
+            if owner == user_id:
+                task.cancel()
+
+    async def _progress(self, job_id: str, fields: Dict[str, Any]) -> None:
+        now = utcnow()
+        fields = {**fields, "updated_at": now, "lease_until": now + timedelta(seconds=settings.GMAIL_BULK_LEASE)}
+        if not await self._repo.update_job(job_id, fields, statuses=["running"]):
+            raise JobCancelled(job_id)
+
+    async def _renew_lease(self, job_id: str) -> None:
+        # a call can wait in rate-limiter backoff or on an open circuit for longer than the lease
+        while True:
+            await asyncio.sleep(settings.GMAIL_BULK_LEASE / 3)
+            lease_until = utcnow() + timedelta(seconds=settings.GMAIL_BULK_LEASE)
+            try:
+                if not await self._repo.update_job(job_id, {"lease_until": lease_until}, statuses=["running"]):
+                    return
+            except Exception:
+                logger.warning("Could not renew the lease of bulk job %s", job_id, exc_info=True)
+
+    async def _run(self, user_id: str, job_id: str) -> None:
+        # bulk work must not take threads from interactive requests
+        with executor.lane(executor.BACKGROUND):
+            renewal = asyncio.create_task(self._renew_lease(job_id))
+            try:
+                job = await self._repo.get_job(user_id, job_id)
+                client = await self._get_client(user_id)
+                if job['phase'] == "collect":
+                    job = await self._collect(client, job)
+                await self._apply(client, job)
+                now = utcnow()
+                await self._repo.update_job(job_id, {"status": "completed", "updated_at": now, "finished_at": now,
+                                                     "lease_until": None}, statuses=["running"])
+                await self._repo.delete_job_ids(job_id)
+            except JobCancelled:
+                await self._repo.delete_job_ids(job_id)
+            except Exception as exc:
+                logger.exception("Bulk job %s failed", job_id)
+                await self._repo.update_job(job_id, {"status": "failed", "error": str(exc), "updated_at": utcnow(),
+                                                     "lease_until": None}, statuses=["running"])
+            finally:
+                renewal.cancel()
+
+    async def _collect(self, client, job: Dict[str, Any]) -> Dict[str, Any]:
+        request = job['request']
+        page_token, seq, total, calls = job['page_token'], job['collect_seq'], job['total'], job['calls']
+        truncated = False
+        while True:
+            params: Dict[str, Any] = {"maxResults": min(LIST_PAGE, settings.GMAIL_BULK_MAX_MESSAGES - total)}
+            if request.get('q'):
+                params["q"] = request['q']
+            if request.get('label_ids'):
+                params["labelIds"] = request['label_ids']
+            if page_token:
+                params["pageToken"] = page_token
+            listing = await client.list_messages(**params)
+            calls += 1
+            ids = [m['id'] for m in listing.get('messages', [])]
+            if ids:
+                await self._repo.save_job_ids(job['user_id'], job['id'], seq, ids)
+                seq += 1
+                total += len(ids)
+            page_token = listing.get('nextPageToken')
+            truncated = bool(page_token) and total >= settings.GMAIL_BULK_MAX_MESSAGES
+            done = not page_token or truncated
+            fields = {"page_token": page_token, "collect_seq": seq, "total": total, "calls": calls,
+                      "phase": "apply" if done else "collect", "truncated": truncated}
+            await self._progress(job['id'], fields)
+            if done:
+                return {**job, **fields}
+
+    async def _apply(self, client, job: Dict[str, Any]) -> None:
+        request = job['request']
+        seq, processed, calls = job['apply_seq'], job['processed'], job['calls']
+        while True:
+            # list pages are stored as 500-id chunks; two fill one 1000-id call
+            chunks = await self._repo.get_job_ids(job['id'], seq, limit=MODIFY_CHUNK // LIST_PAGE)
+            if not chunks:
+                return
+            ids: List[str] = []
+            for chunk in chunks:
+                if ids and len(ids) + len(chunk['ids']) > MODIFY_CHUNK:
+                    break
+                ids.extend(chunk['ids'])
+                seq = chunk['seq'] + 1
+            if request['action'] == "delete":
+                await client.batch_delete(ids)
+            elif request['action'] == "trash":
+                await client.batch_modify(ids, ["TRASH"], [])
+            else:
+                await client.batch_modify(ids, request['add_labels'], request['remove_labels'])
+            calls += 1
+            processed += len(ids)
+            await self._progress(job['id'], {"apply_seq": seq, "processed": processed, "calls": calls})
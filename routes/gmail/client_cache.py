@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class GmailClientCache:
+    """Bounded per-user cache of built Gmail API clients.
+
+    Entries are evicted least-recently-used once `max_size` is reached and expire `ttl`
+    seconds after they were built. The cache is only touched from the event loop, so no
+    locking is needed.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max(1, max_size)
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, user_id: str) -> Optional[Any]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        client, built_at = entry
+        if time.monotonic() - built_at > self._ttl:
+            del self._entries[user_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return client
+
+    def put(self, user_id: str, client: Any) -> None:
+        self._entries[user_id] = (client, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "ttl": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+from config.settings import settings
+from models.user_credentials import UserCredentials
+from routes.gmail.instrumentation import CREDENTIAL_LOAD_SECONDS, TOKEN_REFRESH_SECONDS
+from routes.gmail.repo import GmailRepo
+from tools.executor import run_blocking
+from tools.google_api import load_client_config
+from tools.metrics import timed
+from tools.time_utils import utcnow
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+
+def credentials_from_doc(doc: Dict[str, Any]) -> "Credentials":
+    """Build google-auth Credentials from a stored `gmail_credentials` document."""
+    from google.oauth2.credentials import Credentials
+
+    doc = dict(doc)
+    doc.pop('user_id', None)
+    if not doc.get('client_secret'):
+        # the client secret is not stored per user; it is required to refresh tokens
+        doc['client_secret'] = load_client_config(settings.CLIENT_SECRETS_FILE).get('client_secret')
+    return Credentials(**doc)
+
+
+def credentials_to_model(creds: "Credentials") -> UserCredentials:
+    return UserCredentials(
+        token=creds.token,
+        refresh_token=creds.refresh_token,
+        token_uri=creds.token_uri,
+        client_id=creds.client_id,
+        scopes=list(creds.scopes) if creds.scopes else [],
+        expiry=creds.expiry
+    )
+
+
+@timed(TOKEN_REFRESH_SECONDS)
+async def refresh_token(creds: "Credentials") -> None:
+    """Refresh the access token of `creds` in place (a blocking HTTP call, run in a worker)."""
+    from google.auth.transport import requests as auth_requests
+
+    await run_blocking(creds.refresh, auth_requests.Request())
+
+
+class CredentialCache:
+    """TTL-bounded in-process cache of user Credentials in front of GmailRepo.
+
+    A cached entry answers both the authorization check and the client build, so a request
+    costs at most one Mongo read. Tokens close to expiry are refreshed in the background
+    (one refresh per user at a time) and written back through `GmailRepo.save_credentials`.
+
+    `on_change(user_id)` is called whenever the Credentials object of a user is replaced or
+    dropped, so dependent caches (built clients) can be invalidated.
+    """
+
+    def __init__(self, repo: GmailRepo, on_change: Optional[Callable[[str], None]] = None):
+        self._repo = repo
+        self._on_change = on_change
+        self._ttl = settings.GMAIL_CREDENTIAL_CACHE_TTL
+        self._refresh_margin = settings.GMAIL_TOKEN_REFRESH_MARGIN
+        self._max_size = max(1, settings.GMAIL_CREDENTIAL_CACHE_SIZE)
+        self._entries: "OrderedDict[str, Tuple[Credentials, float]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def get(self, user_id: str) -> Optional["Credentials"]:
+        """Return the user's Credentials, or None if the user has not authorized."""
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] <= self._ttl:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            creds = entry[0]
+        else:
+            self.misses += 1
+            creds = await self._load(user_id, entry[0] if entry else None)
+            if creds is None:
+                return None
+
+        if creds.expiry is not None:
+            remaining = (creds.expiry - utcnow()).total_seconds()
+            if remaining <= 0:
+                await self.refresh(user_id)
+            elif remaining <= self._refresh_margin:
+                self.refresh(user_id)
+        return creds
+
+    @timed(CREDENTIAL_LOAD_SECONDS)
+    async def _load(self, user_id: str, previous: Optional["Credentials"]) -> Optional["Credentials"]:
+        doc = await self._repo.get_credentials(user_id)
+        if not doc:
+            self.invalidate(user_id)
+            return None
+
+        if previous is not None and previous.refresh_token == doc.get('refresh_token'):
+            # same grant: keep the object (and the clients built on it), take the newest token
+            if doc.get('expiry') and (previous.expiry is None or doc['expiry'] > previous.expiry):
+                previous.token = doc['token']
+                previous.expiry = doc['expiry']
+            creds = previous
+        else:
+            creds = credentials_from_doc(doc)
+            if previous is not None and self._on_change:
+                self._on_change(user_id)
+
+        self._entries[user_id] = (creds, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._on_change:
+                self._on_change(evicted)
+        return creds
+
+    def refresh(self, user_id: str) -> "asyncio.Task[None]":
+        """Refresh the cached token of `user_id`, joining a refresh already in flight."""
+        task = self._refreshing.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(user_id))
+            self._refreshing[user_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(user_id, None))
+        return task
+
+    async def _refresh(self, user_id: str) -> None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        creds = entry[0]
+        try:
+            await refresh_token(creds)
+            await self._repo.save_credentials(user_id, credentials_to_model(creds))
+            self.refreshes += 1
+        except Exception:
+            self.refresh_failures += 1
+            logger.exception("Token refresh failed for user %s", user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+        if self._on_change:
+            self._on_change(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshing": len(self._refreshing),
+        }
@@ -0,0 +1,46 @@
+from typing import Optional
+
+
+class GmailApiError(Exception):
+    """Error returned by the Gmail API, normalized across client backends."""
+
+    def __init__(self, status: int, reason: str = "", message: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"Gmail API error {status} {reason}: {message}".strip())
+        self.status = status
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+
+def error_from_payload(status: int, payload, retry_after: Optional[float] = None) -> GmailApiError:
+    """Build a GmailApiError from a Gmail JSON error body (`{"error": {...}}`)."""
+    error = payload.get('error', {}) if isinstance(payload, dict) else {}
+    errors = error.get('errors') or [{}]
+    reason = errors[0].get('reason') or error.get('status') or ""
+    return GmailApiError(status, reason, error.get('message', ""), retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Gmail while a user's circuit breaker is open."""
+
+    def __init__(self, user_id: str, retry_after: float):
+        super().__init__(f"Gmail calls for user {user_id} are paused after repeated failures")
+        self.user_id = user_id
+        self.retry_after = retry_after
+
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+
+def is_retryable(exc: GmailApiError) -> bool:
+    """Transport failures (status 0), 429, 5xx and 403 rate-limit reasons are worth retrying."""
+    if exc.status in (0, 429, 500, 502, 503, 504):
+        return True
+    return exc.status == 403 and exc.reason in RATE_LIMIT_REASONS
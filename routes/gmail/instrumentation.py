@@ -0,0 +1,12 @@
+"""Metrics for the Gmail hot paths (see tools.metrics)."""
+from tools.metrics import Histogram
+
+REPO_SECONDS = Histogram("gmail_repo_operation_seconds", "Latency of GmailRepo operations", ["method", "outcome"])
+GMAIL_API_SECONDS = Histogram("gmail_api_request_seconds", "Latency of Gmail API calls (one attempt)",
+                              ["backend", "method", "outcome"])
+CREDENTIAL_LOAD_SECONDS = Histogram("gmail_credential_load_seconds",
+                                    "Time to load and build a user's Credentials on a cache miss", ["outcome"])
+CLIENT_BUILD_SECONDS = Histogram("gmail_client_build_seconds", "Time to build a Gmail client on a cache miss",
+                                 ["backend", "outcome"])
+TOKEN_REFRESH_SECONDS = Histogram("gmail_token_refresh_seconds", "Time to refresh an OAuth access token",
+                                  ["outcome"])
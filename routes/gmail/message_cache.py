@@ -0,0 +1,90 @@
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.time_utils import utcnow
+
+
+@dataclass
+class CachedMessage:
+    """Serialized message response without its labels, plus the labels last read from Gmail."""
+    body: bytes
+    digest: str
+    labels: List[str]
+    labels_checked: Optional[datetime] = None
+
+    @classmethod
+    def from_message(cls, message: Dict[str, Any]) -> "CachedMessage":
+        message = dict(message)
+        labels = message.pop('labelIds', None) or []
+        body = json.dumps(message, separators=(',', ':'), default=str).encode()
+        return cls(body, hashlib.sha256(body).hexdigest()[:32], labels, utcnow())
+
+    def labels_stale(self, ttl: float) -> bool:
+        return self.labels_checked is None or (utcnow() - self.labels_checked).total_seconds() > ttl
+
+    def render(self, labels: List[str]) -> Tuple[bytes, str]:
+        """Return (response body, strong ETag) with `labels` spliced in as `labelIds`.
+
+        The cached body is never re-serialized: the labels are appended before its closing brace.
+        """
+        labels_json = json.dumps(labels, separators=(',', ':')).encode()
+        separator = b',' if len(self.body) > 2 else b''
+        content = self.body[:-1] + separator + b'"labelIds":' + labels_json + b'}'
+        etag = f'"{self.digest}-{hashlib.sha256(labels_json).hexdigest()[:16]}"'
+        return content, etag
+
+
+class MessageCache:
+    """In-memory LRU of CachedMessage entries, bounded by the total size of their bodies."""
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str, str], CachedMessage]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[CachedMessage]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple[str, str, str], entry: CachedMessage) -> None:
+        if len(entry.body) > self._max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.body)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while self._bytes > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        for key in [k for k in self._entries if k[0] == user_id]:
+            self._bytes -= len(self._entries.pop(key).body)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self._max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against a strong ETag (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
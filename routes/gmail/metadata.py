@@ -0,0 +1,32 @@
+from typing import Any, Dict
+
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+
+def email_summary(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a `format='metadata'` message to the fields returned by the listing endpoints."""
+    email_data: Dict[str, Any] = {
+        'id': msg.get('id'),
+        'snippet': msg.get('snippet')
+    }
+
+    for header in msg.get('payload', {}).get('headers', []):
+        name = header.get('name')
+        value = header.get('value')
+        if name == 'From':
+            email_data['from'] = value
+        elif name == 'Subject':
+            email_data['subject'] = value
+        elif name == 'Date':
+            email_data['date'] = value
+
+    return email_data
+
+
+def mirror_record(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """Listing summary plus the fields the local mirror needs for ordering and label filters."""
+    record = email_summary(msg)
+    record['threadId'] = msg.get('threadId')
+    record['labelIds'] = msg.get('labelIds', [])
+    record['internalDate'] = int(msg.get('internalDate') or 0)
+    return record
@@ -0,0 +1,105 @@
+import asyncio
+import base64
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_push_message(payload: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """Return (emailAddress, historyId) from a Pub/Sub push request body, or None if malformed."""
+    try:
+        data = json.loads(base64.b64decode(payload["message"]["data"]))
+        return data["emailAddress"], str(data["historyId"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class EventBroker:
+    """In-process fan-out of per-user mailbox events to server-sent event subscribers.
+
+    Only subscribers of the process that ran the sync are notified, so /gmail/push and
+    /gmail/events must be served by the same single process (see serve.py).
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self._queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # slow consumer: drop its oldest event rather than block the publisher
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+class PushCoalescer:
+    """Turns bursts of push notifications into one history fetch per user.
+
+    The first notification schedules a sync after `delay` seconds; notifications arriving
+    before or during that sync only mark the user dirty, which triggers exactly one more sync
+    once the current one finishes. Each sync's delta is published to the EventBroker.
+    """
+
+    def __init__(self, sync: Callable[[str], Awaitable[Dict[str, Any]]], broker: EventBroker, delay: float):
+        self._sync = sync
+        self._broker = broker
+        self._delay = delay
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._dirty: Set[str] = set()
+        self.notifications = 0
+        self.syncs = 0
+
+    def notify(self, user_id: str) -> None:
+        self.notifications += 1
+        if user_id in self._tasks:
+            self._dirty.add(user_id)
+            return
+        task = asyncio.create_task(self._run(user_id))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def _run(self, user_id: str) -> None:
+        while True:
+            await asyncio.sleep(self._delay)
+            self._dirty.discard(user_id)
+            try:
+                result = await self._sync(user_id)
+                self.syncs += 1
+                self._publish(user_id, result)
+            except Exception:
+                logger.exception("Push-triggered sync failed for user %s", user_id)
+            if user_id not in self._dirty:
+                return
+
+    def _publish(self, user_id: str, result: Dict[str, Any]) -> None:
+        if result.get("mode") == "full":
+            self._broker.publish(user_id, {"type": "resync", "historyId": result.get("history_id")})
+            return
+        if result.get("added"):
+            self._broker.publish(user_id, {"type": "messagesAdded", "ids": result["added"],
+                                           "historyId": result.get("history_id")})
+        if result.get("deleted"):
+            self._broker.publish(user_id, {"type": "messagesDeleted", "ids": result["deleted"],
+                                           "historyId": result.get("history_id")})
+        if result.get("relabeled"):
+            self._broker.publish(user_id, {"type": "labelsChanged", "count": result["relabeled"],
+                                           "historyId": result.get("history_id")})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"notifications": self.notifications, "syncs": self.syncs, "pending": len(self._tasks)}
@@ -0,0 +1,335 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar, Union
+
+from config.settings import settings
+from routes.gmail.errors import CircuitOpenError, GmailApiError, is_retryable
+from tools import executor
+
+T = TypeVar("T")
+
+# Gmail quota units per method (https://developers.google.com/gmail/api/reference/quota)
+QUOTA_UNITS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.attachments.get": 5,
+    "messages.batchModify": 50,
+    "messages.batchDelete": 50,
+    "history.list": 2,
+    "getProfile": 1,
+    "watch": 100,
+    "stop": 50,
+}
+
+# share of a user's bucket a background call takes at a time
+BACKGROUND_INSTALMENT = 0.1
+
+
+class TokenBucket:
+    """Async token bucket; waiters are served in FIFO order.
+
+    A charge larger than the bucket is admitted once the bucket is full and leaves it in debt,
+    so later callers wait for the refill.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+    async def acquire(self, cost: float) -> float:
+        """Take `cost` tokens, waiting if needed; returns the seconds spent waiting."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= min(cost, self.capacity):
+                    self._tokens -= cost
+                    return waited
+                delay = (min(cost, self.capacity) - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class CircuitBreaker:
+    """Per-user breaker: opens after consecutive failures, lets one trial call through after a cooldown.
+
+    The caller that gets the trial (`check` returned True) must end it with `record_success`,
+    `record_failure` or, when the call ended without saying anything about Gmail (cancelled,
+    rejected locally), `release_trial`; otherwise the breaker stays half-open with a trial
+    that never finishes.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self._cooldown else "open"
+
+    @property
+    def idle(self) -> bool:
+        return self._opened_at is None and self._failures == 0
+
+    def check(self, user_id: str) -> bool:
+        """Raise CircuitOpenError if calls are paused; returns True if the caller holds the trial."""
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            remaining = self._cooldown - (time.monotonic() - self._opened_at)
+            raise CircuitOpenError(user_id, max(remaining, 1.0))
+        if state == "half_open":
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """End a trial without an outcome; the next call becomes the trial."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self._failures >= self._threshold:
+            self._opened_at = time.monotonic()
+
+
+class GmailRateLimiter:
+    """Shared limiter charging every Gmail call its quota-unit cost.
+
+    Calls wait on a per-project and a per-user token bucket instead of failing, retry
+    retryable errors with exponential backoff and full jitter, and go through a per-user
+    circuit breaker.
+    """
+
+    def __init__(self):
+        # every process has its own bucket, so each gets its share of the project's quota
+        project_rate = settings.GMAIL_PROJECT_QUOTA_PER_SECOND / max(1, settings.GMAIL_PROJECT_QUOTA_SHARES)
+        self._project = TokenBucket(project_rate, project_rate)
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self.metrics: Dict[str, Any] = {
+            "calls": defaultdict(int),
+            "units": defaultdict(int),
+            "throttled": 0,
+            "throttle_wait_seconds": 0.0,
+            "retries": defaultdict(int),
+            "failures": defaultdict(int),
+            "circuit_rejections": 0,
+        }
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            rate = settings.GMAIL_USER_QUOTA_PER_SECOND
+            bucket = TokenBucket(rate, rate)
+            self._users[user_id] = bucket
+            # drop idle buckets of other users once the table grows
+            while len(self._users) > settings.GMAIL_RATE_LIMITER_MAX_USERS:
+                oldest, oldest_bucket = next(iter(self._users.items()))
+                if not oldest_bucket.idle:
+                    break
+                del self._users[oldest]
+        self._users.move_to_end(user_id)
+        return bucket
+
+    def _breaker(self, user_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(user_id)
+        if breaker is None:
+            breaker = CircuitBreaker(settings.GMAIL_BREAKER_THRESHOLD, settings.GMAIL_BREAKER_COOLDOWN)
+            self._breakers[user_id] = breaker
+            # like the buckets, drop breakers of other users that hold no state once the table grows
+            while len(self._breakers) > settings.GMAIL_RATE_LIMITER_MAX_USERS:
+                oldest, oldest_breaker = next(iter(self._breakers.items()))
+                if not oldest_breaker.idle:
+                    break
+                del self._breakers[oldest]
+        self._breakers.move_to_end(user_id)
+        return breaker
+
+    def check(self, user_id: str) -> bool:
+        """Raise CircuitOpenError while the user's breaker is open; True if this call is the trial."""
+        try:
+            return self._breaker(user_id).check(user_id)
+        except CircuitOpenError:
+            self.metrics["circuit_rejections"] += 1
+            raise
+
+    async def throttle(self, user_id: str, method: str, units: int) -> None:
+        waited = await self._project.acquire(units)
+        bucket = self._user_bucket(user_id)
+        if executor.current_lane() == executor.BACKGROUND:
+            # pay large background charges (sync batches) in small instalments, so the user's
+            # own requests queued meanwhile are served between them instead of after the whole
+            # debt
+            remaining = units
+            while remaining > 0:
+                step = min(remaining, bucket.capacity * BACKGROUND_INSTALMENT)
+                waited += await bucket.acquire(step)
+                remaining -= step
+        else:
+            waited += await bucket.acquire(units)
+        self.metrics["calls"][method] += 1
+        self.metrics["units"][method] += units
+        if waited:
+            self.metrics["throttled"] += 1
+            self.metrics["throttle_wait_seconds"] += waited
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+        delay = random.uniform(0, min(settings.GMAIL_RETRY_MAX_DELAY, settings.GMAIL_RETRY_BASE_DELAY * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def record(self, user_id: str, success: bool) -> None:
+        if success:
+            self._breaker(user_id).record_success()
+        else:
+            self._breaker(user_id).record_failure()
+
+    def release(self, user_id: str) -> None:
+        breaker = self._breakers.get(user_id)
+        if breaker is not None:
+            breaker.release_trial()
+
+    async def call(self, user_id: str, method: str, fn: Callable[[], Awaitable[T]], units: Optional[int] = None) -> T:
+        trial = self.check(user_id)
+        units = units if units is not None else QUOTA_UNITS.get(method, 5)
+        attempt = 0
+        try:
+            while True:
+                await self.throttle(user_id, method, units)
+                try:
+                    result = await fn()
+                except GmailApiError as exc:
+                    if not is_retryable(exc):
+                        # a client error (404, 400...) says nothing about Gmail's health
+                        self.record(user_id, True)
+                        raise
+                    if attempt >= settings.GMAIL_RETRY_MAX_ATTEMPTS:
+                        self.metrics["failures"][method] += 1
+                        self.record(user_id, False)
+                        raise
+                    self.metrics["retries"][method] += 1
+                    await asyncio.sleep(self.backoff(attempt, exc.retry_after))
+                    attempt += 1
+                    continue
+                self.record(user_id, True)
+                return result
+        finally:
+            # cancelled, or failed without a Gmail answer (e.g. ExecutorSaturated): no outcome to record
+            if trial:
+                self.release(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        breakers = {user_id: b.state for user_id, b in self._breakers.items() if b.state != "closed"}
+        return {
+            **{k: dict(v) if isinstance(v, defaultdict) else v for k, v in self.metrics.items()},
+            "open_breakers": breakers,
+            "tracked_users": len(self._users),
+        }
+
+
+class RateLimitedGmailClient:
+    """Wraps a Gmail client so every call goes through the shared GmailRateLimiter."""
+
+    def __init__(self, client, limiter: GmailRateLimiter, user_id: str):
+        self._client = client
+        self._limiter = limiter
+        self._user_id = user_id
+
+    async def _call(self, method: str, fn: Callable[[], Awaitable[T]], units: Optional[int] = None) -> T:
+        with executor.user_scope(self._user_id):
+            return await self._limiter.call(self._user_id, method, fn, units)
+
+    async def list_messages(self, **params) -> Dict[str, Any]:
+        return await self._call("messages.list", lambda: self._client.list_messages(**params))
+
+    async def get_message(self, message_id: str, **params) -> Dict[str, Any]:
+        return await self._call("messages.get", lambda: self._client.get_message(message_id, **params))
+
+    async def get_messages(self, message_ids: List[str], **params) -> List[Union[Dict[str, Any], GmailApiError]]:
+        """Batched fetch; items that failed with a retryable error are retried with backoff."""
+        limiter = self._limiter
+        trial = limiter.check(self._user_id)
+        results: List[Union[Dict[str, Any], GmailApiError]] = [None] * len(message_ids)
+        pending = list(range(len(message_ids)))
+        attempt = 0
+        try:
+            while pending:
+                await limiter.throttle(self._user_id, "messages.get", QUOTA_UNITS["messages.get"] * len(pending))
+                try:
+                    with executor.user_scope(self._user_id):
+                        fetched = await self._client.get_messages([message_ids[i] for i in pending], **params)
+                except GmailApiError as exc:
+                    if not is_retryable(exc):
+                        limiter.record(self._user_id, True)
+                        raise
+                    # the whole batch call failed; treat it as a failure of every item
+                    fetched = [exc] * len(pending)
+                retry = []
+                for index, item in zip(pending, fetched):
+                    results[index] = item
+                    if isinstance(item, GmailApiError) and is_retryable(item):
+                        retry.append(index)
+                if not retry or attempt >= settings.GMAIL_RETRY_MAX_ATTEMPTS:
+                    if retry:
+                        limiter.metrics["failures"]["messages.get"] += len(retry)
+                    limiter.record(self._user_id, len(retry) < len(pending))
+                    break
+                limiter.metrics["retries"]["messages.get"] += len(retry)
+                retry_after = max((results[i].retry_after or 0.0) for i in retry)
+                await asyncio.sleep(limiter.backoff(attempt, retry_after))
+                pending = retry
+                attempt += 1
+        finally:
+            if trial:
+                limiter.release(self._user_id)
+        return results
+
+    async def get_attachment(self, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        return await self._call("messages.attachments.get",
+                                lambda: self._client.get_attachment(message_id, attachment_id))
+
+    async def list_history(self, **params) -> Dict[str, Any]:
+        return await self._call("history.list", lambda: self._client.list_history(**params))
+
+    async def get_profile(self) -> Dict[str, Any]:
+        return await self._call("getProfile", lambda: self._client.get_profile())
+
+    async def watch(self, topic_name: str, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        return await self._call("watch", lambda: self._client.watch(topic_name, label_ids))
+
+    async def stop(self) -> None:
+        return await self._call("stop", lambda: self._client.stop())
+
+    async def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                           remove_label_ids: Optional[List[str]] = None) -> None:
+        return await self._call("messages.batchModify",
+                                lambda: self._client.batch_modify(message_ids, add_label_ids, remove_label_ids))
+
+    async def batch_delete(self, message_ids: List[str]) -> None:
+        return await self._call("messages.batchDelete", lambda: self._client.batch_delete(message_ids))
@@ -1,46 +1,410 @@
-from typing import Optional, Dict, Any, List
+import asyncio
+import re
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, AsyncIterator
+from config.settings import settings
 from models.user_credentials import UserCredentials
-from db.mongo_connector import MongoConnector
+from db.mongo_connector import ASCENDING, DESCENDING, MongoConnector
+from routes.gmail.instrumentation import REPO_SECONDS
+from tools.metrics import instrument
 
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
 
+
+COMBINED_LAYOUT = "combined"
+
+
+@instrument(REPO_SECONDS)
 class GmailRepo:
     """Repository for Gmail-related persistence operations.
 
-    Uses the shared MongoConnector to obtain the DB instance.
+    Uses the shared MongoConnector to obtain the DB instance unless one is injected.
+
+    With `settings.GMAIL_USER_LAYOUT = "split"` (default) credentials and profile live in
+    `gmail_credentials` and `gmail_user_info`. With "combined" both are sub-documents of one
+    `gmail_users` document, so a user is read or written in a single round trip.
     """
 
-    def __init__(self):
-        self._db = MongoConnector().get_db()
+    def __init__(self, db: Optional["AsyncIOMotorDatabase"] = None):
+        self._db = db if db is not None else MongoConnector().get_db()
+        self._combined = settings.GMAIL_USER_LAYOUT == COMBINED_LAYOUT
         self._credentials = self._db.get_collection("gmail_credentials")
         self._user_info = self._db.get_collection("gmail_user_info")
+        self._users = self._db.get_collection("gmail_users")
+        self._messages = self._db.get_collection("gmail_messages")
+        self._sync_state = self._db.get_collection("gmail_sync_state")
+        self._message_cache = self._db.get_collection("gmail_message_cache")
+        self._search = self._db.get_collection("gmail_search_index")
+        self._watches = self._db.get_collection("gmail_watches")
+        self._rules = self._db.get_collection("gmail_rules")
+        self._jobs = self._db.get_collection("gmail_jobs")
+        self._schedule = self._db.get_collection("gmail_schedule")
+        self._job_ids = self._db.get_collection("gmail_job_ids")
 
     async def save_credentials(self, user_id: str, creds: UserCredentials) -> None:
         doc = creds.dict()
+        if self._combined:
+            await self._users.update_one({"user_id": user_id}, {"$set": {"credentials": doc}}, upsert=True)
+            return
         doc.update({"user_id": user_id})
         await self._credentials.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
 
     async def get_credentials(self, user_id: str) -> Optional[Dict[str, Any]]:
+        if self._combined:
+            doc = await self._users.find_one({"user_id": user_id, "credentials": {"$exists": True}},
+                                             {'_id': 0, 'user_id': 1, 'credentials': 1})
+            return {**doc['credentials'], "user_id": user_id} if doc else None
         return await self._credentials.find_one({"user_id": user_id}, {'_id': 0})
 
+    async def get_credentials_many(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return credentials for several users in one query, keyed by user_id (missing users omitted)."""
+        if self._combined:
+            cursor = self._users.find({"user_id": {"$in": user_ids}, "credentials": {"$exists": True}},
+                                      {'_id': 0, 'user_id': 1, 'credentials': 1})
+            return {d['user_id']: {**d['credentials'], "user_id": d['user_id']} async for d in cursor}
+        cursor = self._credentials.find({"user_id": {"$in": user_ids}}, {'_id': 0})
+        return {d['user_id']: d async for d in cursor}
+
+    async def bulk_save_credentials(self, creds_by_user: Dict[str, UserCredentials]) -> None:
+        """Upsert credentials for many users with a single bulk_write."""
+        if not creds_by_user:
+            return
+        from pymongo import UpdateOne
+
+        if self._combined:
+            ops = [UpdateOne({"user_id": user_id}, {"$set": {"credentials": creds.dict()}}, upsert=True)
+                   for user_id, creds in creds_by_user.items()]
+            await self._users.bulk_write(ops, ordered=False)
+            return
+        ops = [UpdateOne({"user_id": user_id}, {"$set": {**creds.dict(), "user_id": user_id}}, upsert=True)
+               for user_id, creds in creds_by_user.items()]
+        await self._credentials.bulk_write(ops, ordered=False)
+
     async def delete_credentials(self, user_id: str) -> bool:
+        if self._combined:
+            res = await self._users.update_one({"user_id": user_id, "credentials": {"$exists": True}},
+                                               {"$unset": {"credentials": ""}})
+            return res.modified_count > 0
         res = await self._credentials.delete_one({"user_id": user_id})
         return res.deleted_count > 0
 
     async def save_user_info(self, user_id: str, info: Dict[str, Any]) -> None:
+        if self._combined:
+            await self._users.update_one({"user_id": user_id}, {"$set": {"info": info}}, upsert=True)
+            return
         doc = {"user_id": user_id, "info": info}
         await self._user_info.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
 
     async def get_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
-        doc = await self._user_info.find_one({"user_id": user_id}, {'_id': 0})
+        collection = self._users if self._combined else self._user_info
+        doc = await collection.find_one({"user_id": user_id}, {'_id': 0, 'info': 1})
         return doc.get('info') if doc else None
 
     async def delete_user_info(self, user_id: str) -> bool:
+        if self._combined:
+            res = await self._users.update_one({"user_id": user_id, "info": {"$exists": True}},
+                                               {"$unset": {"info": ""}})
+            return res.modified_count > 0
         res = await self._user_info.delete_one({"user_id": user_id})
         return res.deleted_count > 0
 
+    async def save_user(self, user_id: str, creds: UserCredentials, info: Optional[Dict[str, Any]] = None) -> None:
+        """Store credentials and profile together (one round trip with the combined layout)."""
+        if self._combined:
+            doc: Dict[str, Any] = {"credentials": creds.dict()}
+            if info:
+                doc["info"] = info
+            await self._users.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
+            return
+        await asyncio.gather(self.save_credentials(user_id, creds),
+                             self.save_user_info(user_id, info) if info else asyncio.sleep(0))
+
+    async def delete_user(self, user_id: str) -> bool:
+        """Delete credentials and profile; returns whether credentials existed."""
+        if self._combined:
+            res = await self._users.find_one_and_delete({"user_id": user_id}, {'_id': 0, 'credentials': 1})
+            return bool(res and res.get('credentials'))
+        creds_deleted, _ = await asyncio.gather(self.delete_credentials(user_id), self.delete_user_info(user_id))
+        return creds_deleted
+
+    async def iter_user_ids(self, batch_size: int = 1000) -> AsyncIterator[str]:
+        """Stream the ids of users with credentials without loading them all into memory."""
+        if self._combined:
+            cursor = self._users.find({"credentials": {"$exists": True}}, {'user_id': 1, '_id': 0})
+        else:
+            cursor = self._credentials.find({}, {'user_id': 1, '_id': 0})
+        async for d in cursor.batch_size(batch_size):
+            yield d['user_id']
+
     async def list_user_ids(self) -> List[str]:
-        cursor = self._credentials.find({}, {'user_id': 1, '_id': 0})
-        ids = []
-        async for d in cursor:
-            ids.append(d['user_id'])
-        return ids
+        return [user_id async for user_id in self.iter_user_ids()]
+
+    # Local message mirror
+
+    async def upsert_messages(self, user_id: str, messages: List[Dict[str, Any]]) -> None:
+        if not messages:
+            return
+        from pymongo import UpdateOne
+
+        ops = [
+            UpdateOne({"user_id": user_id, "id": m["id"]}, {"$set": {**m, "user_id": user_id}}, upsert=True)
+            for m in messages
+        ]
+        await self._messages.bulk_write(ops, ordered=False)
+
+    async def set_message_labels(self, user_id: str, labels: Dict[str, List[str]]) -> None:
+        if not labels:
+            return
+        from pymongo import UpdateOne
+
+        ops = [
+            UpdateOne({"user_id": user_id, "id": message_id}, {"$set": {"labelIds": label_ids}})
+            for message_id, label_ids in labels.items()
+        ]
+        await self._messages.bulk_write(ops, ordered=False)
+
+    async def delete_messages(self, user_id: str, message_ids: Optional[List[str]] = None) -> int:
+        """Delete the given mirrored messages, or all of the user's messages when ids is None."""
+        query: Dict[str, Any] = {"user_id": user_id}
+        if message_ids is not None:
+            query["id"] = {"$in": message_ids}
+        res = await self._messages.delete_many(query)
+        return res.deleted_count
+
+    async def prune_messages(self, user_id: str, generation: str, keep: Optional[List[str]] = None) -> int:
+        """Delete mirrored messages not refreshed by the full sync identified by `generation`,
+        except the ids in `keep`."""
+        query: Dict[str, Any] = {"user_id": user_id, "sync_generation": {"$ne": generation}}
+        if keep:
+            query["id"] = {"$nin": keep}
+        res = await self._messages.delete_many(query)
+        return res.deleted_count
+
+    async def list_messages(self, user_id: str, limit: int = 10,
+                            label_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if label_ids:
+            query["labelIds"] = {"$all": label_ids}
+        cursor = self._messages.find(query, {'_id': 0, 'user_id': 0, 'sync_generation': 0}).sort("internalDate", DESCENDING).limit(limit)
+        return [d async for d in cursor]
+
+    async def get_message_labels(self, user_id: str, message_id: str) -> Optional[List[str]]:
+        doc = await self._messages.find_one({"user_id": user_id, "id": message_id}, {'_id': 0, 'labelIds': 1})
+        return doc.get('labelIds') if doc else None
+
+    async def get_sync_state(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._sync_state.find_one({"user_id": user_id}, {'_id': 0})
+
+    async def save_sync_state(self, user_id: str, state: Dict[str, Any]) -> None:
+        doc = dict(state)
+        doc.update({"user_id": user_id})
+        await self._sync_state.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
+
+    async def delete_sync_state(self, user_id: str) -> bool:
+        res = await self._sync_state.delete_one({"user_id": user_id})
+        return res.deleted_count > 0
+
+    # Message response cache (second tier behind the in-memory LRU)
+
+    async def get_cached_message(self, user_id: str, message_id: str, fmt: str) -> Optional[Dict[str, Any]]:
+        return await self._message_cache.find_one({"user_id": user_id, "message_id": message_id, "format": fmt},
+                                                  {'_id': 0})
+
+    async def save_cached_message(self, user_id: str, message_id: str, fmt: str, body: bytes, digest: str,
+                                  labels: List[str], labels_checked: datetime) -> None:
+        key = {"user_id": user_id, "message_id": message_id, "format": fmt}
+        doc = {**key, "body": body, "digest": digest, "labelIds": labels, "labels_checked": labels_checked}
+        await self._message_cache.update_one(key, {"$set": doc}, upsert=True)
+
+    async def set_cached_message_labels(self, user_id: str, message_id: str, fmt: str, labels: List[str],
+                                        labels_checked: datetime) -> None:
+        await self._message_cache.update_one({"user_id": user_id, "message_id": message_id, "format": fmt},
+                                             {"$set": {"labelIds": labels, "labels_checked": labels_checked}})
+
+    async def delete_cached_messages(self, user_id: str, message_ids: Optional[List[str]] = None) -> int:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if message_ids is not None:
+            query["message_id"] = {"$in": message_ids}
+        res = await self._message_cache.delete_many(query)
+        return res.deleted_count
+
+    # Search index
+
+    async def upsert_search_docs(self, user_id: str, docs: List[Dict[str, Any]]) -> None:
+        if not docs:
+            return
+        from pymongo import UpdateOne
+
+        # insert time orders documents that have no internalDate (indexed from listings)
+        indexed_at = int(time.time() * 1000)
+        ops = [UpdateOne({"user_id": user_id, "id": d["id"]},
+                         {"$set": {**d, "user_id": user_id}, "$setOnInsert": {"indexed_at": indexed_at}}, upsert=True)
+               for d in docs]
+        await self._search.bulk_write(ops, ordered=False)
+
+    async def delete_search_docs(self, user_id: str, message_ids: Optional[List[str]] = None) -> int:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if message_ids is not None:
+            query["id"] = {"$in": message_ids}
+        res = await self._search.delete_many(query)
+        return res.deleted_count
+
+    async def prune_search_docs(self, user_id: str, generation: str, keep: Optional[List[str]] = None) -> int:
+        """Delete search documents not refreshed by the full sync identified by `generation`,
+        except the ids in `keep`."""
+        query: Dict[str, Any] = {"user_id": user_id, "sync_generation": {"$ne": generation}}
+        if keep:
+            query["id"] = {"$nin": keep}
+        res = await self._search.delete_many(query)
+        return res.deleted_count
+
+    async def find_search_candidates(self, user_id: str, terms: List[str], limit: int) -> List[Dict[str, Any]]:
+        """Documents whose tokens prefix-match every term (anchored regexes use the tokens index).
+
+        The `limit` kept are those with the most terms matched as whole tokens, newest first
+        (by internalDate, else by when they were indexed).
+        """
+        query = {"user_id": user_id,
+                 "$and": [{"tokens": {"$regex": "^" + re.escape(term)}} for term in terms]}
+        pipeline = [
+            {"$match": query},
+            {"$addFields": {"matched": {"$size": {"$setIntersection": ["$tokens", terms]}},
+                            "recency": {"$ifNull": ["$internalDate", "$indexed_at"]}}},
+            {"$sort": {"matched": DESCENDING, "recency": DESCENDING}},
+            {"$limit": limit},
+            {"$project": {'_id': 0, 'user_id': 0, 'tokens': 0, 'sync_generation': 0, 'indexed_at': 0,
+                          'matched': 0, 'recency': 0}},
+        ]
+        return [d async for d in self._search.aggregate(pipeline)]
+
+    # Background scheduler
+
+    async def schedule_users(self, first_runs: Dict[str, Any], now) -> None:
+        """Add users to the schedule (first run at the given time); scheduled users are left as they are."""
+        if not first_runs:
+            return
+        from pymongo import UpdateOne
+
+        ops = [UpdateOne({"user_id": user_id},
+                         {"$setOnInsert": {"next_run": next_run, "running": False, "claim": None, "runs": 0,
+                                           "failures": 0, "first_seen": now, "lag_since": now,
+                                           "last_started": None, "last_finished": None, "last_success": None,
+                                           "last_error": None}}, upsert=True)
+               for user_id, next_run in first_runs.items()]
+        await self._schedule.bulk_write(ops, ordered=False)
+
+    async def claim_due_user(self, now, lease_until, claim: str) -> Optional[Dict[str, Any]]:
+        """Claim the most overdue user, moving its next_run to `lease_until` so no one else runs it meanwhile."""
+        from pymongo import ReturnDocument
+
+        return await self._schedule.find_one_and_update(
+            {"next_run": {"$lte": now}},
+            {"$set": {"next_run": lease_until, "running": True, "claim": claim, "last_started": now}},
+            projection={'_id': 0}, sort=[("next_run", ASCENDING)], return_document=ReturnDocument.AFTER,
+        )
+
+    async def update_scheduled_run(self, user_id: str, claim: str, fields: Dict[str, Any],
+                                   inc: Optional[Dict[str, int]] = None) -> bool:
+        """Update a run this process still holds the claim of (renewal or completion)."""
+        update: Dict[str, Any] = {"$set": fields}
+        if inc:
+            update["$inc"] = inc
+        res = await self._schedule.update_one({"user_id": user_id, "claim": claim}, update)
+        return res.matched_count > 0
+
+    async def get_schedule(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._schedule.find_one({"user_id": user_id}, {'_id': 0, 'claim': 0})
+
+    async def schedule_summary(self, now, top: int) -> Dict[str, Any]:
+        most_lagging = self._schedule.find({}, {'_id': 0, 'claim': 0}).sort("lag_since", ASCENDING).limit(top)
+        return {
+            "users": await self._schedule.count_documents({}),
+            "due": await self._schedule.count_documents({"next_run": {"$lte": now}}),
+            "running": await self._schedule.count_documents({"running": True, "next_run": {"$gt": now}}),
+            "failing": await self._schedule.count_documents({"last_error": {"$ne": None}}),
+            "most_lagging": [d async for d in most_lagging],
+        }
+
+    async def delete_schedule(self, user_id: str) -> None:
+        await self._schedule.delete_one({"user_id": user_id})
+
+    # Push notification watches
+
+    async def save_watch(self, user_id: str, watch: Dict[str, Any]) -> None:
+        doc = dict(watch)
+        doc.update({"user_id": user_id})
+        await self._watches.update_one({"user_id": user_id}, {"$set": doc}, upsert=True)
+
+    async def get_watch(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self._watches.find_one({"user_id": user_id}, {'_id': 0})
+
+    async def delete_watch(self, user_id: str) -> bool:
+        res = await self._watches.delete_one({"user_id": user_id})
+        return res.deleted_count > 0
+
+    async def find_user_id_by_email(self, email: str) -> Optional[str]:
+        doc = await self._watches.find_one({"email": email.lower()}, {'_id': 0, 'user_id': 1})
+        return doc.get('user_id') if doc else None
+
+    async def list_rules(self, user_id: str) -> List[Dict[str, Any]]:
+        """All mail rules of the user, oldest first (the order they are applied in)."""
+        cursor = self._rules.find({"user_id": user_id}, {'_id': 0, 'user_id': 0}).sort("created_at", ASCENDING)
+        return [d async for d in cursor]
+
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        return await self._rules.find_one({"user_id": user_id, "id": rule_id}, {'_id': 0, 'user_id': 0})
+
+    async def save_rule(self, user_id: str, rule_id: str, rule: Dict[str, Any]) -> None:
+        """Upsert a rule; `rule['updated_at']` also becomes `created_at` on insert."""
+        doc = dict(rule)
+        doc.update({"user_id": user_id, "id": rule_id})
+        await self._rules.update_one({"user_id": user_id, "id": rule_id},
+                                     {"$set": doc, "$setOnInsert": {"created_at": doc['updated_at']}}, upsert=True)
+
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        res = await self._rules.delete_one({"user_id": user_id, "id": rule_id})
+        return res.deleted_count > 0
+
+    async def delete_rules(self, user_id: str) -> None:
+        await self._rules.delete_many({"user_id": user_id})
+
+    async def save_job(self, job: Dict[str, Any]) -> None:
+        await self._jobs.update_one({"id": job['id']}, {"$set": job}, upsert=True)
+
+    async def get_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._jobs.find_one({"user_id": user_id, "id": job_id}, {'_id': 0})
+
+    async def update_job(self, job_id: str, fields: Dict[str, Any], statuses: Optional[List[str]] = None) -> bool:
+        """Set fields on a job, only if its status is one of `statuses` (when given)."""
+        query: Dict[str, Any] = {"id": job_id}
+        if statuses:
+            query["status"] = {"$in": statuses}
+        res = await self._jobs.update_one(query, {"$set": fields})
+        return res.matched_count > 0
+
+    async def claim_job(self, job_id: str, now, lease_until, statuses: List[str]) -> bool:
+        """Mark a job running for this process unless another one holds an unexpired lease."""
+        res = await self._jobs.update_one(
+            {"id": job_id, "status": {"$in": statuses},
+             "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"status": "running", "lease_until": lease_until, "updated_at": now, "error": None}},
+        )
+        return res.matched_count > 0
+
+    async def save_job_ids(self, user_id: str, job_id: str, seq: int, ids: List[str]) -> None:
+        await self._job_ids.update_one({"job_id": job_id, "seq": seq},
+                                       {"$set": {"user_id": user_id, "ids": ids}}, upsert=True)
+
+    async def get_job_ids(self, job_id: str, from_seq: int, limit: int) -> List[Dict[str, Any]]:
+        cursor = self._job_ids.find({"job_id": job_id, "seq": {"$gte": from_seq}}, {'_id': 0, 'seq': 1, 'ids': 1}) \
+            .sort("seq", ASCENDING).limit(limit)
+        return [d async for d in cursor]
+
+    async def delete_job_ids(self, job_id: str) -> None:
+        await self._job_ids.delete_many({"job_id": job_id})
+
+    async def delete_jobs(self, user_id: str) -> None:
+        await self._job_ids.delete_many({"user_id": user_id})
+        await self._jobs.delete_many({"user_id": user_id})
@@ -1,17 +1,52 @@
-from fastapi import APIRouter, HTTPException, Request, Response
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+import asyncio
 import json
+import math
+from functools import partial
+from typing import Callable, List, Optional
 
 from routes.gmail.service import GmailService
+from routes.gmail.errors import CircuitOpenError, GmailApiError
+from routes.gmail.message_cache import etag_matches
+from routes.gmail.push import parse_push_message
 from routes.gmail.repo import GmailRepo
+from models.mail_rule import MailRule
+from models.bulk_job import BulkJobRequest
 from fastapi import Depends
 from dependencies.db import get_gmail_repo
 from config.settings import settings
 from tools.oauth import handle_oauth_callback
+from tools.executor import ExecutorSaturated, get_executor
 
 router = APIRouter(prefix="/gmail", tags=["gmail"])
 
 
+def _gmail_error(e: Exception, detail: str) -> HTTPException:
+    """Map Gmail-side failures to HTTP errors; anything unexpected stays a 500."""
+    if isinstance(e, (CircuitOpenError, ExecutorSaturated)):
+        return HTTPException(status_code=503, detail=f"{detail}: {str(e)}",
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if isinstance(e, GmailApiError) and e.status in (404, 429):
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+        return HTTPException(status_code=e.status, detail=f"{detail}: {str(e)}", headers=headers)
+    return HTTPException(status_code=500, detail=f"{detail}: {str(e)}")
+
+
+class _CachedFileResponse(FileResponse):
+    """FileResponse for a pinned attachment cache file; unpins it once the response is done."""
+
+    def __init__(self, path, release: Callable[[], None], **kwargs):
+        super().__init__(path, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
 
 
 @router.get("/authorize")
@@ -34,36 +69,456 @@ async def oauth_callback(code: str, state: str, response: Response, scope: str =
         service = GmailService(repo=repo)
         return await handle_oauth_callback(service, code, scope, settings.GMAIL_REDIRECT_URI, response,
                                            settings.FRONT_URL, message="Authorization successful! You can now read emails.")
+    except ExecutorSaturated as e:
+        raise _gmail_error(e, "Authorization failed")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Authorization failed: {str(e)}")
 
 
 @router.get("/emails")
-async def get_emails(user_id: str = "user_123", max_results: int = 10, repo: GmailRepo = Depends(get_gmail_repo)):
+async def get_emails(user_id: str = "user_123", max_results: int = 10, source: str = "gmail",
+                     sync_now: bool = False, max_age: Optional[int] = None,
+                     page_token: Optional[str] = None, q: Optional[str] = None,
+                     label_ids: List[str] = Query(default=[]),
+                     repo: GmailRepo = Depends(get_gmail_repo)):
     """
     Step 3: Read user's emails using stored credentials
+
+    source=mirror serves the listing from the local message mirror; it is synced first when
+    older than max_age seconds or when sync_now is set. A mirror that was never synced starts
+    syncing in the background and the listing is served from Gmail meanwhile, marked
+    `"syncing": true`. For source=gmail, page_token/q/label_ids
+    are passed to Gmail and the response carries nextPageToken when more results exist.
     """
     service = GmailService(repo=repo)
     if not await service.has_user(user_id):
         raise HTTPException(status_code=401, detail="User not authorized. Please visit /gmail/authorize first.")
     try:
-        return await service.list_messages(user_id=user_id, max_results=max_results)
+        if source == "mirror":
+            return await service.list_local_messages(user_id=user_id, max_results=max_results,
+                                                     sync_now=sync_now, max_age=max_age)
+        return await service.list_messages(user_id=user_id, max_results=max_results, page_token=page_token,
+                                           q=q, label_ids=label_ids)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching emails: {str(e)}")
+        raise _gmail_error(e, "Error fetching emails")
+
+
+@router.get("/emails/stream")
+async def stream_emails(user_id: str = "user_123", format: str = "ndjson", page_size: int = 100,
+                        page_token: Optional[str] = None, q: Optional[str] = None,
+                        label_ids: List[str] = Query(default=[]), limit: Optional[int] = None,
+                        repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Stream the mailbox listing while walking Gmail pages
+
+    format=ndjson emits one email object per line and a {"nextPageToken": ...} line after each
+    page; format=sse emits `email` and `cursor` events. Pass the last cursor back as page_token
+    to resume. The stream ends with {"done": true} (ndjson) or an `end` event (sse).
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized. Please visit /gmail/authorize first.")
+
+    def _frame(event: str, data) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps(data) + "\n"
+
+    async def _rows():
+        try:
+            async for emails, next_page_token in service.iter_message_pages(
+                    user_id=user_id, page_size=page_size, page_token=page_token, q=q, label_ids=label_ids,
+                    limit=limit):
+                for email in emails:
+                    yield _frame("email", email)
+                yield _frame("cursor", {"nextPageToken": next_page_token})
+        except Exception as e:
+            yield _frame("error", {"error": f"Error fetching emails: {str(e)}"})
+            return
+        yield _frame("end", {"done": True})
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_rows(), media_type=media_type)
 
 
 @router.get("/email/{message_id}")
-async def get_email_content(message_id: str, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+async def get_email_content(message_id: str, request: Request, user_id: str = "user_123", format: str = "decoded",
+                            repo: GmailRepo = Depends(get_gmail_repo)):
     """
     Get full content of a specific email
+
+    format=decoded (default) returns decoded text/html bodies with attachments as references
+    (fetch them by attachmentId), format=raw parses the RFC 822 source instead, and
+    format=full returns Gmail's raw payload tree. Responses are cached and carry a strong ETag;
+    If-None-Match is answered with 304.
+    """
+    if format not in ("decoded", "raw", "full"):
+        raise HTTPException(status_code=400, detail="format must be 'decoded', 'raw' or 'full'")
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        content, etag = await service.get_cached_message(user_id=user_id, message_id=message_id, format=format)
+    except Exception as e:
+        raise _gmail_error(e, "Error fetching email")
+
+    headers = {"ETag": etag, "Cache-Control": settings.GMAIL_MESSAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+@router.get("/email/{message_id}/attachments/{attachment_id}")
+async def get_attachment(message_id: str, attachment_id: str, user_id: str = "user_123",
+                         filename: Optional[str] = None, mime_type: str = "application/octet-stream",
+                         repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Stream the decoded bytes of an attachment
+
+    Served in chunks from the on-disk attachment cache; only a cache miss costs a Gmail call.
+    filename and mime_type (from the message's attachment reference) set the response headers.
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        path = await service.get_attachment_file(user_id=user_id, message_id=message_id, attachment_id=attachment_id)
+    except Exception as e:
+        raise _gmail_error(e, "Error fetching attachment")
+    return _CachedFileResponse(path, partial(service.release_attachment_file, path), media_type=mime_type,
+                               filename=filename)
+
+
+@router.get("/search")
+async def search_emails(q: str, user_id: str = "user_123", limit: int = 20,
+                        repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Search listed and synced messages by sender, subject and snippet without calling Gmail
+
+    Terms are matched as prefixes; results are ranked by where the terms matched (subject,
+    then sender, then snippet) and recency.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    return await service.search(user_id=user_id, q=q, limit=limit)
+
+
+@router.post("/watch")
+async def watch_mailbox(user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Register (or renew) Gmail push notifications for the user
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        return await service.watch_mailbox(user_id=user_id)
+    except Exception as e:
+        raise _gmail_error(e, "Error registering watch")
+
+
+@router.delete("/watch")
+async def stop_watch(user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Stop Gmail push notifications for the user
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        await service.stop_watch(user_id=user_id)
+    except Exception as e:
+        raise _gmail_error(e, "Error stopping watch")
+    return {"message": "Watch stopped"}
+
+
+@router.post("/push", status_code=204)
+async def push_notification(request: Request, token: Optional[str] = None,
+                            repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Pub/Sub push webhook for Gmail notifications
+
+    Bursts of notifications for the same mailbox are coalesced into a single history fetch.
+    Always acknowledged (204) once parsed, so Pub/Sub does not redeliver.
+    """
+    if settings.GMAIL_PUSH_VERIFICATION_TOKEN and token != settings.GMAIL_PUSH_VERIFICATION_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid verification token")
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    parsed = parse_push_message(payload)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Malformed push message")
+    service = GmailService(repo=repo)
+    await service.handle_push(*parsed)
+    return Response(status_code=204)
+
+
+@router.get("/events")
+async def mailbox_events(user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Server-sent event stream of mailbox changes (messagesAdded, messagesDeleted, labelsChanged, resync)
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+
+    async def _events():
+        queue = service.subscribe_events(user_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            service.unsubscribe_events(user_id, queue)
+
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
+
+@router.post("/sync")
+async def sync_mailbox(user_id: str = "user_123", full: bool = False, repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Sync the local message mirror now (history delta, or a full resync with full=true)
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        return await service.sync_mailbox(user_id=user_id, full=full)
+    except Exception as e:
+        raise _gmail_error(e, "Error syncing mailbox")
+
+
+@router.get("/rules")
+async def list_rules(user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    List the user's mail rules in the order they are applied
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    return {"rules": await service.list_rules(user_id)}
+
+
+@router.post("/rules", status_code=201)
+async def create_rule(rule: MailRule, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Create a rule: when all conditions match a message, apply the actions (labels, archive, mark read)
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        return await service.save_rule(user_id, rule)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put("/rules/{rule_id}")
+async def update_rule(rule_id: str, rule: MailRule, user_id: str = "user_123",
+                      repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Replace an existing rule
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    if await service.get_rule(user_id, rule_id) is None:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    try:
+        return await service.save_rule(user_id, rule, rule_id=rule_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/rules/{rule_id}")
+async def delete_rule(rule_id: str, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Delete a rule
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    if not await service.delete_rule(user_id, rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"message": "Rule deleted"}
+
+
+@router.post("/rules/apply")
+async def apply_rules(user_id: str = "user_123", source: str = "mirror", max_results: int = 1000,
+                      q: Optional[str] = None, dry_run: bool = False, repo: GmailRepo = Depends(get_gmail_repo)):
     """
+    Run the user's rules over existing mail (local mirror or a Gmail listing) and apply the
+    label changes with batched modify calls; dry_run only reports them
+    """
+    if source not in ("mirror", "gmail"):
+        raise HTTPException(status_code=400, detail="source must be 'mirror' or 'gmail'")
     service = GmailService(repo=repo)
     if not await service.has_user(user_id):
         raise HTTPException(status_code=401, detail="User not authorized")
     try:
-        return await service.get_message(user_id=user_id, message_id=message_id)
+        return await service.apply_rules(user_id, source=source, max_results=max_results, q=q, dry_run=dry_run)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching email: {str(e)}")
+        raise _gmail_error(e, "Error applying rules")
+
+
+@router.post("/messages/bulk", status_code=202)
+async def submit_bulk_job(request: BulkJobRequest, user_id: str = "user_123",
+                          repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Modify labels of, trash or delete every message matching a query (or an id list) in the
+    background with batched calls; poll the returned job for progress
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    try:
+        return await service.submit_bulk_job(user_id, request)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/messages/bulk/{job_id}")
+async def get_bulk_job(job_id: str, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Status and progress of a bulk job
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    job = await service.get_bulk_job(user_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/messages/bulk/{job_id}/resume")
+async def resume_bulk_job(job_id: str, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Continue an interrupted or failed bulk job from where it stopped
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    if await service.get_bulk_job(user_id, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await service.resume_bulk_job(user_id, job_id):
+        raise HTTPException(status_code=409, detail="Job is finished or still running")
+    return await service.get_bulk_job(user_id, job_id)
+
+
+@router.delete("/messages/bulk/{job_id}")
+async def cancel_bulk_job(job_id: str, user_id: str = "user_123", repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Cancel a queued, running or failed bulk job; calls already made are not undone
+    """
+    service = GmailService(repo=repo)
+    if not await service.has_user(user_id):
+        raise HTTPException(status_code=401, detail="User not authorized")
+    if await service.get_bulk_job(user_id, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await service.cancel_bulk_job(user_id, job_id):
+        raise HTTPException(status_code=409, detail="Job is already finished")
+    return {"message": "Job cancelled"}
+
+
+@router.get("/admin/scheduler")
+async def scheduler_summary(request: Request):
+    """
+    Background scheduler overview: scheduled, due, running and failing users and the most lagging ones
+    """
+    scheduler = request.app.state.scheduler
+    if scheduler is None:
+        raise HTTPException(status_code=404, detail="Scheduler is not enabled")
+    return await scheduler.summary()
+
+
+@router.get("/admin/scheduler/{user_id}")
+async def scheduler_user_status(user_id: str, request: Request):
+    """
+    Scheduler status and lag of a single user
+    """
+    scheduler = request.app.state.scheduler
+    if scheduler is None:
+        raise HTTPException(status_code=404, detail="Scheduler is not enabled")
+    status = await scheduler.user_status(user_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="User not scheduled")
+    return status
+
+
+@router.get("/admin/client-cache")
+async def client_cache_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Hit/miss/eviction counters of the per-user Gmail client cache
+    """
+    service = GmailService(repo=repo)
+    return service.client_cache_stats()
+
+
+@router.get("/admin/executor")
+async def executor_stats():
+    """
+    In-flight, completed and rejected blocking calls per executor lane
+    """
+    return get_executor().stats()
+
+
+@router.get("/admin/quota")
+async def quota_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Quota units charged, throttle waits, retries and open circuit breakers
+    """
+    service = GmailService(repo=repo)
+    return service.quota_stats()
+
+
+@router.get("/admin/message-cache")
+async def message_cache_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Size and hit/miss/eviction counters of the in-memory message cache
+    """
+    service = GmailService(repo=repo)
+    return service.message_cache_stats()
+
+
+@router.get("/admin/attachment-cache")
+async def attachment_cache_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Size, hit/miss and eviction counters of the on-disk attachment cache
+    """
+    service = GmailService(repo=repo)
+    return service.attachment_cache_stats()
+
+
+@router.get("/admin/push")
+async def push_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Push notifications received versus history syncs they triggered
+    """
+    service = GmailService(repo=repo)
+    return service.push_stats()
+
+
+@router.get("/admin/credential-cache")
+async def credential_cache_stats(repo: GmailRepo = Depends(get_gmail_repo)):
+    """
+    Hit/miss and token refresh counters of the in-process credential cache
+    """
+    service = GmailService(repo=repo)
+    return service.credential_cache_stats()
 
 
 @router.delete("/revoke")
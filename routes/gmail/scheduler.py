@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config.settings import settings
+from routes.gmail.repo import GmailRepo
+from tools.time_utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+ENROLL_BATCH = 1000
+
+
+def schedule_view(doc: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """A user's schedule document plus `lag`: seconds since their work last succeeded (or since enrollment)."""
+    view = dict(doc)
+    view["lag"] = round((now - doc['lag_since']).total_seconds(), 3)
+    return view
+
+
+class SyncScheduler:
+    """Background scheduler running per-user Gmail work for every user.
+
+    Scheduling state lives in the `gmail_schedule` collection, one document per user with an
+    indexed `next_run`. Each of `concurrency` workers claims the most overdue user with one
+    atomic update that also moves its `next_run` to a lease expiry (renewed while the work
+    runs), so only due users are read, a user never runs twice at once, any number of processes
+    can run a scheduler against the same database, and a run lost with its process is retried
+    once the lease expires. Idle workers poll every `GMAIL_SCHEDULER_SCAN_INTERVAL`. Run
+    intervals are jittered so users do not hit Gmail in the same second.
+
+    Users are added to the schedule when they authorize (due immediately); on start, users
+    missing from it are added once, with first runs spread over one interval.
+    """
+
+    def __init__(self, job: Callable[[str], Awaitable[Any]], repo: GmailRepo, concurrency: Optional[int] = None,
+                 interval: Optional[float] = None, jitter: Optional[float] = None, lease: Optional[float] = None):
+        self._job = job
+        self._repo = repo
+        self._concurrency = max(1, concurrency or settings.GMAIL_SCHEDULER_CONCURRENCY)
+        self._interval = interval or settings.GMAIL_SCHEDULER_INTERVAL
+        self._jitter = settings.GMAIL_SCHEDULER_JITTER if jitter is None else jitter
+        self._lease = lease or settings.GMAIL_SCHEDULER_LEASE
+        self._tasks: List[asyncio.Task] = []
+
+    def _next_run(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self._interval * (1 + random.uniform(-self._jitter, self._jitter)))
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._enroll_existing()))
+        self._tasks.extend(asyncio.create_task(self._worker()) for _ in range(self._concurrency))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _enroll_existing(self) -> None:
+        try:
+            batch: Dict[str, datetime] = {}
+            async for user_id in self._repo.iter_user_ids(batch_size=ENROLL_BATCH):
+                # spread first runs over one interval
+                batch[user_id] = utcnow() + timedelta(seconds=random.uniform(0, self._interval))
+                if len(batch) >= ENROLL_BATCH:
+                    await self._repo.schedule_users(batch, utcnow())
+                    batch = {}
+            await self._repo.schedule_users(batch, utcnow())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scheduler enrollment failed")
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                claimed = await self._run_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler worker failed")
+                claimed = False
+            if not claimed:
+                await asyncio.sleep(settings.GMAIL_SCHEDULER_SCAN_INTERVAL * random.uniform(0.5, 1.0))
+
+    async def _run_next(self) -> bool:
+        now = utcnow()
+        claim = uuid.uuid4().hex
+        doc = await self._repo.claim_due_user(now, now + timedelta(seconds=self._lease), claim)
+        if doc is None:
+            return False
+        user_id = doc['user_id']
+        renewal = asyncio.create_task(self._renew(user_id, claim))
+        error = None
+        try:
+            await self._job(user_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+            logger.warning("Scheduled work failed for user %s: %s", user_id, e)
+        finally:
+            renewal.cancel()
+        finished = utcnow()
+        fields: Dict[str, Any] = {"running": False, "claim": None, "last_finished": finished,
+                                  "next_run": self._next_run(finished), "last_error": error}
+        if error is None:
+            fields.update({"last_success": finished, "lag_since": finished})
+        await self._repo.update_scheduled_run(user_id, claim, fields, inc={"runs": 1, "failures": int(bool(error))})
+        return True
+
+    async def _renew(self, user_id: str, claim: str) -> None:
+        while True:
+            await asyncio.sleep(self._lease / 3)
+            lease_until = utcnow() + timedelta(seconds=self._lease)
+            try:
+                if not await self._repo.update_scheduled_run(user_id, claim, {"next_run": lease_until}):
+                    return
+            except Exception:
+                # the next attempt may still renew before the lease runs out
+                logger.warning("Could not renew the scheduler lease of user %s", user_id, exc_info=True)
+
+    async def user_status(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self._repo.get_schedule(user_id)
+        return schedule_view(doc, utcnow()) if doc else None
+
+    async def summary(self, top: int = 10) -> Dict[str, Any]:
+        now = utcnow()
+        summary = await self._repo.schedule_summary(now, top)
+        lagging = [schedule_view(doc, now) for doc in summary.pop('most_lagging')]
+        return {
+            **summary,
+            "concurrency": self._concurrency,
+            "interval": self._interval,
+            "max_lag": lagging[0]['lag'] if lagging else 0.0,
+            "most_lagging": lagging,
+        }
@@ -0,0 +1,84 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from routes.gmail.repo import GmailRepo
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_ADDRESS = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", re.UNICODE)
+
+# ranking weight of a term found in each field; prefix-only matches count half
+FIELD_WEIGHTS = {"subject": 3.0, "from": 2.0, "snippet": 1.0}
+MAX_CANDIDATES = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, plus whole e-mail addresses so `from:` style lookups match exactly."""
+    if not text:
+        return []
+    text = text.lower()
+    return _WORD.findall(text) + _ADDRESS.findall(text)
+
+
+def _search_doc(email: Dict[str, Any]) -> Dict[str, Any]:
+    tokens = set()
+    for field in FIELD_WEIGHTS:
+        tokens.update(tokenize(email.get(field) or ""))
+    doc = {field: email.get(field) for field in ("id", "from", "subject", "date", "snippet")}
+    # listings without internalDate must not overwrite the one stored by the mirror sync
+    for field in ("internalDate", "sync_generation"):
+        if email.get(field) is not None:
+            doc[field] = email[field]
+    doc["tokens"] = sorted(tokens)
+    return doc
+
+
+def _score(doc: Dict[str, Any], terms: List[str]) -> float:
+    field_tokens = {field: tokenize(doc.get(field) or "") for field in FIELD_WEIGHTS}
+    score = 0.0
+    for term in terms:
+        best = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            tokens = field_tokens[field]
+            if term in tokens:
+                best = max(best, weight)
+            elif any(token.startswith(term) for token in tokens):
+                best = max(best, weight / 2)
+        score += best
+    return score
+
+
+class SearchIndex:
+    """Per-user inverted index over message headers and snippets, stored in Mongo.
+
+    Each message is one `gmail_search_index` document whose `tokens` array is covered by a
+    multikey (user_id, tokens) index, so every query term becomes an anchored prefix match on
+    that index. The query keeps the candidates matching the most terms exactly, which are then
+    ranked in Python by field weight and exact-vs-prefix match.
+    Documents are upserted as messages are listed or synced, so updates are incremental.
+    """
+
+    def __init__(self, repo: GmailRepo):
+        self._repo = repo
+
+    async def index(self, user_id: str, emails: List[Dict[str, Any]]) -> None:
+        docs = [_search_doc(email) for email in emails if email.get("id") and "error" not in email]
+        await self._repo.upsert_search_docs(user_id, docs)
+
+    async def remove(self, user_id: str, message_ids: List[str]) -> None:
+        await self._repo.delete_search_docs(user_id, message_ids)
+
+    async def prune(self, user_id: str, generation: str, keep: Optional[List[str]] = None) -> None:
+        """Drop documents of messages the full sync identified by `generation` did not see,
+        except the ids in `keep`."""
+        await self._repo.prune_search_docs(user_id, generation, keep)
+
+    async def search(self, user_id: str, q: str, limit: int = 20) -> List[Dict[str, Any]]:
+        terms = list(dict.fromkeys(tokenize(q)))
+        if not terms:
+            return []
+        candidates = await self._repo.find_search_candidates(user_id, terms, MAX_CANDIDATES)
+        for doc in candidates:
+            doc["score"] = _score(doc, terms)
+        # stable: equal scores keep the repository's newest-first order
+        candidates.sort(key=lambda d: d["score"], reverse=True)
+        return candidates[:limit]
@@ -1,21 +1,53 @@
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
 from config.settings import settings
-from typing import Dict, Any, List, Optional
-from models.user_credentials import UserCredentials
-from tools.google_api import build_authorization_url, exchange_code_for_credentials
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, List, Optional, Set, Tuple
+from tools.google_api import build_authorization_url, exchange_code_for_credentials, build_gmail_service
+from tools.mime import deferred_body_ids, flatten_payload, parse_raw_message
+from tools.attachment_cache import AttachmentCache
+from routes.gmail.message_cache import CachedMessage, MessageCache
 from routes.gmail.repo import GmailRepo
+from routes.gmail.client_cache import GmailClientCache
+from routes.gmail.credential_cache import CredentialCache, credentials_to_model
+from routes.gmail.errors import GmailApiError
+from routes.gmail.metadata import METADATA_HEADERS, email_summary
+from routes.gmail.threaded_client import ThreadedGmailClient
+from routes.gmail.async_client import AsyncGmailClient
+from routes.gmail.sync import MailboxSync
+from routes.gmail.search import SearchIndex
+from routes.gmail.rules import MODIFY_SCOPES, RulePlan, RulesEngine
+from routes.gmail.bulk import BulkJobs
+from models.mail_rule import MailRule, StoredMailRule
+from models.bulk_job import BulkJobRequest
+from routes.gmail.push import EventBroker, PushCoalescer
+from routes.gmail.quota import GmailRateLimiter, RateLimitedGmailClient
+from tools.time_utils import utcnow
+from tools import executor
+from tools.executor import run_blocking
+from tools.metrics import timed
+from routes.gmail.instrumentation import CLIENT_BUILD_SECONDS
 from db.mongo_connector import SingletonMeta
 import asyncio
+import logging
+from dataclasses import replace
+from datetime import datetime, timezone
 from functools import partial
+from pathlib import Path
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import Flow
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_FETCH_ATTEMPTS = 3
 
 
 class GmailService(metaclass=SingletonMeta):
     """Async service layer for Gmail operations.
 
-    Uses Motor (AsyncIOMotorClient) via `MongoRepo` for non-blocking DB access. Blocking
-    Google API operations are executed in a thread using asyncio.to_thread.
+    Uses Motor (AsyncIOMotorClient) via `MongoRepo` for non-blocking DB access. Gmail calls go
+    through the backend selected by `settings.GMAIL_BACKEND`: the googleapiclient backend runs
+    blocking calls in a worker thread (tools.executor.run_blocking), the httpx backend runs them
+    on the event loop.
     """
 
     def __init__(self, repo: GmailRepo | None = None):
@@ -28,9 +60,24 @@ class GmailService(metaclass=SingletonMeta):
 
         # Allow dependency injection of the repo for tests; fall back to default
         self._repo = repo or GmailRepo()
+        self._limiter = GmailRateLimiter()
+        self._clients = GmailClientCache(settings.GMAIL_CLIENT_CACHE_SIZE, settings.GMAIL_CLIENT_CACHE_TTL)
+        self._credentials = CredentialCache(self._repo, on_change=self._clients.invalidate)
+        self._search = SearchIndex(self._repo)
+        self._rules = RulesEngine(self._repo)
+        self._bulk = BulkJobs(self._repo, self.build_service)
+        self._sync = MailboxSync(self._repo, self.build_service, search=self._search,
+                                 on_added=self._apply_rules_to_new if settings.GMAIL_RULES_APPLY_ON_SYNC else None)
+        self._background: Set[asyncio.Task] = set()
+        self._events = EventBroker()
+        self._push = PushCoalescer(self._background_sync, self._events, settings.GMAIL_PUSH_COALESCE_DELAY)
+        self._messages = MessageCache(settings.GMAIL_MESSAGE_CACHE_MAX_BYTES)
+        self._attachments = AttachmentCache(settings.GMAIL_ATTACHMENT_CACHE_DIR, settings.GMAIL_ATTACHMENT_CACHE_MAX_BYTES)
+        self._attachment_fetches: Dict[str, asyncio.Task] = {}
+        self._message_loads: Dict[Tuple[str, str, str], asyncio.Task] = {}
         self._initialized = True
 
-    def get_flow(self, scopes, redirect_uri) -> Flow:
+    def get_flow(self, scopes, redirect_uri) -> "Flow":
         """Create OAuth flow using provided scopes and redirect_uri."""
         from tools.google_api import create_flow
         return create_flow(settings.CLIENT_SECRETS_FILE, scopes, redirect_uri)
@@ -45,7 +92,7 @@ class GmailService(metaclass=SingletonMeta):
         Returns a dict with user_id, user_info and scope (space-separated string).
         """
         # exchange_code_for_credentials in tools is sync; run it in a thread
-        credentials: Credentials = await asyncio.to_thread(
+        credentials: "Credentials" = await run_blocking(
             partial(exchange_code_for_credentials, settings.CLIENT_SECRETS_FILE, code, scopes, redirect_uri)
         )
 
@@ -53,13 +100,12 @@ class GmailService(metaclass=SingletonMeta):
         id_token_val = getattr(credentials, "id_token", None)
         user_info = None
         if id_token_val:
-            try:
-                from google.oauth2 import id_token as google_id_token
-                from google.auth.transport import requests as auth_requests
+            from tools.id_token import verify_google_id_token
 
-                request = auth_requests.Request()
+            try:
                 aud = credentials.client_id if hasattr(credentials, 'client_id') else None
-                user_info = google_id_token.verify_oauth2_token(id_token_val, request, aud)
+                # certificate fetches go through a shared cache; verification itself is blocking
+                user_info = await run_blocking(verify_google_id_token, id_token_val, aud)
             except Exception:
                 user_info = None
 
@@ -70,107 +116,412 @@ class GmailService(metaclass=SingletonMeta):
         scopes = credentials.scopes
 
         # Store core credentials in MongoDB
-        creds_model = UserCredentials(
-            token=credentials.token,
-            refresh_token=credentials.refresh_token,
-            token_uri=credentials.token_uri,
-            client_id=credentials.client_id,
-            scopes=list(scopes) if scopes else []
-        )
-        await self._repo.save_credentials(user_id, creds_model)
-
-        if user_info:
-            await self._repo.save_user_info(user_id, user_info)
+        creds_model = credentials_to_model(credentials)
+        await self._repo.save_user(user_id, creds_model, user_info)
+        self._credentials.invalidate(user_id)
+        # for the background scheduler; a user already scheduled keeps their next run
+        await self._repo.schedule_users({user_id: utcnow()}, utcnow())
 
         scope_str = " ".join(list(scopes)) if scopes else ""
         return {"user_id": user_id, "user_info": user_info, "scope": scope_str}
 
     async def has_user(self, user_id: str) -> bool:
-        return await self._repo.get_credentials(user_id) is not None
+        return await self._credentials.get(user_id) is not None
 
-    async def _build_credentials(self, user_id: str) -> Credentials:
-        doc = await self._repo.get_credentials(user_id)
-        if not doc:
+    async def _build_credentials(self, user_id: str) -> "Credentials":
+        creds = await self._credentials.get(user_id)
+        if creds is None:
             raise KeyError(f"No credentials found for user {user_id}")
-
-        doc.pop('user_id', None)
-        return Credentials(**doc)
+        return creds
 
     async def build_service(self, user_id: str):
+        """Return the cached Gmail client of the configured backend for `user_id`."""
+        # resolve credentials first so cached clients still trigger proactive token refresh
         creds = await self._build_credentials(user_id)
+        client = self._clients.get(user_id)
+        if client is None:
+            client = RateLimitedGmailClient(await self._new_client(creds), self._limiter, user_id)
+            self._clients.put(user_id, client)
+        return client
+
+    @timed(CLIENT_BUILD_SECONDS, backend=settings.GMAIL_BACKEND)
+    async def _new_client(self, creds: "Credentials"):
+        if settings.GMAIL_BACKEND == "httpx":
+            return AsyncGmailClient(creds)
         # build is blocking; run in a thread
-        service = await asyncio.to_thread(partial(build, 'gmail', 'v1', credentials=creds))
-        return service
-
-    async def list_messages(self, user_id: str, max_results: int = 10) -> Dict[str, Any]:
-        service = await self.build_service(user_id)
-
-        def _list_and_fetch():
-            results = service.users().messages().list(
-                userId='me',
-                maxResults=max_results
-            ).execute()
-
-            messages = results.get('messages', [])
-            if not messages:
-                return {"total": 0, "emails": []}
-
-            emails: List[Dict[str, Any]] = []
-            for message in messages:
-                msg = service.users().messages().get(
-                    userId='me',
-                    id=message['id'],
-                    format='metadata',
-                    metadataHeaders=['From', 'Subject', 'Date']
-                ).execute()
-
-                headers = msg.get('payload', {}).get('headers', [])
-                email_data: Dict[str, Any] = {
-                    'id': msg.get('id'),
-                    'snippet': msg.get('snippet')
-                }
-
-                for header in headers:
-                    name = header.get('name')
-                    value = header.get('value')
-                    if name == 'From':
-                        email_data['from'] = value
-                    elif name == 'Subject':
-                        email_data['subject'] = value
-                    elif name == 'Date':
-                        email_data['date'] = value
-
-                emails.append(email_data)
-
-            return {"total": len(emails), "emails": emails}
-
-        return await asyncio.to_thread(_list_and_fetch)
-
-    async def get_message(self, user_id: str, message_id: str) -> Dict[str, Any]:
-        service = await self.build_service(user_id)
-
-        def _get_message():
-            message = service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
-
-            return {
-                "id": message.get('id'),
-                "threadId": message.get('threadId'),
-                "snippet": message.get('snippet'),
-                "payload": message.get('payload')
-            }
-
-        return await asyncio.to_thread(_get_message)
+        return ThreadedGmailClient(await run_blocking(build_gmail_service, creds))
+
+    def client_cache_stats(self) -> Dict[str, Any]:
+        return self._clients.stats()
+
+    def credential_cache_stats(self) -> Dict[str, Any]:
+        return self._credentials.stats()
+
+    def quota_stats(self) -> Dict[str, Any]:
+        return self._limiter.stats()
+
+    async def _fetch_summaries(self, client, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch listing metadata for `message_ids` in order; failed items carry an `error` field."""
+        messages = await client.get_messages(message_ids, format='metadata', metadataHeaders=METADATA_HEADERS)
+        return [
+            {'id': message_id, 'error': str(msg)} if isinstance(msg, GmailApiError) else email_summary(msg)
+            for message_id, msg in zip(message_ids, messages)
+        ]
+
+    @staticmethod
+    def _listing_params(max_results: int, page_token: Optional[str] = None, q: Optional[str] = None,
+                        label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"maxResults": max_results}
+        if page_token:
+            params["pageToken"] = page_token
+        if q:
+            params["q"] = q
+        if label_ids:
+            params["labelIds"] = label_ids
+        return params
+
+    def _index_in_background(self, user_id: str, emails: List[Dict[str, Any]]) -> None:
+        """Feed listed metadata into the search index without delaying the response."""
+        if not emails:
+            return
+        task = asyncio.create_task(self._search.index(user_id, emails))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background task failed: %s", task.exception())
+
+    async def _list_page(self, user_id: str, client,
+                         params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        results = await client.list_messages(**params)
+        ids = [message['id'] for message in results.get('messages', [])]
+        emails = await self._fetch_summaries(client, ids) if ids else []
+        self._index_in_background(user_id, emails)
+        return emails, results.get('nextPageToken')
+
+    async def list_messages(self, user_id: str, max_results: int = 10, page_token: Optional[str] = None,
+                            q: Optional[str] = None, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        client = await self.build_service(user_id)
+        params = self._listing_params(max_results, page_token, q, label_ids)
+        emails, next_page_token = await self._list_page(user_id, client, params)
+
+        result: Dict[str, Any] = {"total": len(emails), "emails": emails}
+        if next_page_token:
+            result["nextPageToken"] = next_page_token
+        return result
+
+    async def iter_message_pages(self, user_id: str, page_size: int = 100, page_token: Optional[str] = None,
+                                 q: Optional[str] = None, label_ids: Optional[List[str]] = None,
+                                 limit: Optional[int] = None) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Walk the listing page by page, yielding (emails, nextPageToken).
+
+        The next page is fetched while the caller consumes the current one, so at most two pages
+        are held in memory regardless of how many messages are listed.
+        """
+        client = await self.build_service(user_id)
+        remaining = limit
+
+        def _fetch(token: Optional[str]):
+            size = page_size if remaining is None else min(page_size, remaining)
+            return asyncio.create_task(self._list_page(user_id, client, self._listing_params(size, token, q, label_ids)))
+
+        pending = _fetch(page_token)
+        try:
+            while pending is not None:
+                emails, next_page_token = await pending
+                if remaining is not None:
+                    remaining -= len(emails)
+                done = not next_page_token or (remaining is not None and remaining <= 0)
+                pending = None if done else _fetch(next_page_token)
+                yield emails, next_page_token
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def search(self, user_id: str, q: str, limit: int = 20) -> Dict[str, Any]:
+        """Search the local index of listed/synced message headers and snippets."""
+        emails = await self._search.search(user_id, q, limit=limit)
+        return {"total": len(emails), "emails": emails}
+
+    async def sync_mailbox(self, user_id: str, full: bool = False) -> Dict[str, Any]:
+        """Bring the local mirror up to date (history delta, or a full resync when needed)."""
+        return await self._sync.sync(user_id, full=full)
+
+    async def _background_sync(self, user_id: str) -> Dict[str, Any]:
+        with executor.lane(executor.BACKGROUND):
+            return await self._sync.sync(user_id)
+
+    def _sync_in_background(self, user_id: str) -> None:
+        task = asyncio.create_task(self._background_sync(user_id))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    async def scheduled_work(self, user_id: str) -> None:
+        """Per-user background work run by the scheduler: keep the mirror, token and watch fresh.
+
+        Runs on the background executor lane so it never takes threads from request handlers.
+        """
+        with executor.lane(executor.BACKGROUND):
+            await self._sync.sync(user_id)
+            watch = await self._repo.get_watch(user_id)
+            if watch and (watch['expiration'] - utcnow()).total_seconds() < settings.GMAIL_WATCH_RENEW_BEFORE:
+                await self.watch_mailbox(user_id)
+
+    async def watch_mailbox(self, user_id: str) -> Dict[str, Any]:
+        """Register (or renew) Gmail push notifications for the user via users.watch."""
+        if not settings.GMAIL_PUSH_TOPIC:
+            raise ValueError("GMAIL_PUSH_TOPIC is not configured")
+        client = await self.build_service(user_id)
+        label_ids = [label.strip() for label in settings.GMAIL_PUSH_LABEL_IDS.split(",") if label.strip()]
+        response = await client.watch(settings.GMAIL_PUSH_TOPIC, label_ids)
+        profile = await client.get_profile()
+        watch = {
+            "email": profile['emailAddress'].lower(),
+            "topic": settings.GMAIL_PUSH_TOPIC,
+            "history_id": str(response['historyId']),
+            "expiration": datetime.fromtimestamp(int(response['expiration']) / 1000, timezone.utc).replace(tzinfo=None),
+            "renewed_at": utcnow(),
+        }
+        await self._repo.save_watch(user_id, watch)
+        return watch
+
+    async def stop_watch(self, user_id: str) -> bool:
+        client = await self.build_service(user_id)
+        await client.stop()
+        return await self._repo.delete_watch(user_id)
+
+    async def handle_push(self, email: str, history_id: str) -> bool:
+        """Queue a coalesced history sync for the mailbox a push notification refers to."""
+        user_id = await self._repo.find_user_id_by_email(email.lower())
+        if user_id is None:
+            return False
+        self._push.notify(user_id)
+        return True
+
+    def subscribe_events(self, user_id: str) -> asyncio.Queue:
+        return self._events.subscribe(user_id)
+
+    def unsubscribe_events(self, user_id: str, queue: asyncio.Queue) -> None:
+        self._events.unsubscribe(user_id, queue)
+
+    def push_stats(self) -> Dict[str, Any]:
+        return self._push.stats()
+
+    async def list_local_messages(self, user_id: str, max_results: int = 10, sync_now: bool = False,
+                                  max_age: Optional[int] = None) -> Dict[str, Any]:
+        """List messages from the local mirror, syncing first if it is older than `max_age` seconds.
+
+        A mirror that was never synced is filled by a full sync started in the background; until
+        it finishes the listing comes from Gmail and the response carries `"syncing": true`.
+        """
+        max_age = settings.GMAIL_MIRROR_MAX_AGE if max_age is None else max_age
+        state = await self._repo.get_sync_state(user_id)
+        if state is None and not sync_now:
+            self._sync_in_background(user_id)
+            result = await self.list_messages(user_id, max_results=max_results)
+            return {**result, "synced_at": None, "syncing": True}
+        if sync_now or state is None or (utcnow() - state['synced_at']).total_seconds() > max_age:
+            await self._sync.sync(user_id)
+            state = await self._repo.get_sync_state(user_id)
+
+        emails = await self._repo.list_messages(user_id, limit=max_results)
+        return {"total": len(emails), "emails": emails, "synced_at": state.get('synced_at')}
+
+    async def list_rules(self, user_id: str) -> List[StoredMailRule]:
+        return await self._rules.list_rules(user_id)
+
+    async def get_rule(self, user_id: str, rule_id: str) -> Optional[StoredMailRule]:
+        return await self._rules.get_rule(user_id, rule_id)
+
+    async def save_rule(self, user_id: str, rule: MailRule, rule_id: Optional[str] = None) -> StoredMailRule:
+        """Create (or with `rule_id`, replace) a rule; raises ValueError for an invalid rule."""
+        return await self._rules.save_rule(user_id, rule, rule_id)
+
+    async def delete_rule(self, user_id: str, rule_id: str) -> bool:
+        return await self._rules.delete_rule(user_id, rule_id)
+
+    async def apply_rules(self, user_id: str, source: str = "mirror", max_results: int = 1000,
+                          q: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Evaluate the user's rules over existing mail and apply the label changes in bulk.
+
+        source="mirror" evaluates the local mirror (no Gmail reads); "gmail" walks the listing
+        (optionally filtered by `q`) page by page. `dry_run` only reports what would change.
+        """
+        compiled = await self._rules.compiled(user_id)
+        plan = RulePlan()
+        # evaluation is CPU-bound; keep large batches off the event loop
+        if compiled.rules:
+            if source == "gmail":
+                async for emails, _ in self.iter_message_pages(user_id, page_size=min(500, max_results), q=q,
+                                                               limit=max_results):
+                    await run_blocking(plan.add, compiled, emails)
+            else:
+                await run_blocking(plan.add, compiled, await self._repo.list_messages(user_id, limit=max_results))
+
+        result = {**plan.summary(), "dry_run": dry_run, "calls": 0}
+        if plan.groups and not dry_run:
+            result["calls"] = await self._rules.execute(await self.build_service(user_id), plan)
+        return result
+
+    async def _apply_rules_to_new(self, user_id: str, client, records: List[Dict[str, Any]]) -> None:
+        creds = await self._build_credentials(user_id)
+        if not any(scope in (creds.scopes or []) for scope in MODIFY_SCOPES):
+            # a read-only grant would get a 403 from batchModify on every sync
+            return
+        result = await self._rules.apply(user_id, client, records)
+        if result["modified"]:
+            logger.info("Rules modified %d new messages for user %s", result["modified"], user_id)
+
+    async def submit_bulk_job(self, user_id: str, request: BulkJobRequest) -> Dict[str, Any]:
+        """Start a bulk modify/trash/delete job.
+
+        Raises ValueError for an invalid request and PermissionError for a delete job the
+        user's grant does not allow.
+        """
+        creds = await self._build_credentials(user_id)
+        return await self._bulk.submit(user_id, request, list(creds.scopes or []))
+
+    async def get_bulk_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._bulk.get(user_id, job_id)
+
+    async def cancel_bulk_job(self, user_id: str, job_id: str) -> bool:
+        return await self._bulk.cancel(user_id, job_id)
+
+    async def resume_bulk_job(self, user_id: str, job_id: str) -> bool:
+        """Restart an interrupted or failed job from its stored cursor; False if it is not resumable."""
+        return await self._bulk.resume(user_id, job_id)
+
+    async def get_message(self, user_id: str, message_id: str, format: str = "decoded") -> Dict[str, Any]:
+        """Fetch one message.
+
+        format="decoded" returns decoded text/html bodies and lazy attachment references,
+        "raw" does the same from the RFC 822 source (for messages with very large parts) and
+        "full" returns Gmail's payload tree unchanged.
+        """
+        client = await self.build_service(user_id)
+        message = await client.get_message(message_id, format='raw' if format == 'raw' else 'full')
+
+        result = {
+            "id": message.get('id'),
+            "threadId": message.get('threadId'),
+            "labelIds": message.get('labelIds', []),
+            "snippet": message.get('snippet'),
+        }
+        if format == "full":
+            result["payload"] = message.get('payload')
+        elif format == "raw":
+            result.update(parse_raw_message(message.get('raw', '')))
+        else:
+            # large text bodies come back as attachment references; fetch them like attachments
+            body_ids = list(dict.fromkeys(deferred_body_ids(message.get('payload'))))
+            fetched = await asyncio.gather(*(client.get_attachment(message_id, body_id) for body_id in body_ids))
+            bodies = {body_id: part.get('data', '') for body_id, part in zip(body_ids, fetched)}
+            result.update(flatten_payload(message.get('payload'), bodies))
+        return result
+
+    async def get_cached_message(self, user_id: str, message_id: str, format: str = "decoded") -> Tuple[bytes, str]:
+        """Return (JSON body, strong ETag) for a message, served from the two-tier message cache.
+
+        Message content never changes, so bodies are cached (memory LRU, then Mongo) after the
+        first fetch. Labels do change: they are overlaid per response from the mirror, and are
+        part of the ETag. For messages not in the mirror the cached labels are re-read from
+        Gmail once they are older than `GMAIL_MESSAGE_LABELS_TTL` seconds. Concurrent requests
+        for the same uncached message share one fetch.
+        """
+        key = (user_id, message_id, format)
+        entry = self._messages.get(key)
+        labels = await self._repo.get_message_labels(user_id, message_id)
+        if entry is None or (labels is None and entry.labels_stale(settings.GMAIL_MESSAGE_LABELS_TTL)):
+            load = self._message_loads.get(key)
+            if load is None:
+                load = asyncio.create_task(self._load_cached_message(user_id, message_id, format, entry,
+                                                                     refresh_labels=labels is None))
+                self._message_loads[key] = load
+                load.add_done_callback(lambda _: self._message_loads.pop(key, None))
+            # one waiter going away must not cancel the fetch for the others
+            entry = await asyncio.shield(load)
+        return entry.render(entry.labels if labels is None else labels)
+
+    async def _load_cached_message(self, user_id: str, message_id: str, format: str,
+                                   entry: Optional[CachedMessage], refresh_labels: bool) -> CachedMessage:
+        """Load a cache entry from Mongo or Gmail; with `refresh_labels`, re-read stale labels from Gmail."""
+        if entry is None:
+            doc = await self._repo.get_cached_message(user_id, message_id, format)
+            if doc is not None:
+                entry = CachedMessage(doc['body'], doc['digest'], doc.get('labelIds', []), doc.get('labels_checked'))
+            else:
+                entry = CachedMessage.from_message(await self.get_message(user_id, message_id, format))
+                if len(entry.body) <= settings.GMAIL_MESSAGE_CACHE_PERSIST_MAX_BYTES:
+                    await self._repo.save_cached_message(user_id, message_id, format, entry.body, entry.digest,
+                                                         entry.labels, entry.labels_checked)
+        if refresh_labels and entry.labels_stale(settings.GMAIL_MESSAGE_LABELS_TTL):
+            client = await self.build_service(user_id)
+            message = await client.get_message(message_id, format='minimal')
+            entry = replace(entry, labels=message.get('labelIds', []), labels_checked=utcnow())
+            await self._repo.set_cached_message_labels(user_id, message_id, format, entry.labels,
+                                                       entry.labels_checked)
+        self._messages.put((user_id, message_id, format), entry)
+        return entry
+
+    def message_cache_stats(self) -> Dict[str, Any]:
+        return self._messages.stats()
+
+    async def get_attachment_file(self, user_id: str, message_id: str, attachment_id: str) -> Path:
+        """Return a local file with the decoded attachment, fetching it from Gmail on a cache miss.
+
+        The file is pinned in the cache so it cannot be evicted while it is served; pass it to
+        `release_attachment_file` once done.
+        """
+        key = f"{user_id}/{message_id}/{attachment_id}"
+        for _ in range(ATTACHMENT_FETCH_ATTEMPTS):
+            path = await run_blocking(self._attachments.lookup, key, True)
+            if path is not None:
+                return path
+            # concurrent misses for one attachment share a single download
+            fetch = self._attachment_fetches.get(key)
+            if fetch is None:
+                fetch = asyncio.create_task(self._fetch_attachment(user_id, message_id, attachment_id, key))
+                self._attachment_fetches[key] = fetch
+                fetch.add_done_callback(lambda _: self._attachment_fetches.pop(key, None))
+            # one waiter going away must not cancel the download for the others
+            await asyncio.shield(fetch)
+            # evicted again before this waiter could pin it: fetch again
+        raise RuntimeError(f"Attachment {attachment_id} was evicted before it could be served")
+
+    def release_attachment_file(self, path: Path) -> None:
+        self._attachments.release(path)
+
+    async def _fetch_attachment(self, user_id: str, message_id: str, attachment_id: str, key: str) -> Path:
+        client = await self.build_service(user_id)
+        attachment = await client.get_attachment(message_id, attachment_id)
+        return await run_blocking(self._attachments.store, key, attachment.get('data', ''))
+
+    def attachment_cache_stats(self) -> Dict[str, Any]:
+        return self._attachments.stats()
 
     async def revoke(self, user_id: str) -> bool:
-        creds_deleted = await self._repo.delete_credentials(user_id)
+        if await self._repo.get_watch(user_id):
+            try:
+                await self.stop_watch(user_id)
+            except Exception:
+                logger.warning("Could not stop Gmail watch for user %s", user_id)
+        self._credentials.invalidate(user_id)
+        self._messages.invalidate_user(user_id)
+        self._bulk.stop(user_id)
+        creds_deleted = await self._repo.delete_user(user_id)
         try:
-            await self._repo.delete_user_info(user_id)
+            await self._repo.delete_cached_messages(user_id)
+            await self._repo.delete_search_docs(user_id)
+            await self._repo.delete_watch(user_id)
+            await self._repo.delete_messages(user_id)
+            await self._repo.delete_sync_state(user_id)
+            await self._repo.delete_rules(user_id)
+            self._rules.invalidate(user_id)
+            await self._repo.delete_jobs(user_id)
+            await self._repo.delete_schedule(user_id)
         except Exception:
             pass
 
         return creds_deleted
-
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+from routes.gmail.errors import GmailApiError
+from routes.gmail.metadata import METADATA_HEADERS, mirror_record
+from routes.gmail.repo import GmailRepo
+from routes.gmail.search import SearchIndex
+from tools.time_utils import utcnow
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+
+class MailboxSync:
+    """Keeps the per-user message mirror (`gmail_messages`) current with Gmail.
+
+    The first sync pages through `messages.list` and stores metadata for every message. Later
+    syncs apply `users.history.list` deltas from the stored historyId and fall back to a full
+    resync when Gmail reports that history as expired (404). Only one sync per user runs at a
+    time; concurrent callers join the running one, except that a full sync requested while a
+    delta sync runs is queued to start when the delta finishes.
+
+    `on_added(user_id, client, records)` is awaited with the records of messages that arrived
+    since the last delta sync (not for full syncs); its failures are logged, not raised.
+    """
+
+    def __init__(self, repo: GmailRepo, get_client: Callable[[str], Awaitable[Any]],
+                 search: Optional[SearchIndex] = None,
+                 on_added: Optional[Callable[[str, Any, List[Dict[str, Any]]], Awaitable[Any]]] = None):
+        self._repo = repo
+        self._get_client = get_client
+        self._search = search
+        self._on_added = on_added
+        self._running: Dict[str, Tuple[asyncio.Task, bool]] = {}  # user_id -> (task, full)
+
+    def sync(self, user_id: str, full: bool = False) -> "asyncio.Task[Dict[str, Any]]":
+        running = self._running.get(user_id)
+        if running is not None and (running[1] or not full):
+            return running[0]
+        task = asyncio.create_task(self._sync(user_id, full, after=running[0] if running else None))
+        self._running[user_id] = (task, full)
+        task.add_done_callback(lambda done: self._finished(user_id, done))
+        return task
+
+    def _finished(self, user_id: str, task: asyncio.Task) -> None:
+        # a queued full sync may already have replaced this task
+        if self._running.get(user_id, (None,))[0] is task:
+            del self._running[user_id]
+
+    async def _sync(self, user_id: str, full: bool, after: Optional[asyncio.Task] = None) -> Dict[str, Any]:
+        if after is not None:
+            # its outcome belongs to its own callers
+            await asyncio.wait([after])
+        client = await self._get_client(user_id)
+        state = await self._repo.get_sync_state(user_id)
+        if not full and state and state.get('history_id'):
+            try:
+                return await self._sync_delta(user_id, client, state['history_id'])
+            except GmailApiError as exc:
+                if exc.status != 404:
+                    raise
+                logger.info("History %s expired for user %s; running full resync", state['history_id'], user_id)
+        return await self._sync_full(user_id, client)
+
+    async def _fetch_records(self, client, message_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Metadata records of `message_ids`, plus the ids whose fetch failed for a reason other
+        than the message being gone (404)."""
+        messages = await client.get_messages(message_ids, format='metadata', metadataHeaders=METADATA_HEADERS)
+        records = [mirror_record(m) for m in messages if not isinstance(m, GmailApiError)]
+        failed = [message_id for message_id, m in zip(message_ids, messages)
+                  if isinstance(m, GmailApiError) and m.status != 404]
+        return records, failed
+
+    async def _store(self, user_id: str, records: List[Dict[str, Any]]) -> None:
+        await self._repo.upsert_messages(user_id, records)
+        if self._search is not None:
+            await self._search.index(user_id, records)
+
+    async def _sync_full(self, user_id: str, client) -> Dict[str, Any]:
+        # take the historyId first so changes made during the walk are picked up by the next delta
+        history_id = (await client.get_profile())['historyId']
+        generation = uuid.uuid4().hex
+        limit = settings.GMAIL_MIRROR_FULL_SYNC_LIMIT
+        fetched = 0
+        failed: List[str] = []
+        page_token = None
+        while True:
+            params: Dict[str, Any] = {"maxResults": 500 if not limit else min(500, limit - fetched)}
+            if page_token:
+                params["pageToken"] = page_token
+            listing = await client.list_messages(**params)
+            ids = [m['id'] for m in listing.get('messages', [])]
+            if ids:
+                records, page_failed = await self._fetch_records(client, ids)
+                failed.extend(page_failed)
+                for record in records:
+                    record['sync_generation'] = generation
+                await self._store(user_id, records)
+            fetched += len(ids)
+            page_token = listing.get('nextPageToken')
+            if not page_token or (limit and fetched >= limit):
+                break
+
+        # messages listed but not fetched still exist; keep what the mirror has for them
+        await self._repo.prune_messages(user_id, generation, keep=failed)
+        if self._search is not None:
+            await self._search.prune(user_id, generation, keep=failed)
+        now = utcnow()
+        await self._repo.save_sync_state(user_id, {"history_id": history_id, "synced_at": now, "full_synced_at": now})
+        return {"mode": "full", "messages": fetched, "failed": len(failed), "history_id": history_id}
+
+    async def _sync_delta(self, user_id: str, client, start_history_id: str) -> Dict[str, Any]:
+        added: Set[str] = set()
+        deleted: Set[str] = set()
+        labels: Dict[str, List[str]] = {}
+        history_id = start_history_id
+        page_token = None
+        while True:
+            params: Dict[str, Any] = {"startHistoryId": start_history_id, "historyTypes": HISTORY_TYPES,
+                                      "maxResults": 500}
+            if page_token:
+                params["pageToken"] = page_token
+            response = await client.list_history(**params)
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    message_id = item['message']['id']
+                    added.add(message_id)
+                    deleted.discard(message_id)
+                for item in record.get('messagesDeleted', []):
+                    message_id = item['message']['id']
+                    deleted.add(message_id)
+                    added.discard(message_id)
+                    labels.pop(message_id, None)
+                for key in ('labelsAdded', 'labelsRemoved'):
+                    for item in record.get(key, []):
+                        labels[item['message']['id']] = item['message'].get('labelIds', [])
+            history_id = response.get('historyId', history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        # freshly fetched metadata already carries the current labels
+        for message_id in added:
+            labels.pop(message_id, None)
+        if added:
+            records, _ = await self._fetch_records(client, sorted(added))
+            await self._store(user_id, records)
+            if self._on_added is not None:
+                try:
+                    await self._on_added(user_id, client, records)
+                except Exception:
+                    logger.exception("Handling new messages failed for user %s", user_id)
+        await self._repo.set_message_labels(user_id, labels)
+        if deleted:
+            await self._repo.delete_messages(user_id, sorted(deleted))
+            await self._repo.delete_cached_messages(user_id, sorted(deleted))
+            if self._search is not None:
+                await self._search.remove(user_id, sorted(deleted))
+
+        await self._repo.save_sync_state(user_id, {"history_id": history_id, "synced_at": utcnow()})
+        return {"mode": "delta", "added": sorted(added), "deleted": sorted(deleted),
+                "relabeled": len(labels), "history_id": history_id}
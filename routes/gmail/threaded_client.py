@@ -0,0 +1,108 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+from googleapiclient.errors import HttpError
+
+from config.settings import settings
+from routes.gmail.errors import GmailApiError, error_from_payload, parse_retry_after
+from routes.gmail.instrumentation import GMAIL_API_SECONDS
+from tools.executor import run_blocking
+from tools.metrics import instrument
+
+
+def _to_api_error(exc: HttpError) -> GmailApiError:
+    try:
+        payload = json.loads(exc.content)
+    except (TypeError, ValueError):
+        payload = {}
+    return error_from_payload(exc.resp.status, payload, parse_retry_after(exc.resp.get('retry-after')))
+
+
+def _execute(request):
+    import httplib2
+
+    try:
+        return request.execute()
+    except HttpError as exc:
+        raise _to_api_error(exc) from exc
+    except (OSError, httplib2.HttpLib2Error) as exc:
+        # transport failures (broken keep-alive sockets, timeouts) are retryable, as on the httpx backend
+        raise GmailApiError(0, type(exc).__name__, str(exc)) from exc
+
+
+@instrument(GMAIL_API_SECONDS, backend="googleapiclient")
+class ThreadedGmailClient:
+    """Gmail client backed by the synchronous googleapiclient.
+
+    Every call is executed in a worker thread with tools.executor.run_blocking. `service` is a
+    client built by `tools.google_api.build_gmail_service`.
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def _messages(self):
+        return self._service.users().messages()
+
+    async def list_messages(self, **params) -> Dict[str, Any]:
+        return await run_blocking(lambda: _execute(self._messages().list(userId='me', **params)))
+
+    async def get_message(self, message_id: str, **params) -> Dict[str, Any]:
+        return await run_blocking(lambda: _execute(self._messages().get(userId='me', id=message_id, **params)))
+
+    async def get_messages(self, message_ids: List[str], **params) -> List[Union[Dict[str, Any], GmailApiError]]:
+        """Fetch several messages with Gmail batch HTTP requests, keeping the order of `message_ids`.
+
+        Sub-requests are grouped into batches of `settings.GMAIL_BATCH_SIZE`, so N messages cost
+        ceil(N / batch_size) round trips. A failed sub-request yields a GmailApiError in its slot.
+        """
+
+        def _fetch():
+            results: List[Optional[Union[Dict[str, Any], GmailApiError]]] = [None] * len(message_ids)
+
+            def _callback(request_id, response, exception):
+                index = int(request_id)
+                if exception is None:
+                    results[index] = response
+                elif isinstance(exception, HttpError):
+                    results[index] = _to_api_error(exception)
+                else:
+                    results[index] = GmailApiError(0, type(exception).__name__, str(exception))
+
+            batch_size = max(1, min(settings.GMAIL_BATCH_SIZE, 100))
+            for start in range(0, len(message_ids), batch_size):
+                batch = self._service.new_batch_http_request(callback=_callback)
+                for index in range(start, min(start + batch_size, len(message_ids))):
+                    batch.add(self._messages().get(userId='me', id=message_ids[index], **params),
+                              request_id=str(index))
+                _execute(batch)
+            return results
+
+        return await run_blocking(_fetch)
+
+    async def get_attachment(self, message_id: str, attachment_id: str) -> Dict[str, Any]:
+        return await run_blocking(lambda: _execute(
+            self._messages().attachments().get(userId='me', messageId=message_id, id=attachment_id)
+        ))
+
+    async def list_history(self, **params) -> Dict[str, Any]:
+        return await run_blocking(lambda: _execute(self._service.users().history().list(userId='me', **params)))
+
+    async def get_profile(self) -> Dict[str, Any]:
+        return await run_blocking(lambda: _execute(self._service.users().getProfile(userId='me')))
+
+    async def watch(self, topic_name: str, label_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        body = {"topicName": topic_name, "labelIds": label_ids or [], "labelFilterBehavior": "include"}
+        return await run_blocking(lambda: _execute(self._service.users().watch(userId='me', body=body)))
+
+    async def stop(self) -> None:
+        await run_blocking(lambda: _execute(self._service.users().stop(userId='me')))
+
+    async def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                           remove_label_ids: Optional[List[str]] = None) -> None:
+        body = {"ids": message_ids, "addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []}
+        await run_blocking(lambda: _execute(self._messages().batchModify(userId='me', body=body)))
+
+    async def batch_delete(self, message_ids: List[str]) -> None:
+        """Permanently delete messages (up to 1000 ids); needs the https://mail.google.com/ scope."""
+        await run_blocking(lambda: _execute(self._messages().batchDelete(userId='me', body={"ids": message_ids})))
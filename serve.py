@@ -0,0 +1,56 @@
+"""Production entry point: several uvicorn worker processes with graceful shutdown.
+
+    python serve.py                      # SERVER_WORKERS processes (default: one per core)
+    python serve.py --workers 4 --port 8080
+
+Each worker is a separate process with its own Mongo pool, caches and executor; it warms up
+during startup and only then answers 200 on /ready. On SIGTERM/SIGINT workers stop accepting
+connections, fail readiness, and get SERVER_GRACEFUL_TIMEOUT seconds to finish in-flight
+requests. `main.py` remains the single-process development server (with reload).
+
+Workers share nothing but Mongo, so:
+
+- The Gmail project quota (GMAIL_PROJECT_QUOTA_PER_SECOND) is split evenly between the
+  workers by setting GMAIL_PROJECT_QUOTA_SHARES to the worker count. If several hosts share
+  one project, set GMAIL_PROJECT_QUOTA_SHARES to the total number of processes instead.
+- Mailbox events reach only the SSE subscribers (/gmail/events) of the worker that received
+  the push (/gmail/push). Route both paths to a separate single-worker deployment.
+- GMAIL_SCHEDULER_ENABLED can be set for any number of workers: users are claimed from
+  Mongo with a lease, so each user's work runs in one process at a time.
+"""
+import argparse
+import os
+
+import uvicorn
+
+from config.settings import settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+    # read by every worker's settings at import
+    os.environ.setdefault("GMAIL_PROJECT_QUOTA_SHARES", str(workers))
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        log_level=args.log_level,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+        limit_concurrency=settings.SERVER_LIMIT_CONCURRENCY or None,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks import env  # noqa: E402
+
+# settings are read at import time; give the required ones local defaults
+env.configure()
@@ -0,0 +1,83 @@
+import base64
+import os
+import threading
+
+from tools.attachment_cache import AttachmentCache
+
+
+def _data(content: bytes) -> str:
+    return base64.urlsafe_b64encode(content).decode().rstrip("=")
+
+
+def test_store_and_lookup(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_bytes=1024)
+    path = cache.store("u/m/a", _data(b"hello"))
+    assert path.read_bytes() == b"hello"
+    assert cache.lookup("u/m/a") == path
+    # the same content under another key shares the blob
+    assert cache.store("u/m2/a", _data(b"hello")) == path
+
+
+def test_eviction_drops_index_entries(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_bytes=10)
+    old = cache.store("u/m/old", _data(b"0123456789"))
+    os.utime(old, (0, 0))
+    cache.store("u/m/new", _data(b"abcdefghij"))
+    assert not old.exists()
+    assert cache.lookup("u/m/old") is None
+    assert cache.lookup("u/m/new") is not None
+    assert len(list((tmp_path / "index").iterdir())) == 1
+
+
+def test_concurrent_stores_of_one_key(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_bytes=1 << 20)
+    errors = []
+
+    def store():
+        try:
+            cache.store("u/m/a", _data(b"x" * 4096))
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=store) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.lookup("u/m/a").read_bytes() == b"x" * 4096
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_pinned_blobs_are_not_evicted(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_bytes=10)
+    cache.store("u/m/a", _data(b"0123456789"))
+    served = cache.lookup("u/m/a", pin=True)
+    cache.store("u/m/b", _data(b"abcdefghij"))
+    assert served.exists()
+    cache.release(served)
+    cache.store("u/m/c", _data(b"ABCDEFGHIJ"))
+    assert not served.exists()
+    assert cache.lookup("u/m/a") is None
+
+
+def test_state_is_reloaded_from_disk(tmp_path):
+    first = AttachmentCache(str(tmp_path), max_bytes=10)
+    old = first.store("u/m/old", _data(b"0123456789"))
+    os.utime(old, (0, 0))
+    first.store("u/m/new", _data(b"abcdefghij"))
+
+    second = AttachmentCache(str(tmp_path), max_bytes=10)
+    second.store("u/m/newest", _data(b"ABCDEFGHIJ"))
+    assert second.lookup("u/m/newest") is not None
+    assert second.lookup("u/m/new") is None
+    assert second.stats()["bytes"] == 10
+
+
+def test_blob_removed_by_another_process_is_a_miss(tmp_path):
+    cache = AttachmentCache(str(tmp_path), max_bytes=1024)
+    path = cache.store("u/m/a", _data(b"hello"))
+    path.unlink()
+    assert cache.lookup("u/m/a") is None
+    assert cache.stats()["bytes"] == 0
+    assert list((tmp_path / "index").iterdir()) == []
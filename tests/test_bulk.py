@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_mongo import FakeDatabase
+from models.bulk_job import BulkJobRequest
+from routes.gmail.bulk import FULL_MAIL_SCOPE, BulkJobs
+from routes.gmail.repo import GmailRepo
+
+MODIFY_SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+
+
+@pytest.mark.parametrize("fields", [
+    {},
+    {"q": ""},
+    {"q": "   "},
+    {"q": "in:inbox", "ids": ["a"]},
+    {"ids": ["a"], "label_ids": ["INBOX"]},
+])
+def test_validate_needs_one_non_empty_selection(fields):
+    with pytest.raises(ValueError):
+        BulkJobs.validate(BulkJobRequest(action="trash", **fields), MODIFY_SCOPES)
+
+
+@pytest.mark.parametrize("fields", [{"q": "older_than:1y"}, {"label_ids": ["Label_1"]}, {"ids": ["a"]}])
+def test_validate_accepts_selection(fields):
+    BulkJobs.validate(BulkJobRequest(action="trash", **fields), MODIFY_SCOPES)
+
+
+def test_delete_needs_full_mail_scope():
+    request = BulkJobRequest(action="delete", q="in:trash")
+    with pytest.raises(PermissionError):
+        BulkJobs.validate(request, MODIFY_SCOPES)
+    BulkJobs.validate(request, MODIFY_SCOPES + [FULL_MAIL_SCOPE])
+
+
+def test_failed_job_can_be_cancelled():
+    repo = GmailRepo(FakeDatabase())
+    jobs = BulkJobs(repo, get_client=None)
+
+    async def run():
+        await repo.save_job({"id": "j1", "user_id": "u", "status": "failed", "phase": "apply"})
+        await repo.save_job_ids("u", "j1", 0, ["a", "b"])
+        cancelled = await jobs.cancel("u", "j1")
+        return cancelled, await repo.get_job("u", "j1"), await repo.get_job_ids("j1", 0, limit=1)
+
+    cancelled, job, chunks = asyncio.run(run())
+    assert cancelled
+    assert job["status"] == "cancelled"
+    assert chunks == []
+
+
+def test_lease_is_renewed_while_a_call_waits(monkeypatch):
+    from config.settings import settings
+
+    monkeypatch.setattr(settings, "GMAIL_BULK_LEASE", 0.3)
+    repo = GmailRepo(FakeDatabase())
+    leases = []
+
+    class _SlowClient:
+        async def batch_modify(self, ids, add, remove):
+            # e.g. waiting out rate-limiter backoff
+            for _ in range(4):
+                await asyncio.sleep(0.1)
+                leases.append((await repo.get_job("u", "j1"))["lease_until"])
+
+    async def get_client(user_id):
+        return _SlowClient()
+
+    jobs = BulkJobs(repo, get_client)
+
+    async def run():
+        await repo.save_job({"id": "j1", "user_id": "u", "status": "queued", "phase": "apply", "lease_until": None,
+                             "request": {"action": "trash"}, "apply_seq": 0, "processed": 0, "calls": 0})
+        await repo.save_job_ids("u", "j1", 0, ["a"])
+        assert await jobs.resume("u", "j1")
+        await asyncio.gather(*(task for _, task in jobs._tasks.values()))
+        return await repo.get_job("u", "j1")
+
+    job = asyncio.run(run())
+    assert job["status"] == "completed"
+    assert len(set(leases)) > 1
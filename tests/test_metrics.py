@@ -0,0 +1,22 @@
+import pytest
+
+from tools.metrics import Counter, Registry, _Metric
+
+
+def test_metric_requires_samples():
+    class Incomplete(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "never registered", registry=Registry())
+
+
+def test_counter_render():
+    counter = Counter("requests", "Requests served", ["route"], registry=Registry())
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    assert counter.render().splitlines() == [
+        "# HELP requests Requests served",
+        "# TYPE requests counter",
+        'requests_total{route="/a"} 3.0',
+    ]
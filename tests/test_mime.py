@@ -0,0 +1,47 @@
+import base64
+
+from tools.mime import deferred_body_ids, flatten_payload
+
+
+def _data(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def _part(part_id, mime_type, body, filename="", headers=None):
+    return {"partId": part_id, "mimeType": mime_type, "filename": filename, "body": body, "headers": headers or []}
+
+
+def test_text_body_behind_attachment_id_is_decoded():
+    payload = _part("", "multipart/alternative", {}, headers=[{"name": "Subject", "value": "hi"}])
+    payload["parts"] = [
+        _part("0", "text/plain", {"data": _data("plain")}),
+        _part("1", "text/html", {"attachmentId": "big-html", "size": 900000}),
+    ]
+    assert deferred_body_ids(payload) == ["big-html"]
+    result = flatten_payload(payload, {"big-html": _data("<p>large</p>")})
+    assert result["text"] == "plain"
+    assert result["html"] == "<p>large</p>"
+    assert result["attachments"] == []
+    assert result["headers"] == {"Subject": "hi"}
+
+
+def test_unfetched_text_body_stays_a_reference():
+    payload = _part("", "text/plain", {"attachmentId": "big-text", "size": 900000})
+    result = flatten_payload(payload)
+    assert result["text"] is None
+    assert [a["attachmentId"] for a in result["attachments"]] == ["big-text"]
+
+
+def test_attachments_need_a_filename_or_disposition():
+    disposition = [{"name": "Content-Disposition", "value": "attachment"}]
+    payload = _part("", "multipart/mixed", {})
+    payload["parts"] = [
+        _part("0", "text/plain", {"data": _data("body")}),
+        _part("1", "text/plain", {"attachmentId": "notes"}, filename="notes.txt"),
+        _part("2", "text/html", {"attachmentId": "page"}, headers=disposition),
+        _part("3", "image/png", {"attachmentId": "logo"}),
+    ]
+    assert deferred_body_ids(payload) == []
+    result = flatten_payload(payload)
+    assert result["text"] == "body"
+    assert [a["attachmentId"] for a in result["attachments"]] == ["notes", "page", "logo"]
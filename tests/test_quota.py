@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+import pytest
+
+from config.settings import settings
+from routes.gmail.errors import CircuitOpenError, GmailApiError
+from routes.gmail.quota import CircuitBreaker, GmailRateLimiter, RateLimitedGmailClient
+from tools import executor
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "GMAIL_BREAKER_COOLDOWN", 60)
+    monkeypatch.setattr(settings, "GMAIL_RETRY_MAX_ATTEMPTS", 0)
+
+
+def _open(breaker: CircuitBreaker, cooled: bool = True) -> None:
+    for _ in range(breaker._threshold):
+        breaker.record_failure()
+    if cooled:
+        breaker._opened_at = time.monotonic() - breaker._cooldown - 1
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(2, 60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check("u")
+
+
+def test_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(2, 60)
+    _open(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.check("u") is True
+    with pytest.raises(CircuitOpenError):
+        breaker.check("u")
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.check("u") is False
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(2, 60)
+    _open(breaker)
+    breaker.check("u")
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_released_trial_can_be_retaken():
+    breaker = CircuitBreaker(2, 60)
+    _open(breaker)
+    assert breaker.check("u") is True
+    breaker.release_trial()
+    assert breaker.check("u") is True
+
+
+def _half_open(limiter: GmailRateLimiter, user_id: str) -> CircuitBreaker:
+    breaker = limiter._breaker(user_id)
+    _open(breaker)
+    return breaker
+
+
+@pytest.mark.parametrize("error", [asyncio.CancelledError, RuntimeError])
+def test_call_releases_trial_without_outcome(error):
+    limiter = GmailRateLimiter()
+    breaker = _half_open(limiter, "u")
+
+    async def fn():
+        raise error()
+
+    async def run():
+        with pytest.raises(error):
+            await limiter.call("u", "messages.list", fn)
+
+    asyncio.run(run())
+    assert breaker.state == "half_open"
+    assert breaker.check("u") is True
+
+
+def test_call_records_trial_outcome():
+    limiter = GmailRateLimiter()
+    breaker = _half_open(limiter, "u")
+
+    async def fn():
+        raise GmailApiError(503, "backendError")
+
+    async def run():
+        with pytest.raises(GmailApiError):
+            await limiter.call("u", "messages.list", fn)
+
+    asyncio.run(run())
+    assert breaker.state == "open"
+
+
+class _FailingBatchClient:
+    def __init__(self, error: Exception):
+        self._error = error
+
+    async def get_messages(self, message_ids, **params):
+        raise self._error
+
+
+def test_get_messages_client_error_closes_trial():
+    limiter = GmailRateLimiter()
+    breaker = _half_open(limiter, "u")
+    client = RateLimitedGmailClient(_FailingBatchClient(GmailApiError(400, "badRequest")), limiter, "u")
+
+    async def run():
+        with pytest.raises(GmailApiError):
+            await client.get_messages(["a", "b"])
+
+    asyncio.run(run())
+    assert breaker.state == "closed"
+
+
+def test_get_messages_releases_trial_on_other_errors():
+    limiter = GmailRateLimiter()
+    breaker = _half_open(limiter, "u")
+    client = RateLimitedGmailClient(_FailingBatchClient(RuntimeError("saturated")), limiter, "u")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await client.get_messages(["a"])
+
+    asyncio.run(run())
+    assert breaker.check("u") is True
+
+
+def test_idle_breakers_are_evicted(monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_RATE_LIMITER_MAX_USERS", 2)
+    limiter = GmailRateLimiter()
+    failing = limiter._breaker("failing")
+    failing.record_failure()
+    limiter._breaker("a")
+    limiter._breaker("b")
+    # the oldest entry still counts failures, so nothing is evicted past it
+    assert list(limiter._breakers) == ["failing", "a", "b"]
+    limiter._breaker("failing")
+    limiter._breaker("c")
+    assert list(limiter._breakers) == ["failing", "c"]
+
+
+def test_project_quota_is_split_between_shares(monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_PROJECT_QUOTA_PER_SECOND", 20000)
+    monkeypatch.setattr(settings, "GMAIL_PROJECT_QUOTA_SHARES", 4)
+    limiter = GmailRateLimiter()
+    assert limiter._project.rate == 5000
+    assert limiter._project.capacity == 5000
+
+
+def test_background_charges_let_interactive_calls_in_between(monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_USER_QUOTA_PER_SECOND", 1000)
+    limiter = GmailRateLimiter()
+    finished = []
+
+    async def background():
+        with executor.lane(executor.BACKGROUND):
+            await limiter.throttle("u", "messages.get", 2500)
+        finished.append("background")
+
+    async def interactive():
+        await asyncio.sleep(0.05)
+        await limiter.throttle("u", "messages.list", 5)
+        finished.append("interactive")
+
+    async def run():
+        await asyncio.gather(background(), interactive())
+
+    asyncio.run(run())
+    assert finished == ["interactive", "background"]
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from models.mail_rule import RuleActions, RuleCondition, StoredMailRule
+from routes.gmail.rules import CompiledRules, RulePlan
+from tools.aho_corasick import AhoCorasick
+
+
+def test_aho_corasick_overlapping_patterns():
+    automaton = AhoCorasick()
+    for pattern in ("he", "she", "his", "hers"):
+        automaton.add(pattern, pattern)
+    automaton.build()
+    assert sorted(automaton.iter_matches("ushers")) == ["he", "hers", "she"]
+    assert automaton.search("history") == {"his"}
+    assert automaton.search("xyz") == set()
+
+
+def test_aho_corasick_matches_naive_search():
+    rng = random.Random(7)
+    patterns = {"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(40)}
+    automaton = AhoCorasick()
+    for pattern in patterns:
+        automaton.add(pattern, pattern)
+    automaton.build()
+    for _ in range(200):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+        assert automaton.search(text) == {p for p in patterns if p in text}
+
+
+def test_aho_corasick_requires_build_and_patterns():
+    automaton = AhoCorasick()
+    with pytest.raises(ValueError):
+        automaton.add("", 1)
+    automaton.add("a", 1)
+    with pytest.raises(RuntimeError):
+        automaton.search("a")
+
+
+def _rule(rule_id, *conditions, enabled=True, **actions):
+    return StoredMailRule(id=rule_id, name=rule_id, enabled=enabled,
+                          conditions=[RuleCondition(field=f, op=op, value=v) for f, op, v in conditions],
+                          actions=RuleActions(**actions))
+
+
+RULES = [
+    _rule("invoices", ("subject", "contains", "Invoice"), ("from", "contains", "billing@"),
+          add_labels=["Label_1"]),
+    _rule("boss", ("from", "equals", "Boss@Example.com"), add_labels=["STARRED"]),
+    _rule("tickets", ("subject", "regex", r"^\[TICKET-\d+\]"), archive=True),
+    _rule("ticket-alerts", ("subject", "contains", "alert"), ("subject", "regex", r"TICKET-\d+"),
+          mark_read=True),
+    _rule("disabled", ("subject", "contains", "invoice"), enabled=False, add_labels=["Label_2"]),
+]
+
+
+@pytest.mark.parametrize("message, expected", [
+    ({"from": "billing@shop.com", "subject": "Your INVOICE #42"}, ["invoices"]),
+    ({"from": "news@shop.com", "subject": "Your invoice"}, []),
+    ({"from": " boss@example.com ", "subject": "hi"}, ["boss"]),
+    ({"from": "boss@example.com.evil", "subject": "hi"}, []),
+    ({"from": "jira@corp", "subject": "[TICKET-12] Alert: disk full"}, ["tickets", "ticket-alerts"]),
+    ({"from": "jira@corp", "subject": "alert without ticket"}, []),
+    ({"subject": None}, []),
+])
+def test_compiled_rules_match(message, expected):
+    compiled = CompiledRules(RULES)
+    assert [compiled.rules[i].id for i in compiled.match(message)] == expected
+
+
+def test_plan_groups_changes_and_skips_labels_in_place():
+    compiled = CompiledRules(RULES)
+    plan = RulePlan()
+    plan.add(compiled, [
+        {"id": "1", "from": "billing@shop.com", "subject": "invoice", "labelIds": ["INBOX"]},
+        {"id": "2", "from": "billing@shop.com", "subject": "invoice"},
+        {"id": "3", "from": "billing@shop.com", "subject": "invoice", "labelIds": ["Label_1"]},
+        {"id": "4", "from": "jira@corp", "subject": "[TICKET-1] alert", "labelIds": ["INBOX"]},
+    ])
+    assert plan.evaluated == 4
+    assert plan.groups == {(("Label_1",), ()): ["1", "2"], ((), ("INBOX",)): ["4"]}
+    assert plan.matches == {"invoices": 3, "tickets": 1, "ticket-alerts": 1}
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import timedelta
+
+from benchmarks.fake_mongo import FakeDatabase
+from routes.gmail.repo import GmailRepo
+from routes.gmail.scheduler import SyncScheduler
+from tools.time_utils import utcnow
+
+
+def _scheduler(repo, job, **kwargs):
+    return SyncScheduler(job=job, repo=repo, concurrency=1, interval=300, jitter=0, lease=60, **kwargs)
+
+
+def test_only_due_users_are_claimed_once():
+    repo = GmailRepo(FakeDatabase())
+    ran = []
+
+    async def job(user_id):
+        ran.append(user_id)
+
+    async def run():
+        now = utcnow()
+        await repo.schedule_users({"late": now - timedelta(seconds=30), "due": now,
+                                   "later": now + timedelta(seconds=60)}, now)
+        scheduler = _scheduler(repo, job)
+        while await scheduler._run_next():
+            pass
+        return await repo.get_schedule("due"), await repo.get_schedule("later")
+
+    done, later = asyncio.run(run())
+    assert ran == ["late", "due"]
+    assert done["runs"] == 1 and done["last_error"] is None and not done["running"]
+    assert done["next_run"] > utcnow() + timedelta(seconds=200)
+    assert later["runs"] == 0
+
+
+def test_failed_run_is_recorded_and_rescheduled():
+    repo = GmailRepo(FakeDatabase())
+
+    async def job(user_id):
+        raise RuntimeError("token revoked")
+
+    async def run():
+        await repo.schedule_users({"u": utcnow()}, utcnow())
+        scheduler = _scheduler(repo, job)
+        assert await scheduler._run_next()
+        return await scheduler.user_status("u"), await scheduler.summary()
+
+    status, summary = asyncio.run(run())
+    assert status["failures"] == 1 and status["last_error"] == "token revoked"
+    assert summary["users"] == 1 and summary["failing"] == 1 and summary["due"] == 0
+
+
+def test_claimed_user_is_leased_until_expiry():
+    repo = GmailRepo(FakeDatabase())
+
+    async def run():
+        now = utcnow()
+        await repo.schedule_users({"u": now}, now)
+        first = await repo.claim_due_user(now, now + timedelta(seconds=60), "a")
+        second = await repo.claim_due_user(now, now + timedelta(seconds=60), "b")
+        # the first process died: after the lease the user is due again
+        later = now + timedelta(seconds=61)
+        third = await repo.claim_due_user(later, later + timedelta(seconds=60), "c")
+        stale = await repo.update_scheduled_run("u", "a", {"running": False})
+        return first, second, third, stale
+
+    first, second, third, stale = asyncio.run(run())
+    assert first["user_id"] == "u" and second is None and third["claim"] == "c"
+    assert not stale
+
+
+def test_existing_users_are_enrolled_once():
+    db = FakeDatabase()
+    repo = GmailRepo(db)
+
+    async def run():
+        for user_id in ("a", "b"):
+            await db.get_collection("gmail_credentials").update_one({"user_id": user_id}, {"$set": {"token": "t"}},
+                                                                   upsert=True)
+        await repo.schedule_users({"a": utcnow() - timedelta(days=1)}, utcnow())
+        scheduler = _scheduler(repo, None)
+        await scheduler._enroll_existing()
+        return await repo.get_schedule("a"), await repo.get_schedule("b")
+
+    a, b = asyncio.run(run())
+    assert a["next_run"] < utcnow()
+    assert utcnow() <= b["next_run"] <= utcnow() + timedelta(seconds=300)
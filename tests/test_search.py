@@ -0,0 +1,60 @@
+import asyncio
+
+from benchmarks.fake_mongo import FakeDatabase
+from routes.gmail.repo import GmailRepo
+from routes.gmail import search
+from routes.gmail.search import SearchIndex
+
+
+def _email(message_id, subject, **fields):
+    return {"id": message_id, "from": "ann@example.com", "subject": subject, "snippet": "", **fields}
+
+
+def test_listing_keeps_stored_internal_date():
+    index = SearchIndex(GmailRepo(FakeDatabase()))
+
+    async def run():
+        await index.index("u", [_email("m1", "quarterly report", internalDate=1700)])
+        # a listing result carries no internalDate
+        await index.index("u", [_email("m1", "quarterly report")])
+        return await index.search("u", "report")
+
+    [doc] = asyncio.run(run())
+    assert doc["internalDate"] == 1700
+
+
+def test_prune_drops_docs_of_older_generations():
+    index = SearchIndex(GmailRepo(FakeDatabase()))
+
+    async def run():
+        await index.index("u", [_email("old", "report", sync_generation="g1"),
+                                _email("kept", "report", sync_generation="g2")])
+        await index.prune("u", "g2")
+        return await index.search("u", "report")
+
+    assert [doc["id"] for doc in asyncio.run(run())] == ["kept"]
+
+
+def test_listed_docs_without_internal_date_are_not_dropped(monkeypatch):
+    monkeypatch.setattr(search, "MAX_CANDIDATES", 2)
+    index = SearchIndex(GmailRepo(FakeDatabase()))
+
+    async def run():
+        await index.index("u", [_email(f"m{i}", "report", internalDate=1000 + i) for i in range(2)])
+        # listed later and never mirrored
+        await index.index("u", [_email("listed", "report")])
+        return await index.search("u", "report")
+
+    assert [doc["id"] for doc in asyncio.run(run())] == ["listed", "m1"]
+
+
+def test_exact_matches_beat_newer_prefix_matches(monkeypatch):
+    monkeypatch.setattr(search, "MAX_CANDIDATES", 2)
+    index = SearchIndex(GmailRepo(FakeDatabase()))
+
+    async def run():
+        await index.index("u", [_email("old", "report", internalDate=1)])
+        await index.index("u", [_email(f"new{i}", "reports", internalDate=1000 + i) for i in range(3)])
+        return await index.search("u", "report")
+
+    assert [doc["id"] for doc in asyncio.run(run())] == ["old", "new2"]
@@ -0,0 +1,87 @@
+import asyncio
+
+from benchmarks.fake_mongo import FakeDatabase
+from routes.gmail.errors import GmailApiError
+from routes.gmail.repo import GmailRepo
+from routes.gmail.search import SearchIndex
+from routes.gmail.sync import MailboxSync
+
+
+class FakeClient:
+    def __init__(self, ids, failing=(), gone=()):
+        self.ids = list(ids)
+        self.failing = set(failing)
+        self.gone = set(gone)
+        self.calls = []
+
+    async def get_profile(self):
+        return {"historyId": "100"}
+
+    async def list_messages(self, **params):
+        self.calls.append("list")
+        return {"messages": [{"id": message_id} for message_id in self.ids]}
+
+    async def get_messages(self, message_ids, **params):
+        results = []
+        for message_id in message_ids:
+            if message_id in self.failing:
+                results.append(GmailApiError(503, "backendError"))
+            elif message_id in self.gone:
+                results.append(GmailApiError(404, "notFound"))
+            else:
+                results.append({"id": message_id, "internalDate": "1", "labelIds": ["INBOX"],
+                                "snippet": "", "payload": {"headers": [{"name": "Subject", "value": "report"}]}})
+        return results
+
+    async def list_history(self, **params):
+        self.calls.append("history")
+        await asyncio.sleep(0.01)
+        return {"history": [], "historyId": params["startHistoryId"]}
+
+
+def test_full_sync_keeps_messages_whose_fetch_failed():
+    repo = GmailRepo(FakeDatabase())
+    search = SearchIndex(repo)
+    client = FakeClient(["m1", "m2", "m3"])
+
+    async def get_client(user_id):
+        return client
+
+    sync = MailboxSync(repo, get_client, search=search)
+
+    async def run():
+        await sync.sync("u", full=True)
+        client.failing = {"m2"}
+        client.gone = {"m3"}
+        result = await sync.sync("u", full=True)
+        messages = await repo.list_messages("u", limit=10)
+        return result, messages, await search.search("u", "report")
+
+    result, messages, found = asyncio.run(run())
+    assert result["failed"] == 1
+    assert sorted(m["id"] for m in messages) == ["m1", "m2"]
+    assert sorted(doc["id"] for doc in found) == ["m1", "m2"]
+
+
+def test_full_sync_requested_during_delta_runs_after_it():
+    repo = GmailRepo(FakeDatabase())
+    client = FakeClient(["m1"])
+
+    async def get_client(user_id):
+        return client
+
+    sync = MailboxSync(repo, get_client)
+
+    async def run():
+        await repo.save_sync_state("u", {"history_id": "90", "synced_at": None})
+        delta = sync.sync("u")
+        full = sync.sync("u", full=True)
+        assert full is not delta
+        # later callers join the queued full sync
+        assert sync.sync("u") is full
+        return await delta, await full
+
+    delta, full = asyncio.run(run())
+    assert delta["mode"] == "delta" and full["mode"] == "full"
+    assert client.calls == ["history", "list"]
+    assert sync._running == {}
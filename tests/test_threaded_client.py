@@ -0,0 +1,47 @@
+import asyncio
+
+import httplib2
+import pytest
+
+from routes.gmail.errors import GmailApiError, is_retryable
+from routes.gmail.threaded_client import ThreadedGmailClient, _execute
+
+
+class _Request:
+    def __init__(self, error: Exception):
+        self._error = error
+
+    def execute(self):
+        raise self._error
+
+
+@pytest.mark.parametrize("error", [BrokenPipeError(32, "Broken pipe"), ConnectionResetError(),
+                                   TimeoutError("timed out"), httplib2.ServerNotFoundError("no host")])
+def test_transport_errors_become_retryable(error):
+    with pytest.raises(GmailApiError) as raised:
+        _execute(_Request(error))
+    assert raised.value.status == 0
+    assert raised.value.reason == type(error).__name__
+    assert is_retryable(raised.value)
+
+
+class _Messages:
+    def list(self, **params):
+        return _Request(BrokenPipeError(32, "Broken pipe"))
+
+
+class _Users:
+    def messages(self):
+        return _Messages()
+
+
+class _Service:
+    def users(self):
+        return _Users()
+
+
+def test_client_call_raises_gmail_api_error():
+    client = ThreadedGmailClient(_Service())
+    with pytest.raises(GmailApiError) as raised:
+        asyncio.run(client.list_messages(maxResults=10))
+    assert raised.value.reason == "BrokenPipeError"
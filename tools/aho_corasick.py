@@ -0,0 +1,74 @@
+"""Aho-Corasick automaton for finding many literal patterns in one pass over a text.
+
+Matching costs O(len(text) + matches) no matter how many patterns were added, which is what
+makes evaluating thousands of "contains" rules per message cheap.
+"""
+from collections import deque
+from typing import Dict, Generic, Hashable, Iterator, List, Set, TypeVar
+
+V = TypeVar("V", bound=Hashable)
+
+
+class AhoCorasick(Generic[V]):
+    """Add (pattern, value) pairs, call `build()`, then `search(text)` for the matched values."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # values of patterns ending at a state, including those reached through failure links
+        self._out: List[List[V]] = [[]]
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def add(self, pattern: str, value: V) -> None:
+        if not pattern:
+            raise ValueError("Empty patterns are not supported")
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(value)
+        self._built = False
+
+    def build(self) -> "AhoCorasick[V]":
+        """Compute failure links (breadth first); required after the last `add`."""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[V]:
+        """Yield the value of every pattern occurrence in `text` (a value may repeat)."""
+        if not self._built:
+            raise RuntimeError("build() must be called before searching")
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                yield from out[state]
+
+    def search(self, text: str) -> Set[V]:
+        """Return the distinct values of all patterns occurring in `text`."""
+        return set(self.iter_matches(text))
@@ -0,0 +1,193 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+# decode base64 in slices of this many characters (a multiple of 4)
+_DECODE_CHUNK = 4 * 256 * 1024
+
+
+class AttachmentCache:
+    """On-disk, content-addressed cache of decoded attachments.
+
+    Blobs are stored once per SHA-256 of their content under `blobs/`; `index/` maps a lookup
+    key (user, message, attachment) to a blob, so the same file received in many messages is
+    kept only once. When the total blob size exceeds `max_bytes`, the least recently used
+    blobs and the index entries pointing to them are deleted. Blob sizes, recency and the
+    blob -> index entries map are kept in memory (read from disk on first use), so eviction
+    only touches the evicted files. A file returned with `pin=True` is not evicted until it
+    is passed to `release`. All methods but `release` (a counter update) are blocking and meant
+    to run in a worker thread.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self._root = Path(root)
+        self._blobs = self._root / "blobs"
+        self._index = self._root / "index"
+        self._tmp = self._root / "tmp"
+        for directory in (self._blobs, self._index, self._tmp):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # digest -> size, least recently used first; None until loaded from disk
+        self._lru: Optional["OrderedDict[str, int]"] = None
+        self._entries: Dict[str, Set[str]] = defaultdict(set)  # digest -> index entry names
+        self._pins: Dict[str, int] = {}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _index_path(self, key: str) -> Path:
+        return self._index / hashlib.sha256(key.encode()).hexdigest()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs / digest[:2] / digest
+
+    def _load(self) -> None:
+        """Build the in-memory state from disk (once; called with the lock held)."""
+        if self._lru is not None:
+            return
+        blobs = []
+        for path in self._blobs.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            # mtime doubles as the LRU clock across restarts
+            blobs.append((stat.st_mtime, path.name, stat.st_size))
+        self._lru = OrderedDict((digest, size) for _, digest, size in sorted(blobs))
+        self._size = sum(self._lru.values())
+        for entry_path in self._index.iterdir():
+            try:
+                digest = json.loads(entry_path.read_text())["sha256"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if digest in self._lru:
+                self._entries[digest].add(entry_path.name)
+            else:
+                entry_path.unlink(missing_ok=True)
+
+    def _touch(self, digest: str, size: int, entry_name: str, pin: bool) -> None:
+        if digest not in self._lru:
+            self._lru[digest] = size
+            self._size += size
+        self._lru.move_to_end(digest)
+        self._entries[digest].add(entry_name)
+        if pin:
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+
+    def _forget(self, digest: str) -> None:
+        """Drop a blob that is gone from disk, and the index entries pointing to it."""
+        size = self._lru.pop(digest, None)
+        if size is not None:
+            self._size -= size
+        for name in self._entries.pop(digest, ()):
+            (self._index / name).unlink(missing_ok=True)
+
+    def lookup(self, key: str, pin: bool = False) -> Optional[Path]:
+        """Return the cached file for `key`, or None on a miss."""
+        entry_path = self._index_path(key)
+        try:
+            digest = json.loads(entry_path.read_text())["sha256"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        path = self._blob_path(digest)
+        with self._lock:
+            self._load()
+            try:
+                os.utime(path)
+                size = path.stat().st_size
+            except OSError:
+                # evicted by another process sharing the directory
+                self._forget(digest)
+                entry_path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+            self._touch(digest, size, entry_path.name, pin)
+        self.hits += 1
+        return path
+
+    def store(self, key: str, data_b64url: str, pin: bool = False) -> Path:
+        """Decode Gmail's base64url attachment data to disk and index it under `key`."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for start in range(0, len(data_b64url), _DECODE_CHUNK):
+                    chunk = data_b64url[start:start + _DECODE_CHUNK]
+                    if start + _DECODE_CHUNK >= len(data_b64url):
+                        chunk += "=" * (-len(chunk) % 4)
+                    decoded = base64.urlsafe_b64decode(chunk)
+                    digest.update(decoded)
+                    out.write(decoded)
+                    size += len(decoded)
+
+            path = self._blob_path(digest.hexdigest())
+            path.parent.mkdir(exist_ok=True)
+            with self._lock:
+                self._load()
+                if path.exists():
+                    os.unlink(tmp_name)
+                    os.utime(path)
+                else:
+                    os.replace(tmp_name, path)
+                self._write_index(key, digest.hexdigest(), size)
+                self._touch(digest.hexdigest(), size, self._index_path(key).name, pin)
+                self._evict()
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return path
+
+    def _write_index(self, key: str, digest: str, size: int) -> None:
+        fd, index_tmp = tempfile.mkstemp(dir=self._tmp, suffix=".idx")
+        try:
+            with os.fdopen(fd, "w") as out:
+                out.write(json.dumps({"sha256": digest, "size": size}))
+            os.replace(index_tmp, self._index_path(key))
+        except BaseException:
+            if os.path.exists(index_tmp):
+                os.unlink(index_tmp)
+            raise
+
+    def release(self, path: Path) -> None:
+        """Unpin a file returned with `pin=True`; the next store may evict it."""
+        with self._lock:
+            digest = path.name
+            count = self._pins.get(digest, 0) - 1
+            if count > 0:
+                self._pins[digest] = count
+            else:
+                self._pins.pop(digest, None)
+
+    def _evict(self) -> None:
+        # called with the lock held
+        if self._size <= self._max_bytes:
+            return
+        excess = self._size - self._max_bytes
+        victims = []
+        # oldest first; keep the newest blob even if it alone exceeds the budget
+        for digest, size in self._lru.items():
+            if excess <= 0 or len(self._lru) - len(victims) <= 1:
+                break
+            if self._pins.get(digest):
+                continue
+            victims.append(digest)
+            excess -= size
+        for digest in victims:
+            self._blob_path(digest).unlink(missing_ok=True)
+            self._forget(digest)
+            self.evictions += 1
+
+    def stats(self):
+        return {"bytes": self._size if self._lru is not None else None, "max_bytes": self._max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "pinned": len(self._pins)}
@@ -0,0 +1,200 @@
+"""Dedicated, bounded thread pools for blocking Google calls.
+
+`run_blocking` is a drop-in for `asyncio.to_thread` (context variables are propagated), but
+runs on one of two lanes instead of the shared default executor:
+
+- "interactive" (the default) serves request handlers. When its workers and queue are full,
+  calls fail fast with ExecutorSaturated (a 503 with Retry-After) instead of queueing.
+- "background" serves scheduler and push-driven syncs. When full, callers wait for a slot, so
+  background load can never take interactive threads.
+
+Inside `user_scope(user_id)` a user has at most `settings.GOOGLE_EXECUTOR_PER_USER` calls in
+flight; further calls from that user wait for one of its own slots, not the lane's.
+With metrics enabled, pending and active calls and wait and run times are reported per lane.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from config.settings import settings
+from tools import metrics
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+EXECUTOR_PENDING = metrics.Gauge("executor_pending_tasks", "Blocking calls waiting for a worker thread", ["lane"])
+EXECUTOR_ACTIVE = metrics.Gauge("executor_active_tasks", "Blocking calls running in a worker thread", ["lane"])
+EXECUTOR_WAIT_SECONDS = metrics.Histogram("executor_wait_seconds", "Time blocking calls waited for a worker thread",
+                                          ["lane"])
+EXECUTOR_RUN_SECONDS = metrics.Histogram("executor_run_seconds", "Time blocking calls ran in a worker thread",
+                                         ["lane"])
+EXECUTOR_REJECTED = metrics.Counter("executor_rejected", "Blocking calls rejected because the lane was full",
+                                    ["lane"])
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("executor_lane", default=INTERACTIVE)
+_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("executor_user", default=None)
+
+
+class ExecutorSaturated(Exception):
+    """The interactive lane has no free worker or queue slot; retry after `retry_after` seconds."""
+
+    def __init__(self, lane: str, retry_after: float):
+        super().__init__(f"The {lane} executor is saturated")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def lane(name: str) -> Iterator[None]:
+    """Run blocking calls made in this block (and tasks created from it) on lane `name`."""
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextlib.contextmanager
+def user_scope(user_id: str) -> Iterator[None]:
+    """Count blocking calls made in this block against `user_id`'s in-flight cap."""
+    token = _user.set(user_id)
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+class _Lane:
+    def __init__(self, name: str, workers: int, queue_size: int, wait_when_full: bool):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.wait_when_full = wait_when_full
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"google-{name}")
+        self.slots = asyncio.Semaphore(self.capacity)
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+
+
+class BoundedExecutor:
+    def __init__(self):
+        queue_size = settings.GOOGLE_EXECUTOR_QUEUE_SIZE
+        self._lanes = {
+            INTERACTIVE: _Lane(INTERACTIVE, settings.GOOGLE_EXECUTOR_INTERACTIVE_WORKERS, queue_size, False),
+            BACKGROUND: _Lane(BACKGROUND, settings.GOOGLE_EXECUTOR_BACKGROUND_WORKERS, queue_size, True),
+        }
+        self._per_user = settings.GOOGLE_EXECUTOR_PER_USER
+        self._retry_after = settings.GOOGLE_EXECUTOR_RETRY_AFTER
+        # user_id -> [semaphore, callers holding or waiting]; dropped when the last caller leaves
+        self._users: Dict[str, List[Any]] = {}
+
+    @contextlib.asynccontextmanager
+    async def _user_slot(self, user_id: Optional[str]):
+        if user_id is None or self._per_user <= 0:
+            yield
+            return
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [asyncio.Semaphore(self._per_user), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._users.pop(user_id, None)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        lane_ = self._lanes[_lane.get()]
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        async with self._user_slot(_user.get()):
+            if lane_.in_flight >= lane_.capacity and not lane_.wait_when_full:
+                lane_.rejected += 1
+                EXECUTOR_REJECTED.inc(lane=lane_.name)
+                raise ExecutorSaturated(lane_.name, self._retry_after)
+            async with lane_.slots:
+                lane_.in_flight += 1
+                try:
+                    return await self._submit(lane_, call)
+                finally:
+                    lane_.in_flight -= 1
+                    lane_.completed += 1
+
+    @staticmethod
+    async def _submit(lane_: _Lane, call: Callable[[], T]) -> T:
+        loop = asyncio.get_running_loop()
+        if not metrics.ENABLED:
+            return await loop.run_in_executor(lane_.pool, call)
+
+        submitted = time.perf_counter()
+        claimed = threading.Lock()
+        EXECUTOR_PENDING.inc(lane=lane_.name)
+
+        def _run():
+            # whoever takes the lock first (this worker or a cancellation) settles the pending count
+            if claimed.acquire(blocking=False):
+                EXECUTOR_PENDING.dec(lane=lane_.name)
+            started = time.perf_counter()
+            EXECUTOR_WAIT_SECONDS.observe(started - submitted, lane=lane_.name)
+            EXECUTOR_ACTIVE.inc(lane=lane_.name)
+            try:
+                return call()
+            finally:
+                EXECUTOR_ACTIVE.dec(lane=lane_.name)
+                EXECUTOR_RUN_SECONDS.observe(time.perf_counter() - started, lane=lane_.name)
+
+        try:
+            return await loop.run_in_executor(lane_.pool, _run)
+        finally:
+            if claimed.acquire(blocking=False):
+                EXECUTOR_PENDING.dec(lane=lane_.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lanes": {
+                name: {"workers": l.workers, "capacity": l.capacity, "in_flight": l.in_flight,
+                       "completed": l.completed, "rejected": l.rejected}
+                for name, l in self._lanes.items()
+            },
+            "per_user_cap": self._per_user,
+            "users_in_flight": len(self._users),
+        }
+
+    def shutdown(self) -> None:
+        for lane_ in self._lanes.values():
+            lane_.pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[BoundedExecutor] = None
+
+
+def get_executor() -> BoundedExecutor:
+    global _executor
+    if _executor is None:
+        _executor = BoundedExecutor()
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run `func(*args, **kwargs)` on the current lane's thread pool and return its result."""
+    return await get_executor().run(func, *args, **kwargs)
@@ -0,0 +1,94 @@
+"""Trimmed Gmail v1 discovery document bundled with the service.
+
+`tools/discovery/gmail.v1.json` keeps only the resources the clients call and the schemas
+they reference, without descriptions, so it parses in a fraction of the time of the full
+document and no network fetch or googleapiclient data lookup happens on the first request.
+
+Regenerate it after upgrading google-api-python-client (or to add a resource to KEEP):
+
+    python -m tools.gmail_discovery
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Set
+
+BUNDLED_PATH = Path(__file__).parent / "discovery" / "gmail.v1.json"
+
+# resource path -> kept methods ("*" keeps all); sub-resources must be listed separately
+KEEP = {
+    "users": {"getProfile", "watch", "stop"},
+    "users.messages": "*",
+    "users.messages.attachments": "*",
+    "users.history": "*",
+    "users.labels": "*",
+    "users.threads": "*",
+}
+DROPPED_KEYS = {"description", "enumDescriptions", "icons", "documentationLink", "ownerDomain", "ownerName"}
+
+
+def _strip(value: Any) -> Any:
+    if isinstance(value, dict):
+        # only string values: a schema may have a *property* named "description"
+        return {k: _strip(v) for k, v in value.items() if not (k in DROPPED_KEYS and not isinstance(v, dict))}
+    if isinstance(value, list):
+        return [_strip(v) for v in value]
+    return value
+
+
+def _refs(value: Any, found: Set[str]) -> Set[str]:
+    if isinstance(value, dict):
+        if "$ref" in value:
+            found.add(value["$ref"])
+        for v in value.values():
+            _refs(v, found)
+    elif isinstance(value, list):
+        for v in value:
+            _refs(v, found)
+    return found
+
+
+def _trim_resource(resource: Dict[str, Any], path: str) -> Dict[str, Any]:
+    methods = KEEP[path]
+    trimmed = {k: v for k, v in resource.items() if k not in ("methods", "resources")}
+    trimmed["methods"] = {name: m for name, m in resource.get("methods", {}).items()
+                          if methods == "*" or name in methods}
+    children = {name: _trim_resource(child, f"{path}.{name}")
+                for name, child in resource.get("resources", {}).items() if f"{path}.{name}" in KEEP}
+    if children:
+        trimmed["resources"] = children
+    return trimmed
+
+
+def trim(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Return `doc` reduced to the KEEP resources, their schemas (transitively) and no docs."""
+    trimmed = {k: v for k, v in doc.items() if k not in DROPPED_KEYS | {"resources", "schemas"}}
+    trimmed["resources"] = {name: _trim_resource(r, name) for name, r in doc["resources"].items() if name in KEEP}
+
+    schemas = doc.get("schemas", {})
+    needed: Set[str] = set()
+    pending = _refs(trimmed["resources"], set())
+    while pending:
+        name = pending.pop()
+        if name in needed or name not in schemas:
+            continue
+        needed.add(name)
+        pending |= _refs(schemas[name], set()) - needed
+    trimmed["schemas"] = {name: schemas[name] for name in sorted(needed)}
+    return _strip(trimmed)
+
+
+def load_bundled() -> Dict[str, Any]:
+    return json.loads(BUNDLED_PATH.read_text())
+
+
+def main() -> None:
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = trim(json.loads(get_static_doc("gmail", "v1")))
+    BUNDLED_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BUNDLED_PATH.write_text(json.dumps(doc, separators=(",", ":"), sort_keys=True))
+    print(f"Wrote {BUNDLED_PATH} ({BUNDLED_PATH.stat().st_size} bytes, revision {doc.get('revision')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,60 @@
 import json
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Tuple
 
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
+from config.settings import settings
+from tools.gmail_discovery import load_bundled
 
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import Flow
 
-def create_flow(client_secrets_file: str, scopes: Any, redirect_uri: str) -> Flow:
+
+_client_secrets: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_client_secrets_lock = threading.Lock()
+
+
+def load_client_secrets(client_secrets_file: str) -> Dict[str, Any]:
+    """Return the parsed client secrets file.
+
+    The parsed config is kept in memory and only re-read when the file's modification time
+    changes, so logins do not parse the file on every request.
+    """
+    path = Path(client_secrets_file)
+    mtime = path.stat().st_mtime_ns
+    cached = _client_secrets.get(client_secrets_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _client_secrets_lock:
+        cached = _client_secrets.get(client_secrets_file)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, json.loads(path.read_text()))
+            _client_secrets[client_secrets_file] = cached
+    return cached[1]
+
+
+def create_flow(client_secrets_file: str, scopes: Any, redirect_uri: str) -> "Flow":
     """Create an OAuth Flow for the given client secrets, scopes and redirect URI.
 
-    Tries to use the 'web' section in client_secrets if present, otherwise
-    falls back to the helper that reads the file.
+    Uses the cached client config; falls back to the helper that reads the file if it cannot
+    be loaded, so the library reports the underlying error.
     """
+    from google_auth_oauthlib.flow import Flow
+
     try:
-        cs_path = Path(client_secrets_file)
-        if cs_path.exists():
-            data = json.loads(cs_path.read_text())
-            if 'web' in data:
-                return Flow.from_client_config(data, scopes=scopes, redirect_uri=redirect_uri)
-    except Exception:
-        # If parsing fails, fallback to from_client_secrets_file below
-        pass
+        data = load_client_secrets(client_secrets_file)
+    except (OSError, ValueError):
+        return Flow.from_client_secrets_file(client_secrets_file, scopes=scopes, redirect_uri=redirect_uri)
+
+    return Flow.from_client_config(data, scopes=scopes, redirect_uri=redirect_uri)
 
-    return Flow.from_client_secrets_file(client_secrets_file, scopes=scopes, redirect_uri=redirect_uri)
+
+def load_client_config(client_secrets_file: str) -> Dict[str, Any]:
+    """Return the 'web' (or 'installed') section of the client secrets file."""
+    data = load_client_secrets(client_secrets_file)
+    return data.get('web') or data.get('installed') or {}
 
 
 def build_authorization_url(client_secrets_file: str, scopes: Any, redirect_uri: str) -> Tuple[str, str]:
@@ -31,8 +63,57 @@ def build_authorization_url(client_secrets_file: str, scopes: Any, redirect_uri:
     return flow.authorization_url(access_type='offline', include_granted_scopes='true', prompt='consent')
 
 
-def exchange_code_for_credentials(client_secrets_file: str, code: str, scopes: Any, redirect_uri: str) -> Credentials:
+def exchange_code_for_credentials(client_secrets_file: str, code: str, scopes: Any, redirect_uri: str) -> "Credentials":
     """Exchange authorization code for Credentials object."""
     flow = create_flow(client_secrets_file, scopes, redirect_uri)
     flow.fetch_token(code=code)
     return flow.credentials
+
+
+@lru_cache(maxsize=1)
+def load_gmail_discovery() -> Dict[str, Any]:
+    """Return the parsed Gmail v1 discovery document, loaded once per process.
+
+    Uses the trimmed copy bundled in tools/discovery, falling back to the full static copy
+    shipped with google-api-python-client; neither needs a network fetch.
+    `settings.GMAIL_API_ROOT` replaces the root URL, e.g. to target a local fake Gmail server.
+    """
+    try:
+        discovery = load_bundled()
+    except (OSError, ValueError):
+        from googleapiclient.discovery_cache import get_static_doc
+
+        doc = get_static_doc('gmail', 'v1')
+        if doc is None:
+            raise RuntimeError("Gmail discovery document not available in googleapiclient")
+        discovery = json.loads(doc)
+    root_url = settings.GMAIL_API_ROOT.rstrip('/') + '/'
+    discovery['rootUrl'] = root_url
+    discovery['baseUrl'] = root_url + discovery.get('servicePath', '')
+    return discovery
+
+
+def build_gmail_service(credentials: "Credentials"):
+    """Build a Gmail API client from the cached discovery document.
+
+    The returned client is safe to share between worker threads: every request is bound to
+    an authorized httplib2 connection owned by the calling thread.
+    """
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import HttpRequest
+
+    local = threading.local()
+
+    def _thread_http():
+        http = getattr(local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+            local.http = http
+        return http
+
+    def _request_builder(http, *args, **kwargs):
+        return HttpRequest(_thread_http(), *args, **kwargs)
+
+    return build_from_document(load_gmail_discovery(), http=_thread_http(), requestBuilder=_request_builder)
@@ -0,0 +1,91 @@
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from google.auth import transport
+from google.auth.transport import requests as auth_requests
+from google.oauth2 import id_token as google_id_token
+
+from config.settings import settings
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def _max_age(headers) -> int:
+    # requests' headers are case-insensitive
+    match = _MAX_AGE.search(headers.get("cache-control", "") if headers else "")
+    return int(match.group(1)) if match else 0
+
+
+class CachingRequest(transport.Request):
+    """google-auth transport over a pooled requests.Session that caches GET responses.
+
+    Used for Google's signing certificates: a successful response is kept for the
+    Cache-Control max-age it was served with, and concurrent misses for the same URL wait for
+    a single download.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None):
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.GOOGLE_HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self._request = auth_requests.Request(session=session)
+        self._cache: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, url: str):
+        entry = self._cache.get(url)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET" or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        response = self._cached(url)
+        if response is not None:
+            return response
+        with self._lock:
+            response = self._cached(url)
+            if response is not None:
+                return response
+            self.misses += 1
+            response = self._request(url, method=method, headers=headers, timeout=timeout, **kwargs)
+            max_age = _max_age(response.headers)
+            if response.status == 200 and max_age:
+                response.data  # read the body now so the cached response can be replayed
+                self._cache[url] = (time.monotonic() + max_age, response)
+            return response
+
+
+_certs_request: Optional[CachingRequest] = None
+
+
+def certs_request() -> CachingRequest:
+    global _certs_request
+    if _certs_request is None:
+        _certs_request = CachingRequest()
+    return _certs_request
+
+
+def verify_google_id_token(token: str, audience: Optional[str]) -> Dict[str, Any]:
+    """Verify a Google-issued OpenID Connect id_token and return its claims.
+
+    Equivalent to `google.oauth2.id_token.verify_oauth2_token`, but certificates are fetched
+    through the shared caching transport (and from `settings.GOOGLE_OAUTH2_CERTS_URL`).
+    """
+    claims = google_id_token.verify_token(token, certs_request(), audience=audience,
+                                          certs_url=settings.GOOGLE_OAUTH2_CERTS_URL)
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer. 'iss' should be one of {GOOGLE_ISSUERS} but is {claims.get('iss')}")
+    return claims
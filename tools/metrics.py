@@ -0,0 +1,280 @@
+"""Minimal Prometheus-format metrics registry with optional OpenTelemetry spans.
+
+Instrumentation is off unless `settings.METRICS_ENABLED` is true: `timed` and `instrument`
+then return the function or class untouched and the route middleware is not installed, so
+disabled instrumentation adds no per-call work. With `settings.METRICS_TRACING` (and the
+opentelemetry API installed) timed calls are also recorded as spans.
+"""
+import contextlib
+import functools
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+
+ENABLED = settings.METRICS_ENABLED
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_tracer = None
+if ENABLED and settings.METRICS_TRACING:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("gmail-service")
+    except ImportError:
+        _tracer = None
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every labelled value of the metric."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self._values: Dict[Tuple[str, ...], float] = {}
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, k)} {v}" for k, v in values]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        self._values: Dict[Tuple[str, ...], float] = {}
+        super().__init__(*args, **kwargs)
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(k, list(counts), total[0]) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    """Return every registered metric in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Any]]:
+    """Open a tracing span when tracing is configured; otherwise do nothing."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def timed(histogram: Histogram, name: Optional[str] = None, **labels: Any) -> Callable:
+    """Decorator recording the duration of each call in `histogram` (and a span).
+
+    If the histogram has an `outcome` label it is set to "ok" or "error". Returns the
+    function unchanged when metrics are disabled.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if not ENABLED:
+            return func
+        span_name = name or func.__qualname__
+        with_outcome = "outcome" in histogram.labelnames
+
+        def _observe(started: float, outcome: str) -> None:
+            elapsed = time.perf_counter() - started
+            if with_outcome:
+                histogram.observe(elapsed, outcome=outcome, **labels)
+            else:
+                histogram.observe(elapsed, **labels)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    with span(span_name):
+                        result = await func(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    _observe(started, outcome)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                with span(span_name):
+                    result = func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                _observe(started, outcome)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(histogram: Histogram, **labels: Any) -> Callable[[type], type]:
+    """Class decorator timing every public coroutine method in `histogram`, labelled `method`."""
+
+    def decorator(cls: type) -> type:
+        if not ENABLED:
+            return cls
+        for attr, value in list(vars(cls).items()):
+            if not attr.startswith("_") and inspect.iscoroutinefunction(value):
+                setattr(cls, attr, timed(histogram, name=f"{cls.__name__}.{attr}", method=attr, **labels)(value))
+        return cls
+
+    return decorator
+
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Latency of HTTP requests by route",
+                                 ["method", "route", "status"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency; the label is the route template, not the path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            with span("http.request", method=scope["method"]) as current:
+                await self.app(scope, receive, _send)
+                if current is not None and scope.get("route") is not None:
+                    current.set_attribute("http.route", scope["route"].path)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route,
+                                         status=str(status))
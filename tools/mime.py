@@ -0,0 +1,150 @@
+import base64
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+
+SUMMARY_HEADERS = ("From", "To", "Cc", "Subject", "Date")
+
+
+def decode_base64url(data: str) -> bytes:
+    """Decode Gmail's unpadded base64url encoding."""
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _header(headers: List[Dict[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    for header in headers or []:
+        if header.get("name", "").lower() == name:
+            return header.get("value")
+    return None
+
+
+def _charset(headers: List[Dict[str, str]]) -> str:
+    content_type = _header(headers, "Content-Type") or ""
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "charset" and value:
+            return value.strip('"')
+    return "utf-8"
+
+
+def _decode_text(data: bytes, charset: str) -> str:
+    try:
+        return data.decode(charset, errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def _result(headers: Dict[str, str], texts: List[str], htmls: List[str], attachments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "headers": headers,
+        "text": "\n".join(texts) if texts else None,
+        "html": "\n".join(htmls) if htmls else None,
+        "attachments": attachments,
+    }
+
+
+def _is_text_body(part: Dict[str, Any]) -> bool:
+    """A text/plain or text/html part that is part of the message body rather than a file."""
+    disposition = (_header(part.get("headers") or [], "Content-Disposition") or "").lower()
+    return (part.get("mimeType") in ("text/plain", "text/html") and not part.get("filename")
+            and not disposition.startswith("attachment"))
+
+
+def deferred_body_ids(payload: Dict[str, Any]) -> List[str]:
+    """attachmentIds of text bodies Gmail did not inline (large parts); fetch them for `flatten_payload`."""
+    ids: List[str] = []
+
+    def _walk(part: Dict[str, Any]) -> None:
+        attachment_id = (part.get("body") or {}).get("attachmentId")
+        if attachment_id and _is_text_body(part):
+            ids.append(attachment_id)
+        for sub_part in part.get("parts") or []:
+            _walk(sub_part)
+
+    _walk(payload or {})
+    return ids
+
+
+def flatten_payload(payload: Dict[str, Any], bodies: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Flatten a Gmail `format='full'` payload tree into decoded bodies and attachment references.
+
+    text/plain and text/html bodies are base64url-decoded using their declared charset.
+    Gmail moves large bodies behind an attachmentId; `bodies` maps those ids (see
+    `deferred_body_ids`) to the fetched base64url data. Parts with a filename or an attachment
+    disposition, and other non-inline parts, are returned as lazy references (partId,
+    filename, mimeType, size, attachmentId) to be fetched through the attachments endpoint,
+    never inlined.
+    """
+    texts: List[str] = []
+    htmls: List[str] = []
+    attachments: List[Dict[str, Any]] = []
+    bodies = bodies or {}
+
+    def _walk(part: Dict[str, Any]) -> None:
+        mime_type = part.get("mimeType", "")
+        body = part.get("body") or {}
+        headers = part.get("headers") or []
+        attachment_id = body.get("attachmentId")
+        data = body.get("data") or bodies.get(attachment_id)
+
+        if _is_text_body(part) and (data or not attachment_id):
+            if data:
+                text = _decode_text(decode_base64url(data), _charset(headers))
+                (texts if mime_type == "text/plain" else htmls).append(text)
+        elif part.get("filename") or attachment_id or \
+                (_header(headers, "Content-Disposition") or "").lower().startswith("attachment"):
+            attachments.append({
+                "partId": part.get("partId"),
+                "filename": part.get("filename") or None,
+                "mimeType": mime_type,
+                "size": body.get("size", 0),
+                "attachmentId": body.get("attachmentId"),
+                "contentId": (_header(headers, "Content-ID") or "").strip("<>") or None,
+            })
+
+        for sub_part in part.get("parts") or []:
+            _walk(sub_part)
+
+    _walk(payload or {})
+    top_headers = (payload or {}).get("headers") or []
+    headers = {name: value for name in SUMMARY_HEADERS if (value := _header(top_headers, name)) is not None}
+    return _result(headers, texts, htmls, attachments)
+
+
+def parse_raw_message(raw: str) -> Dict[str, Any]:
+    """Parse a Gmail `format='raw'` message with the stdlib MIME parser.
+
+    Returns the same shape as `flatten_payload`. Raw messages carry no attachmentIds, so
+    attachment references hold the partId (numbered like Gmail's) and decoded size only.
+    """
+    message: EmailMessage = message_from_bytes(decode_base64url(raw), policy=policy.default)
+    texts: List[str] = []
+    htmls: List[str] = []
+    attachments: List[Dict[str, Any]] = []
+
+    def _walk(part: EmailMessage, part_id: str) -> None:
+        if part.is_multipart():
+            for index, sub_part in enumerate(part.iter_parts()):
+                _walk(sub_part, f"{part_id}.{index}" if part_id else str(index))
+            return
+
+        mime_type = part.get_content_type()
+        if part.get_filename() or part.is_attachment():
+            payload = part.get_payload(decode=True) or b""
+            attachments.append({
+                "partId": part_id,
+                "filename": part.get_filename(),
+                "mimeType": mime_type,
+                "size": len(payload),
+                "attachmentId": None,
+                "contentId": (part.get("Content-ID") or "").strip("<>") or None,
+            })
+        elif mime_type in ("text/plain", "text/html"):
+            payload = part.get_payload(decode=True) or b""
+            text = _decode_text(payload, part.get_content_charset() or "utf-8")
+            (texts if mime_type == "text/plain" else htmls).append(text)
+
+    _walk(message, "")
+    headers = {name: str(message[name]) for name in SUMMARY_HEADERS if message[name] is not None}
+    return _result(headers, texts, htmls, attachments)
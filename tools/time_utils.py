@@ -0,0 +1,6 @@
+from datetime import datetime, timezone
+
+
+def utcnow() -> datetime:
+    """Current UTC time as a naive datetime, matching google-auth and Motor's default decoding."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
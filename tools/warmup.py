@@ -0,0 +1,73 @@
+"""Per-worker warm-up run at startup, before the worker reports ready.
+
+Opens the Mongo pool's minimum connections, imports the Google libraries that modules defer
+importing (so `import main` stays cheap) and loads the Google data every request needs (client
+secrets, the Gmail discovery document, id_token signing certificates), so the first requests a
+fresh worker serves are not the slow ones.
+"""
+import asyncio
+import importlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from config.settings import settings
+from tools.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# imported lazily by the modules using them; the request path needs them, startup can pay for them
+GOOGLE_MODULES = {
+    "googleapiclient": ("google.oauth2.credentials", "google.auth.transport.requests",
+                        "googleapiclient.discovery", "googleapiclient.http", "google_auth_httplib2"),
+    "httpx": ("google.oauth2.credentials", "google.auth.transport.requests", "httpx"),
+}
+
+
+async def _timed(timings: Dict[str, Any], name: str, step: Callable[[], Awaitable[Any]], required: bool) -> None:
+    started = time.perf_counter()
+    try:
+        await step()
+    except Exception:
+        if required:
+            raise
+        # Google-side data is fetched again on first use; a failure here only costs latency
+        logger.warning("Warm-up step %s failed", name, exc_info=True)
+        timings[name] = None
+        return
+    timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def warm_up(db) -> Dict[str, Any]:
+    """Warm Mongo and Google dependencies; returns the duration of each step in ms (None = failed).
+
+    Raises if Mongo is unreachable, so a worker without a database never reports ready.
+    """
+    from routes.gmail.async_client import get_http_client
+    from tools.google_api import load_client_config, load_gmail_discovery
+    from tools.id_token import certs_request
+
+    async def _mongo():
+        # concurrent pings check out (and so open) up to the pool's minimum number of connections
+        await asyncio.gather(*(db.command("ping") for _ in range(max(1, settings.MONGO_MIN_POOL_SIZE))))
+
+    def _import_google():
+        for name in GOOGLE_MODULES.get(settings.GMAIL_BACKEND, ()):
+            importlib.import_module(name)
+
+    async def _gmail_client():
+        if settings.GMAIL_BACKEND == "httpx":
+            get_http_client()
+        else:
+            await run_blocking(load_gmail_discovery)
+
+    timings: Dict[str, Any] = {}
+    await _timed(timings, "mongo", _mongo, required=True)
+    await _timed(timings, "google_imports", lambda: run_blocking(_import_google), required=False)
+    await _timed(timings, "client_secrets",
+                 lambda: run_blocking(load_client_config, settings.CLIENT_SECRETS_FILE), required=False)
+    await _timed(timings, "gmail_client", _gmail_client, required=False)
+    await _timed(timings, "id_token_certs",
+                 lambda: run_blocking(certs_request(), settings.GOOGLE_OAUTH2_CERTS_URL), required=False)
+    logger.info("Worker warm-up finished: %s", timings)
+    return timings